@@ -2,6 +2,7 @@ from django.contrib import admin
 from .models import Book, Review
 from .models import UpcomingBook, Cart, CartItem
 from .models import Cart, CartItem 
+from .models import Job
 
 # Register your models here.
 
@@ -18,3 +19,9 @@ class BookAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'price', 'is_popular', 'is_upcoming')
     search_fields = ('title', 'author')
     list_filter = ('is_popular', 'is_upcoming')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'run_at', 'created_at', 'finished_at')
+    search_fields = ('task', 'idempotency_key')
+    list_filter = ('status', 'task')
@@ -0,0 +1,299 @@
+"""
+Read-only JSON API over the catalog.
+
+Books, a book's reviews and upcoming releases are exposed as keyset-paginated
+collections plus single-object endpoints. Every response carries a strong
+``ETag`` derived from row versions (``updated_at``, or ``created_at`` for
+reviews, which are never edited). Single objects also carry a
+``Last-Modified`` header. Collections do not, because a page changes when a
+row joins or leaves it without any remaining row's version moving. Their
+``ETag`` covers membership, so it is the only validator they honour.
+
+A request is answered in two steps. First only the primary keys and versions
+of the requested rows are read, which is enough to compute the validators.
+If the client's validator still matches, a
+304 is returned without loading or serializing anything else. Otherwise the
+requested fields are fetched with ``values()`` and returned as JSON.
+
+Query parameters:
+
+* ``fields``: comma-separated sparse fieldset, e.g. ``fields=id,title,price``.
+* ``sort``: one of the resource's orderings (collections only).
+* ``limit``: page size, capped at ``BOOKS_API_MAX_PAGE_SIZE``.
+* ``cursor``: the ``next_cursor`` of the previous page.
+"""
+import hashlib
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .models import Book, Review, UpcomingBook
+from .pagination import CursorEncoder, paginate
+
+
+@dataclass(frozen=True)
+class Resource:
+    """
+    How one model is exposed through the API.
+
+    Attributes:
+        model (type): The model to read.
+        fields (dict): API field name -> ``values()`` lookup, in output order.
+        version (str): A field that changes whenever the row does.
+        orderings (dict): ``sort`` value -> keyset ordering; the first entry
+            is the default.
+    """
+    model: type
+    fields: dict
+    version: str
+    orderings: dict
+
+
+def _same(names):
+    return {name: name for name in names}
+
+
+BOOKS = Resource(
+    model=Book,
+    fields=_same((
+        'id', 'isbn', 'title', 'author', 'description', 'price', 'release_date', 'cover_image',
+        'is_popular', 'is_upcoming', 'review_count', 'last_reviewed_at', 'updated_at',
+    )),
+    version='updated_at',
+    orderings={'id': ('id',), 'title': ('title', 'id'), 'price': ('price', 'id')},
+)
+
+REVIEWS = Resource(
+    model=Review,
+    fields={
+        'id': 'id', 'book_id': 'book_id', 'username': 'user__username',
+        'content': 'content', 'created_at': 'created_at',
+    },
+    version='created_at',
+    orderings={'newest': ('-created_at', '-id')},
+)
+
+UPCOMING = Resource(
+    model=UpcomingBook,
+    fields=_same((
+        'id', 'title', 'author', 'description', 'release_date', 'price', 'cover_image', 'book_id', 'updated_at',
+    )),
+    version='updated_at',
+    orderings={'release_date': ('release_date', 'id')},
+)
+
+# API field name -> function turning the stored value into its JSON value.
+CONVERTERS = {
+    'cover_image': lambda name: default_storage.url(name) if name else None,
+}
+
+
+def parse_fields(resource, raw):
+    """
+    Resolve a ``fields`` query parameter against a resource.
+
+    Args:
+        resource (Resource): The resource being requested.
+        raw (str): Comma-separated field names, or empty for all fields.
+
+    Returns:
+        list[str]: The requested API field names.
+
+    Raises:
+        ValueError: If a name is not a field of the resource.
+    """
+    if not raw:
+        return list(resource.fields)
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown or not names:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown) or raw}')
+    return names
+
+
+def make_etag(*parts):
+    """
+    Build a strong, quoted ETag from the values that determine a response.
+
+    Args:
+        *parts: Row versions, request parameters and anything else the
+            response body depends on.
+
+    Returns:
+        str: e.g. ``'"3f2a..."'``.
+    """
+    return quote_etag(hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest())
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _conditional(request, etag, last_modified):
+    """Return a 304/412 if the request's preconditions say so, else None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        _set_validators(response, etag, timestamp)
+    return response
+
+
+def _set_validators(response, etag, timestamp):
+    response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+
+
+def _respond(data, etag, last_modified):
+    response = JsonResponse(data, encoder=CursorEncoder)
+    _set_validators(response, etag, int(last_modified.timestamp()) if last_modified else None)
+    return response
+
+
+def _identity(value):
+    return value
+
+
+def _fetch(resource, queryset, ids, names):
+    """Load the requested fields of ``ids``, in the order given."""
+    lookups = [resource.fields[name] for name in names]
+    rows = {row['pk']: row for row in queryset.filter(pk__in=ids).values('pk', *lookups)}
+    return [
+        {name: CONVERTERS.get(name, _identity)(rows[pk][resource.fields[name]]) for name in names}
+        for pk in ids if pk in rows
+    ]
+
+
+def _collection(request, resource, queryset):
+    """Serve one keyset page of ``queryset`` with conditional GET support."""
+    try:
+        names = parse_fields(resource, request.GET.get('fields'))
+        limit = min(int(request.GET.get('limit') or settings.BOOKS_API_PAGE_SIZE), settings.BOOKS_API_MAX_PAGE_SIZE)
+    except ValueError as exc:
+        return _error(str(exc))
+    sort = request.GET.get('sort') or next(iter(resource.orderings))
+    if sort not in resource.orderings or limit < 1:
+        return _error(f'Invalid sort or limit; sort must be one of: {", ".join(resource.orderings)}')
+    ordering = resource.orderings[sort]
+    cursor = request.GET.get('cursor')
+
+    keys = {name.lstrip('-') for name in ordering} | {'id', resource.version}
+    page = paginate(queryset.only(*keys), ordering, cursor, limit)
+    versions = [(row.pk, getattr(row, resource.version)) for row in page]
+    etag = make_etag(resource.model._meta.label, names, sort, limit, cursor, versions, page.next_cursor)
+    not_modified = _conditional(request, etag, None)
+    if not_modified is not None:
+        return not_modified
+
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    data = {
+        'results': _fetch(resource, queryset, [pk for pk, _ in versions], names),
+        'next_cursor': page.next_cursor,
+        'next': next_url,
+    }
+    return _respond(data, etag, None)
+
+
+def _detail(request, resource, queryset, pk):
+    """Serve a single object with conditional GET support."""
+    try:
+        names = parse_fields(resource, request.GET.get('fields'))
+    except ValueError as exc:
+        return _error(str(exc))
+    version = queryset.filter(pk=pk).values_list(resource.version, flat=True).first()
+    if version is None:
+        return _error('Not found.', status=404)
+    etag = make_etag(resource.model._meta.label, pk, version, names)
+    not_modified = _conditional(request, etag, version)
+    if not_modified is not None:
+        return not_modified
+    return _respond(_fetch(resource, queryset, [pk], names)[0], etag, version)
+
+
+@require_safe
+def books(request):
+    """
+    List the catalog.
+
+    Args:
+        request (HttpRequest): The HTTP request; see the module docstring
+            for the supported query parameters.
+
+    Returns:
+        JsonResponse: ``{"results": [...], "next_cursor": ..., "next": ...}``,
+        or a 304 if the client's copy is current.
+    """
+    return _collection(request, BOOKS, Book.objects.all())
+
+
+@require_safe
+def book(request, pk):
+    """
+    Return a single book.
+
+    Args:
+        request (HttpRequest): The HTTP request, optionally with 'fields'.
+        pk (int): Primary key of the book.
+
+    Returns:
+        JsonResponse: The book, a 304 if the client's copy is current, or a
+        404 error object.
+    """
+    return _detail(request, BOOKS, Book.objects.all(), pk)
+
+
+@require_safe
+def book_reviews(request, pk):
+    """
+    List a book's reviews, newest first.
+
+    Args:
+        request (HttpRequest): The HTTP request; see the module docstring.
+        pk (int): Primary key of the book.
+
+    Returns:
+        JsonResponse: One page of reviews, a 304, or a 404 error object.
+    """
+    if not Book.objects.filter(pk=pk).exists():
+        return _error('Not found.', status=404)
+    return _collection(request, REVIEWS, Review.objects.filter(book_id=pk))
+
+
+@require_safe
+def upcoming_books(request):
+    """
+    List scheduled releases, soonest first; promoted titles are left out.
+
+    Args:
+        request (HttpRequest): The HTTP request; see the module docstring.
+
+    Returns:
+        JsonResponse: One page of upcoming books, or a 304.
+    """
+    return _collection(request, UPCOMING, UpcomingBook.objects.scheduled())
+
+
+@require_safe
+def upcoming_book(request, pk):
+    """
+    Return a single upcoming book, including promoted ones, whose
+    ``book_id`` links to the catalog book.
+
+    Args:
+        request (HttpRequest): The HTTP request, optionally with 'fields'.
+        pk (int): Primary key of the upcoming book.
+
+    Returns:
+        JsonResponse: The upcoming book, a 304, or a 404 error object.
+    """
+    return _detail(request, UPCOMING, UpcomingBook.objects.all(), pk)
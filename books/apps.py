@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        from . import db, facets, instrumentation, search, signals, tasks  # noqa: F401
+
+        connection_created.connect(db.configure_connection)
+        connection_created.connect(instrumentation.install_query_recorder)
+        post_migrate.connect(search.ensure_search_index, sender=self)
+        post_migrate.connect(facets.ensure_facet_counts, sender=self)
@@ -0,0 +1,285 @@
+"""
+Static and media file delivery from the application process.
+
+The container has no separate web server, so the project's URLs route
+``STATIC_URL`` and ``MEDIA_URL`` here. Files are served from
+``STATIC_ROOT`` (filled by ``manage.py collectstatic``) and ``MEDIA_ROOT``:
+
+* the ``.br`` or ``.gz`` variant written by
+  :class:`~books.storage.CompressedManifestStaticFilesStorage` is sent
+  when the client accepts that encoding, so nothing is compressed per
+  request;
+* every response carries an ``ETag`` and ``Last-Modified`` and is
+  answered with 304 Not Modified when the client's copy is current;
+* files whose names are derived from their content (static manifest
+  entries and content-addressed covers) are cached for a year as
+  ``immutable``; other files for ``BOOKS_ASSET_MAX_AGE`` seconds;
+* single byte ranges (``Range: bytes=...``) get 206 Partial Content;
+  ranges always apply to the uncompressed file.
+
+Bodies are :class:`~django.http.FileResponse` streams of the open file, so
+WSGI servers that provide ``wsgi.file_wrapper`` (gunicorn's sync workers)
+send them with ``sendfile``. Under ASGI the file is read in
+``ASYNC_BLOCK_SIZE`` blocks on a worker thread instead, so a slow client
+never holds up the event loop.
+"""
+import mimetypes
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import is_content_addressed, is_staged
+
+# Content-Encoding -> suffix of the precompressed variant, best first.
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Bytes read per thread hop when streaming a file to an ASGI client.
+ASYNC_BLOCK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    A window of an open file, read as if it were the whole file.
+
+    Keeps ``fileno()``, so a server can still ``sendfile`` the window: it
+    starts at the file's position and runs for the response's
+    Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+async def _read_async(file):
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while chunk := await read(ASYNC_BLOCK_SIZE):
+        yield chunk
+
+
+@lru_cache(maxsize=1)
+def _hashed_names(manifest_hash):
+    return frozenset(staticfiles_storage.hashed_files.values())
+
+
+def is_hashed(name):
+    """
+    Check whether a static file name is a content-hashed manifest entry.
+
+    Args:
+        name (str): Path relative to ``STATIC_ROOT``.
+
+    Returns:
+        bool: True if the name changes whenever the content does.
+    """
+    manifest_hash = getattr(staticfiles_storage, 'manifest_hash', None)
+    return manifest_hash is not None and name in _hashed_names(manifest_hash)
+
+
+def accepted_encodings(header):
+    """
+    Parse an ``Accept-Encoding`` header.
+
+    Args:
+        header (str): The header value.
+
+    Returns:
+        set[str]: Encodings the client accepts (``q`` above zero).
+    """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = re.search(r'q=([\d.]+)', params)
+        if coding and (quality is None or float(quality.group(1) or 0) > 0):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def byte_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    Args:
+        header (str): The header value, e.g. ``bytes=0-499`` or
+            ``bytes=-500``.
+        size (int): Size of the file in bytes.
+
+    Returns:
+        tuple[int, int] or None: ``(start, end)`` with ``end`` inclusive,
+        or None when the header is malformed or asks for several ranges,
+        in which case the whole file is sent.
+
+    Raises:
+        ValueError: If the range lies outside the file.
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(f'Range {header!r} outside a file of {size} bytes.')
+    return start, end
+
+
+def serve(request, root, name, cache_control):
+    """
+    Serve one file from a directory.
+
+    Args:
+        request (HttpRequest): A GET or HEAD request.
+        root (Path or str): Directory the file is served from.
+        name (str): Path of the file relative to ``root``.
+        cache_control (str): ``Cache-Control`` value for the response.
+
+    Returns:
+        HttpResponse: 200, 206, 304, 412 or 416 response.
+
+    Raises:
+        Http404: If ``name`` escapes ``root`` or is not a file.
+    """
+    try:
+        path = Path(safe_join(root, name))
+    except SuspiciousFileOperation:
+        raise Http404('Not found.')
+    if not path.is_file():
+        raise Http404('Not found.')
+
+    range_header = request.headers.get('Range')
+    encoding = None
+    if not range_header:
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for coding, suffix in ENCODINGS.items():
+            variant = path.with_name(path.name + suffix)
+            if coding in accepted and variant.is_file():
+                encoding, path = coding, variant
+                break
+
+    stat = path.stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def finish(response):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Accept-Ranges'] = 'bytes'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        return finish(conditional)
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    start, end = 0, stat.st_size - 1
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            requested = byte_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{stat.st_size}'
+            return finish(response)
+        if requested is not None:
+            start, end = requested
+
+    file = path.open('rb')
+    filename = Path(name).name
+    if (start, end) == (0, stat.st_size - 1):
+        response = FileResponse(file, content_type=content_type, filename=filename)
+    else:
+        response = FileResponse(
+            FileRange(file, start, end - start + 1), content_type=content_type, filename=filename, status=206,
+        )
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.headers['Content-Length'] = end - start + 1
+    if isinstance(request, ASGIRequest):
+        response.streaming_content = _read_async(response.file_to_stream)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return finish(response)
+
+
+@require_safe
+def serve_static(request, path):
+    """
+    Serve a collected static file.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        path (str): Path relative to ``STATIC_ROOT``.
+
+    Returns:
+        HttpResponse: See :func:`serve`.
+    """
+    cache_control = IMMUTABLE if is_hashed(path) else f'public, max-age={settings.BOOKS_ASSET_MAX_AGE}'
+    return serve(request, settings.STATIC_ROOT, path, cache_control)
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an uploaded media file, such as a cover or one of its renditions.
+
+    Covers still being staged (see :class:`~books.storage.ContentAddressedStorage`)
+    are not served.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        path (str): Path relative to ``MEDIA_ROOT``.
+
+    Returns:
+        HttpResponse: See :func:`serve`.
+
+    Raises:
+        Http404: If the file does not exist or is a staged upload.
+    """
+    if is_staged(path):
+        raise Http404('Not found.')
+    cache_control = IMMUTABLE if is_content_addressed(path) else f'public, max-age={settings.BOOKS_ASSET_MAX_AGE}'
+    return serve(request, settings.MEDIA_ROOT, path, cache_control)
+
+
+def urlpatterns():
+    """
+    Return the URL patterns serving ``STATIC_URL`` and ``MEDIA_URL``.
+
+    Returns:
+        list[URLPattern]: Patterns to add to the root URLconf.
+    """
+    return [
+        re_path(rf'^{re.escape(settings.STATIC_URL.lstrip("/"))}(?P<path>.+)$', serve_static, name='static_file'),
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', serve_media, name='media_file'),
+    ]
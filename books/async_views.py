@@ -0,0 +1,99 @@
+"""
+Async versions of the read-only catalog views.
+
+``books.urls`` routes to these instead of their counterparts in
+:mod:`books.views` when ``BOOKS_ASYNC_VIEWS`` is on, as it is in the
+production ASGI container (see ``gunicorn.conf.py``). A request waiting on
+the database then parks a coroutine rather than holding a worker thread, so
+each worker can keep many slow clients in flight.
+
+Queries go through Django's async ORM. Code that is sync-only runs through
+``sync_to_async``: the cache single-flight lock, the book list, whose
+search is raw SQL and whose context is shared with the sync view through
+:func:`books.views.build_book_list_context`, and template rendering, which
+can touch the session and cart summary lazily. The templates and context
+are the same as in the sync views.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import aget_object_or_404, render
+
+from .caching import get_or_build, versioned_key
+from .models import Book, UpcomingBook
+from .pagination import apaginate
+from .views import (
+    REVIEW_ORDERING, UPCOMING_ORDERING, _neighbour_rows, _review_rows, _upcoming_context, build_book_list_context,
+    build_home_context,
+)
+
+arender = sync_to_async(render)
+
+
+def _home_context():
+    return get_or_build(
+        versioned_key('home', 'context'), build_home_context, timeout=settings.BOOKS_HOME_CACHE_TIMEOUT,
+    )
+
+
+async def home(request):
+    """
+    Render the homepage; async version of :func:`books.views.home`.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Rendered homepage with context data.
+    """
+    context = await sync_to_async(_home_context)()
+    return await arender(request, 'books/home.html', context)
+
+
+async def book_list(request):
+    """
+    Display one page of books; async version of :func:`books.views.book_list`.
+
+    Args:
+        request (HttpRequest): The HTTP request containing optional 'q',
+            'sort', 'cursor' and facet parameters.
+
+    Returns:
+        HttpResponse: Rendered book list view with one page of results.
+    """
+    context = await sync_to_async(build_book_list_context)(request.GET)
+    return await arender(request, 'books/book_list.html', context)
+
+
+async def book_detail(request, pk):
+    """
+    Display a book, its newest reviews and its recommendations; async
+    version of :func:`books.views.book_detail`.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        pk (int): Primary key of the book.
+
+    Returns:
+        HttpResponse: Rendered detail page for the selected book.
+    """
+    book = await aget_object_or_404(Book, pk=pk)
+    reviews = await apaginate(_review_rows(book.pk), REVIEW_ORDERING, None, settings.BOOKS_REVIEWS_PAGE_SIZE)
+    recommended = [row.neighbour async for row in _neighbour_rows(book.pk)]
+    context = {'book': book, 'reviews': reviews, 'recommended': recommended}
+    return await arender(request, 'books/book_detail.html', context)
+
+
+async def upcoming_books(request):
+    """
+    Display one page of scheduled releases; async version of
+    :func:`books.views.upcoming_books`.
+
+    Args:
+        request (HttpRequest): The HTTP request, with an optional 'cursor'.
+
+    Returns:
+        HttpResponse: Rendered list view of one page of upcoming books.
+    """
+    cursor = request.GET.get('cursor')
+    page = await apaginate(UpcomingBook.objects.scheduled(), UPCOMING_ORDERING, cursor, settings.BOOKS_PAGE_SIZE)
+    return await arender(request, 'books/upcoming_books.html', _upcoming_context(page, cursor))
@@ -0,0 +1,295 @@
+"""
+In-process prefix index for search-box autocomplete.
+
+Titles and authors are normalised into a sorted array of keys, so a prefix
+lookup is a binary search followed by a short forward scan, and answering a
+keystroke never touches the database. The index is built lazily on first
+use and patched incrementally from ``Book`` save/delete signals.
+
+The index holds at most ``BOOKS_AUTOCOMPLETE_MAX_ENTRIES`` keys (about four
+per book) to bound its memory. Books are indexed newest first, so on a
+catalog past the cap the oldest books are never suggested; a build that
+hits the cap logs a warning with the number of books left out.
+
+Each process keeps its own copy. Writes bump the ``autocomplete`` cache
+namespace version in the shared cache (see :mod:`books.caching`), and a
+process whose copy is older than the shared version rebuilds it in a
+background thread, so workers that did not see the signal still converge.
+Lookups keep using the old copy until the new one replaces it. The
+process that made a write patches its own copy and keeps it only if no
+other process bumped the version since the copy was last current.
+"""
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from .caching import bump_version, get_version
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'autocomplete'
+MAX_KEY_LENGTH = 64
+LEADING_ARTICLES = ('the ', 'a ', 'an ')
+
+
+def normalize(text):
+    """
+    Fold text into the form used for index keys and lookups.
+
+    Args:
+        text (str): A title, author name or typed prefix.
+
+    Returns:
+        str: Lower-cased text without accents or repeated whitespace,
+        truncated to ``MAX_KEY_LENGTH`` characters.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())[:MAX_KEY_LENGTH]
+
+
+def book_keys(title, author):
+    """
+    Return the ``(key, kind)`` pairs a book is findable under.
+
+    A book is indexed by its full title, its title without a leading
+    article, its author and the author's surname.
+
+    Args:
+        title (str): The book title.
+        author (str): The author name.
+
+    Returns:
+        set[tuple[str, str]]: Keys paired with ``'title'`` or ``'author'``.
+    """
+    keys = set()
+    title_key, author_key = normalize(title), normalize(author)
+    if title_key:
+        keys.add((title_key, 'title'))
+        for article in LEADING_ARTICLES:
+            if title_key.startswith(article):
+                keys.add((title_key[len(article):], 'title'))
+    if author_key:
+        keys.add((author_key, 'author'))
+        keys.add((author_key.rsplit(' ', 1)[-1], 'author'))
+    return keys
+
+
+class PrefixIndex:
+    """
+    A sorted array of ``(key, kind, book_id)`` entries with prefix lookup.
+
+    Attributes:
+        max_entries (int): Upper bound on the number of stored keys.
+        version (int or None): Namespace version the index was built at,
+            or None if it has not been built yet.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = []
+        self._books = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def build(self, rows, version=None):
+        """
+        Replace the index contents.
+
+        Args:
+            rows (iterable): ``(book_id, title, author)`` tuples, most
+                relevant first; rows past the entry cap are dropped.
+            version (int, optional): Cache namespace version being built from.
+        """
+        entries, books, skipped = [], {}, 0
+        for book_id, title, author in rows:
+            keys = book_keys(title, author)
+            if skipped or len(entries) + len(keys) > self.max_entries:
+                skipped += 1
+                continue
+            books[book_id] = (title, author, keys)
+            entries.extend((key, kind, book_id) for key, kind in keys)
+        if skipped:
+            logger.warning(
+                'Autocomplete index full at %d entries: %d books indexed, %d older books left out. '
+                'Raise BOOKS_AUTOCOMPLETE_MAX_ENTRIES to suggest them.', len(entries), len(books), skipped,
+            )
+        entries.sort()
+        with self._lock:
+            self._entries, self._books = entries, books
+            self.version = version
+
+    def add(self, book_id, title, author):
+        """
+        Insert or refresh a single book.
+
+        Args:
+            book_id (int): Primary key of the book.
+            title (str): The book title.
+            author (str): The author name.
+        """
+        keys = book_keys(title, author)
+        with self._lock:
+            self._discard(book_id)
+            if len(self._entries) + len(keys) > self.max_entries:
+                logger.warning('Autocomplete index full; not indexing book %s.', book_id)
+                return
+            self._books[book_id] = (title, author, keys)
+            for key, kind in keys:
+                insort(self._entries, (key, kind, book_id))
+
+    def remove(self, book_id):
+        """
+        Remove a book from the index if present.
+
+        Args:
+            book_id (int): Primary key of the book.
+        """
+        with self._lock:
+            self._discard(book_id)
+
+    def _discard(self, book_id):
+        indexed = self._books.pop(book_id, None)
+        if indexed is None:
+            return
+        for key, kind in indexed[2]:
+            position = bisect_left(self._entries, (key, kind, book_id))
+            if position < len(self._entries) and self._entries[position] == (key, kind, book_id):
+                del self._entries[position]
+
+    def lookup(self, prefix, limit=10):
+        """
+        Find titles and authors starting with ``prefix``.
+
+        Args:
+            prefix (str): The text typed so far.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list[dict]: Suggestions with ``kind``, ``label`` and, for
+            titles, the ``book_id`` they point at.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        suggestions, seen = [], set()
+        with self._lock:
+            position = bisect_left(self._entries, (prefix,))
+            while position < len(self._entries) and len(suggestions) < limit:
+                key, kind, book_id = self._entries[position]
+                position += 1
+                if not key.startswith(prefix):
+                    break
+                title, author, _ = self._books[book_id]
+                label = title if kind == 'title' else author
+                if (kind, label) in seen:
+                    continue
+                seen.add((kind, label))
+                suggestion = {'kind': kind, 'label': label}
+                if kind == 'title':
+                    suggestion['book_id'] = book_id
+                suggestions.append(suggestion)
+        return suggestions
+
+
+index = PrefixIndex(max_entries=settings.BOOKS_AUTOCOMPLETE_MAX_ENTRIES)
+_rebuild_thread = None
+_rebuild_thread_lock = threading.Lock()
+
+
+def rebuild():
+    """Rebuild this process's index from the ``Book`` table."""
+    from .models import Book
+
+    version = get_version(NAMESPACE)
+    rows = Book.objects.order_by('-id').values_list('id', 'title', 'author')
+    index.build(rows.iterator(chunk_size=2000), version=version)
+
+
+def _rebuild_and_close():
+    try:
+        rebuild()
+    except Exception:
+        logger.exception('Autocomplete index rebuild failed; serving the previous index.')
+    finally:
+        connection.close()
+
+
+def rebuild_in_background():
+    """
+    Rebuild this process's index in a thread, unless a rebuild is running.
+
+    Returns:
+        threading.Thread: The running rebuild.
+    """
+    global _rebuild_thread
+    with _rebuild_thread_lock:
+        if _rebuild_thread is None or not _rebuild_thread.is_alive():
+            _rebuild_thread = threading.Thread(target=_rebuild_and_close, name='autocomplete-rebuild', daemon=True)
+            _rebuild_thread.start()
+        return _rebuild_thread
+
+
+def suggest(prefix, limit=10):
+    """
+    Return autocomplete suggestions.
+
+    The first lookup in a process builds the index. Later lookups that find
+    it stale start a background rebuild and answer from the current copy.
+
+    Args:
+        prefix (str): The text typed so far.
+        limit (int): Maximum number of suggestions.
+
+    Returns:
+        list[dict]: See :meth:`PrefixIndex.lookup`.
+    """
+    if index.version is None:
+        rebuild()
+    elif index.version != get_version(NAMESPACE):
+        rebuild_in_background()
+    return index.lookup(prefix, limit=limit)
+
+
+def _bump(previous):
+    """
+    Bump the shared version after patching the local index.
+
+    The index adopts the new version only if it is exactly one past the
+    version the index was current at. Otherwise another process wrote in
+    between, and the index stays stale so the next lookup refreshes it.
+    """
+    version = bump_version(NAMESPACE)
+    if previous is not None and version == previous + 1:
+        index.version = version
+
+
+def book_changed(book):
+    """
+    Apply a saved book to the local index and invalidate other processes.
+
+    Args:
+        book (Book): The book that was created or updated.
+    """
+    previous = index.version
+    index.add(book.pk, book.title, book.author)
+    _bump(previous)
+
+
+def book_removed(book_id):
+    """
+    Drop a deleted book from the local index and invalidate other processes.
+
+    Args:
+        book_id (int): Primary key of the deleted book.
+    """
+    previous = index.version
+    index.remove(book_id)
+    _bump(previous)
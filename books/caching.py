@@ -0,0 +1,144 @@
+"""
+Helpers for caching derived page data in Django's cache framework.
+
+Cached values live under *versioned* keys: invalidating a namespace bumps
+its version counter rather than deleting keys, so a rebuild that raced with
+a write can only ever store its (stale) result under the old version.
+
+:func:`get_or_build` adds single-flight recomputation. Within a process a
+lock collapses concurrent misses onto one builder; across processes a
+short-lived lock key in the cache does the same, and the other workers wait
+for the value instead of all querying the database at once.
+
+Both only work if the ``default`` cache is shared by every web and job
+worker process (see ``CACHES`` in the settings). With a per-process cache
+such as ``LocMemCache``, a version bump made by ``runworker`` or another
+web worker never reaches the rest, which keep serving stale values until
+they expire, and the build lock only guards one process.
+
+A version key that is evicted starts again from the current time in
+microseconds rather than from 0, so it never goes back to a version whose
+values may still be cached.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+from .routers import use_primary
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _local_lock(key):
+    with _local_locks_guard:
+        return _local_locks.setdefault(key, threading.Lock())
+
+
+def _initial_version():
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    """
+    Return the current version of a cache namespace.
+
+    Args:
+        namespace (str): Name of the group of cached values, e.g. ``'home'``.
+
+    Returns:
+        int: The namespace version, initialised from the clock on first use.
+    """
+    key = f'books:{namespace}:version'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """
+    Invalidate every value cached under a namespace.
+
+    Args:
+        namespace (str): Name of the group of cached values.
+
+    Returns:
+        int: The new namespace version.
+    """
+    key = f'books:{namespace}:version'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.get(key)
+
+
+def versioned_key(namespace, *parts):
+    """
+    Build a cache key tied to the current version of ``namespace``.
+
+    Args:
+        namespace (str): Name of the group of cached values.
+        *parts: Extra key components, e.g. a user id.
+
+    Returns:
+        str: The cache key.
+    """
+    suffix = ':'.join(str(part) for part in parts)
+    return f'books:{namespace}:v{get_version(namespace)}:{suffix}'
+
+
+def get_or_build(key, builder, timeout, lock_timeout=30, wait=5.0, poll=0.05):
+    """
+    Return the cached value for ``key``, building it at most once on a miss.
+
+    Builders read from the primary database, so a lagging replica never
+    gets its stale rows cached (see :mod:`books.routers`).
+
+    Args:
+        key (str): The cache key.
+        builder (callable): Zero-argument function computing the value;
+            it must not return None.
+        timeout (int): Seconds to keep the built value.
+        lock_timeout (int): Seconds after which an abandoned build lock
+            expires.
+        wait (float): Seconds to wait for another process's build before
+            building anyway.
+        poll (float): Seconds between checks while waiting.
+
+    Returns:
+        The cached or freshly built value.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _local_lock(key):
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f'{key}:lock'
+        if not cache.add(lock_key, 1, timeout=lock_timeout):
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(poll)
+                value = cache.get(key)
+                if value is not None:
+                    return value
+                if cache.add(lock_key, 1, timeout=lock_timeout):
+                    break
+            else:
+                with use_primary():
+                    return builder()
+
+        try:
+            with use_primary():
+                value = builder()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
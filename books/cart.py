@@ -0,0 +1,55 @@
+"""
+Cached per-user cart summary shown in the navigation bar.
+
+The summary (number of copies and total price) is stored in Django's cache
+under a key per user. Cart item writes delete that key, and any ``Book``
+write bumps the ``cart-summary`` namespace version since a price change
+alters every cart containing the book. The cache is shared by all worker
+processes (see ``CACHES``), so a cart changed through one web worker is
+shown with its new count by every other one.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+
+from .caching import versioned_key
+from .models import CartItem
+
+NAMESPACE = 'cart-summary'
+
+
+def get_cart_summary(user_id):
+    """
+    Return the item count and total price of a user's cart.
+
+    Args:
+        user_id (int): The cart owner's id.
+
+    Returns:
+        dict: ``{'quantity': int, 'total': Decimal}``.
+    """
+    key = versioned_key(NAMESPACE, user_id)
+    summary = cache.get(key)
+    if summary is None:
+        totals = CartItem.objects.filter(cart__user_id=user_id).aggregate(
+            copies=Sum('quantity'),
+            total=Sum(F('book__price') * F('quantity')),
+        )
+        summary = {
+            'quantity': totals['copies'] or 0,
+            'total': totals['total'] if totals['total'] is not None else Decimal('0.00'),
+        }
+        cache.set(key, summary, settings.BOOKS_CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(user_id):
+    """
+    Forget a user's cached cart summary after their cart changed.
+
+    Args:
+        user_id (int): The cart owner's id.
+    """
+    cache.delete(versioned_key(NAMESPACE, user_id))
@@ -0,0 +1,22 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart import get_cart_summary
+
+
+def cart_summary(request):
+    """
+    Expose the signed-in user's cart summary to templates as ``cart_summary``.
+
+    The summary is loaded lazily, so pages that never render it do not
+    touch the cache.
+
+    Args:
+        request (HttpRequest): The current request.
+
+    Returns:
+        dict: ``{'cart_summary': ...}`` for signed-in users, otherwise empty.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'cart_summary': SimpleLazyObject(lambda: get_cart_summary(user.pk))}
@@ -0,0 +1,247 @@
+"""
+Reference counting and deduplication of cover images.
+
+Covers are kept in :class:`~books.storage.ContentAddressedStorage`, one file
+per distinct image, which book and upcoming book rows share. A
+:class:`~books.models.StoredFile` row counts the covers using each file:
+
+* saving or deleting a book or upcoming book adjusts the counts through
+  the receivers in :mod:`books.signals`;
+* bulk writers, which send no signals, call :func:`retain` and
+  :func:`release` themselves;
+* :func:`reconcile` recounts everything from the tables.
+
+Files whose count has dropped to zero are deleted by :func:`prune` once
+``BOOKS_COVER_PRUNE_AFTER_HOURS`` have passed, so an upload that has been
+stored but whose row is not saved yet is not lost.
+
+:func:`dedupe` moves covers stored under their upload names (before
+content addressing, or by an older import) into content-addressed storage,
+repoints the rows and removes the old copies. It backs
+``manage.py dedupe_covers``.
+"""
+import hashlib
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+
+from . import jobs, renditions
+from .models import Book, StoredFile, UpcomingBook
+from .storage import cover_storage, is_content_addressed
+
+MODELS = (Book, UpcomingBook)
+
+
+def _counted(names):
+    return Counter(name for name in names if name and is_content_addressed(name))
+
+
+def retain(names):
+    """
+    Count new references to stored covers.
+
+    Names not in content-addressed storage are ignored.
+
+    Args:
+        names (Iterable[str]): One storage name per new reference.
+    """
+    storage = cover_storage()
+    for name, count in _counted(names).items():
+        if not StoredFile.objects.filter(name=name).exists():
+            size = storage.size(name) if storage.exists(name) else 0
+            StoredFile.objects.get_or_create(name=name, defaults={'size': size})
+        StoredFile.objects.filter(name=name).update(references=F('references') + count, updated_at=Now())
+
+
+def release(names):
+    """
+    Drop references to stored covers.
+
+    Args:
+        names (Iterable[str]): One storage name per dropped reference.
+    """
+    for name, count in _counted(names).items():
+        StoredFile.objects.filter(name=name).update(
+            references=Greatest(F('references') - count, 0), updated_at=Now(),
+        )
+
+
+def referenced_covers():
+    """
+    Count the rows using each cover, straight from the tables.
+
+    Returns:
+        Counter: Storage name -> number of book and upcoming book rows.
+    """
+    counts = Counter()
+    for model in MODELS:
+        rows = (
+            model.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+            .values_list('cover_image').annotate(rows=Count('pk')).order_by()
+        )
+        counts.update(dict(rows))
+    return counts
+
+
+def reconcile():
+    """
+    Recount every :class:`StoredFile` from the tables.
+
+    Returns:
+        int: Stored files whose count was wrong.
+    """
+    storage = cover_storage()
+    counts = _counted(referenced_covers().elements())
+    fixed = 0
+    with transaction.atomic():
+        known = dict(StoredFile.objects.values_list('name', 'references'))
+        for name, count in counts.items():
+            if name not in known and storage.exists(name):
+                StoredFile.objects.create(name=name, size=storage.size(name), references=count)
+                fixed += 1
+            elif name in known and known[name] != count:
+                StoredFile.objects.filter(name=name).update(references=count, updated_at=Now())
+                fixed += 1
+        stale = [name for name, references in known.items() if references and name not in counts]
+        fixed += StoredFile.objects.filter(name__in=stale).update(references=0, updated_at=Now())
+    return fixed
+
+
+def _delete(storage, name):
+    """Delete a stored image and its renditions."""
+    if storage.exists(name):
+        storage.delete(name)
+    renditions.delete(name, storage)
+
+
+def prune(now=None):
+    """
+    Delete stored covers that nothing has used for the grace period.
+
+    Args:
+        now (datetime, optional): Defaults to the current time.
+
+    Returns:
+        tuple[int, int]: Files deleted and bytes freed.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.BOOKS_COVER_PRUNE_AFTER_HOURS)
+    storage = cover_storage()
+    deleted = freed = 0
+    for stored in StoredFile.objects.filter(references=0, updated_at__lt=cutoff):
+        # An upload of the same image touches the file; leave it for later.
+        if storage.exists(stored.name) and storage.get_modified_time(stored.name) >= cutoff:
+            continue
+        if StoredFile.objects.filter(pk=stored.pk, references=0).delete()[0]:
+            _delete(storage, stored.name)
+            deleted += 1
+            freed += stored.size
+    return deleted, freed
+
+
+@dataclass
+class DedupeResult:
+    """
+    Outcome of :func:`dedupe`.
+
+    Attributes:
+        moved (int): Covers moved into content-addressed storage.
+        stored (int): Distinct images they turned out to be.
+        bytes_before (int): Size of the moved covers.
+        bytes_after (int): Size of the distinct images.
+        missing (list[str]): Names rows refer to but no file exists for.
+        orphans (list[str]): Files in the upload directories no row uses.
+    """
+    moved: int = 0
+    stored: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    missing: list = field(default_factory=list)
+    orphans: list = field(default_factory=list)
+
+
+def _digest(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _upload_directories():
+    return sorted({model._meta.get_field('cover_image').upload_to.rstrip('/') for model in MODELS})
+
+
+def _is_rendition(name):
+    stem = os.path.basename(name).rsplit('.', 1)[0]
+    return any(stem.endswith(f'.{rendition}') for rendition in renditions.RENDITIONS)
+
+
+def dedupe(dry_run=False, delete_orphans=False):
+    """
+    Move covers stored under their upload names into content-addressed storage.
+
+    Each such file is stored once per distinct image, the rows using it are
+    repointed in one transaction, and the old copy and its renditions are
+    deleted afterwards. Renditions of the new names are queued. Reference
+    counts are then reconciled.
+
+    Args:
+        dry_run (bool): Only report what would change.
+        delete_orphans (bool): Also delete files in the upload directories
+            that no row refers to.
+
+    Returns:
+        DedupeResult: What was (or would be) moved.
+    """
+    storage = cover_storage()
+    referenced = referenced_covers()
+    result = DedupeResult()
+    moves = {}
+    distinct = {}
+    for name in sorted(referenced):
+        if is_content_addressed(name):
+            continue
+        if not storage.exists(name):
+            result.missing.append(name)
+            continue
+        with storage.open(name, 'rb') as file:
+            if dry_run:
+                target = storage.name_for(_digest(file), name)
+            else:
+                target = storage.save(name, file)
+        size = storage.size(name)
+        moves[name] = target
+        distinct[target] = size
+        result.bytes_before += size
+    result.moved, result.stored, result.bytes_after = len(moves), len(distinct), sum(distinct.values())
+
+    for directory in _upload_directories():
+        if storage.exists(directory):
+            _, files = storage.listdir(directory)
+            result.orphans.extend(
+                name for name in (f'{directory}/{filename}' for filename in sorted(files))
+                if name not in referenced and not _is_rendition(name)
+            )
+    if dry_run:
+        return result
+
+    with transaction.atomic():
+        for old, new in moves.items():
+            for model in MODELS:
+                model.objects.filter(cover_image=old).update(cover_image=new)
+    reconcile()
+    for old, new in moves.items():
+        _delete(default_storage, old)
+        jobs.enqueue('build_cover_renditions', {'name': new}, idempotency_key=f'renditions:{new}')
+    if delete_orphans:
+        for name in result.orphans:
+            _delete(default_storage, name)
+    return result
@@ -0,0 +1,63 @@
+"""
+SQLite connection tuning.
+
+:func:`configure_connection` runs on ``connection_created`` and applies
+``BOOKS_SQLITE_PRAGMAS`` to every new SQLite connection; ``busy_timeout``
+makes a writer wait for the lock instead of failing at once with
+"database is locked". Together with ``CONN_MAX_AGE`` the pragmas are paid
+once per connection rather than once per request.
+
+With ``BOOKS_SQLITE_WAL`` on, connections also switch the database to WAL,
+where readers no longer block the writer (or the other way round). Unlike
+the other pragmas, the journal mode is stored in the database file, so it
+is only changed when asked for.
+
+``manage.py benchmark_db`` measures the read/write concurrency the
+configured database sustains.
+"""
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver that applies the SQLite pragmas.
+
+    Args:
+        sender (type): The database wrapper class.
+        connection (BaseDatabaseWrapper): The new connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in configured_pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configured_pragmas():
+    """
+    Return the pragmas new connections apply.
+
+    Returns:
+        dict: ``BOOKS_SQLITE_PRAGMAS``, preceded by ``journal_mode`` and
+        ``synchronous`` when ``BOOKS_SQLITE_WAL`` is on.
+    """
+    pragmas = {'journal_mode': 'WAL', 'synchronous': 'NORMAL'} if settings.BOOKS_SQLITE_WAL else {}
+    return {**pragmas, **settings.BOOKS_SQLITE_PRAGMAS}
+
+
+def sqlite_pragmas(connection):
+    """
+    Read back the current value of every configured pragma.
+
+    Args:
+        connection (BaseDatabaseWrapper): A SQLite connection.
+
+    Returns:
+        dict: Pragma name -> value as reported by SQLite.
+    """
+    values = {}
+    with connection.cursor() as cursor:
+        for name in configured_pragmas():
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
@@ -0,0 +1,196 @@
+"""
+Streaming exports of the catalog and review history.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` (a server-side
+cursor where the database supports one) and encoded incrementally, so
+memory use does not grow with the table. The same generators back the
+``export_catalog`` management command and the staff-only HTTP endpoint.
+
+Exports are ordered by a watermark key, ``(id,)`` for books and
+``(created_at, id)`` for reviews. Passing the last exported key back as
+``since`` returns only newer rows, which makes incremental exports cheap.
+
+Formats:
+
+* ``csv``: a header row followed by one line per row.
+* ``jsonl``: one JSON object per row.
+* ``columns``: one JSON object per chunk mapping each column to a list of
+  values, ready to be appended as a row group to a columnar file such as
+  Parquet.
+
+Under ASGI the encoded stream is wrapped by :func:`stream_async`. Django
+would otherwise consume a synchronous iterator into a list before sending
+the first byte.
+"""
+import csv
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+
+from .models import Book, Review
+from .pagination import CursorEncoder, keyset_filter
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'columns': 'application/x-ndjson',
+}
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    """
+    What to export for one dataset.
+
+    Attributes:
+        model (type): The model to read.
+        columns (tuple[str]): ``values_list`` field names, in output order.
+        watermark (tuple[str]): Ordering used for incremental exports; the
+            fields must also appear in ``columns``.
+    """
+    model: type
+    columns: tuple
+    watermark: tuple
+
+
+EXPORTS = {
+    'books': ExportSpec(
+        model=Book,
+        columns=(
+            'id', 'isbn', 'title', 'author', 'description', 'price', 'release_date',
+            'is_popular', 'is_upcoming', 'review_count', 'last_reviewed_at', 'popularity_score',
+        ),
+        watermark=('id',),
+    ),
+    'reviews': ExportSpec(
+        model=Review,
+        columns=('id', 'book_id', 'user_id', 'user__username', 'content', 'created_at'),
+        watermark=('created_at', 'id'),
+    ),
+}
+
+
+def export_rows(dataset, since=None, chunk_size=2000):
+    """
+    Iterate over the rows of a dataset in watermark order.
+
+    Args:
+        dataset (str): A key of ``EXPORTS``.
+        since (list, optional): Watermark values of the last row already
+            exported; only later rows are returned.
+        chunk_size (int): Rows fetched from the database at a time.
+
+    Returns:
+        Iterator[tuple]: Row values in ``EXPORTS[dataset].columns`` order.
+    """
+    spec = EXPORTS[dataset]
+    queryset = spec.model.objects.all()
+    if since:
+        queryset = queryset.filter(keyset_filter(spec.watermark, since))
+    return queryset.order_by(*spec.watermark).values_list(*spec.columns).iterator(chunk_size=chunk_size)
+
+
+def watermark_of(dataset, row):
+    """
+    Return the watermark values of an exported row.
+
+    Args:
+        dataset (str): A key of ``EXPORTS``.
+        row (tuple): A row yielded by :func:`export_rows`.
+
+    Returns:
+        list: Values to pass as ``since`` for the next incremental export.
+    """
+    spec = EXPORTS[dataset]
+    return [row[spec.columns.index(name)] for name in spec.watermark]
+
+
+class _Echo:
+    """A write-only file that hands back what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode(dataset, rows, fmt, chunk_size=2000):
+    """
+    Encode rows of a dataset as a stream of text chunks.
+
+    Args:
+        dataset (str): A key of ``EXPORTS``.
+        rows (Iterable[tuple]): Rows from :func:`export_rows`.
+        fmt (str): A key of ``FORMATS``.
+        chunk_size (int): Rows per yielded chunk.
+
+    Returns:
+        Iterator[str]: The encoded output.
+    """
+    columns = EXPORTS[dataset].columns
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for chunk in _chunks(rows, chunk_size):
+            yield ''.join(writer.writerow(row) for row in chunk)
+    elif fmt == 'jsonl':
+        encoder = CursorEncoder(separators=(',', ':'))
+        for chunk in _chunks(rows, chunk_size):
+            yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk)
+    elif fmt == 'columns':
+        encoder = CursorEncoder(separators=(',', ':'))
+        for chunk in _chunks(rows, chunk_size):
+            yield encoder.encode({name: list(values) for name, values in zip(columns, zip(*chunk))}) + '\n'
+    else:
+        raise ValueError(f'Unknown export format {fmt!r}')
+
+
+async def stream_async(chunks):
+    """
+    Iterate a synchronous stream of chunks from async code.
+
+    Each chunk is produced on the thread that serves Django's sync code,
+    which also owns the database connection that the underlying cursor
+    reads from, so only one chunk is in memory at a time.
+
+    Args:
+        chunks (Iterator[str]): E.g. the output of :func:`encode`.
+
+    Yields:
+        str: The same chunks.
+    """
+    done = object()
+    produce = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await produce(chunks, done)) is not done:
+        yield chunk
+
+
+def parse_since(dataset, since, since_id=None):
+    """
+    Build watermark values from user-supplied strings.
+
+    Args:
+        dataset (str): A key of ``EXPORTS``.
+        since (str, optional): For reviews, an ISO ``created_at``
+            timestamp; ignored for books.
+        since_id (str or int, optional): The last exported id.
+
+    Returns:
+        list or None: Watermark values for :func:`export_rows`, or None
+        for a full export.
+    """
+    watermark = EXPORTS[dataset].watermark
+    if watermark == ('id',):
+        return [int(since_id)] if since_id not in (None, '') else None
+    if not since:
+        return None
+    return [since, int(since_id) if since_id not in (None, '') else 0]
@@ -0,0 +1,322 @@
+"""
+Faceted filtering of the catalog listing.
+
+Four facets narrow ``book_list``, each through one query parameter:
+
+* ``price``: a range from ``BOOKS_PRICE_FACETS``, e.g. ``10-25`` or ``100-``;
+* ``author``: an exact author name;
+* ``year``: a release year;
+* ``state``: ``popular`` or ``upcoming``.
+
+Filters compose with AND, and each is served by an index that also
+provides the listing order: (price, id), (author, title, id), the
+(release_year, ...) indexes on the stored ``Book.release_year`` column,
+and partial indexes holding only popular or upcoming books.
+
+Facet counts are not counted from the catalog on each request. They are
+added up from :class:`~books.models.FacetCount`, a grouped summary of the
+catalog with one row per combination of facet values, in a single
+``UNION ALL`` of grouped queries, one per facet. Each facet is counted over
+the rows matching every *other* selected filter, so the counts show what
+picking a different value would return.
+
+:func:`rebuild` regenerates the summary. Bulk writers (imports, release
+promotion, popularity recomputes, synthetic data) call it directly; single
+book saves schedule a ``rebuild_facets`` job, at most one per
+``BOOKS_FACET_REBUILD_DELAY`` seconds, so counts may trail edits briefly.
+Counts are also cached per selection under the ``facets`` namespace, which
+each rebuild invalidates. Scheduled rebuilds run in ``runworker``, not in
+the web process that serves the counts, so the version bump only reaches
+the web workers through the shared cache (see ``CACHES``).
+"""
+import hashlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, CharField, Count, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import jobs
+from .caching import bump_version, get_or_build, versioned_key
+from .models import Book, FacetCount
+
+NAMESPACE = 'facets'
+
+STATES = {
+    'popular': Q(is_popular=True),
+    'upcoming': Q(is_upcoming=True),
+}
+
+
+def price_buckets():
+    """
+    Return the configured price ranges.
+
+    Returns:
+        list[tuple[str, Decimal, Decimal or None]]: ``(key, low, high)``
+        triples; ``high`` is exclusive and None for the open top range.
+    """
+    return [
+        (f'{low}-{"" if high is None else high}', Decimal(low), None if high is None else Decimal(high))
+        for low, high in settings.BOOKS_PRICE_FACETS
+    ]
+
+
+def parse(params):
+    """
+    Read the facet selection from query parameters.
+
+    Unknown or malformed values are dropped rather than rejected, so a
+    stale link still shows a listing.
+
+    Args:
+        params (QueryDict): The request's GET parameters.
+
+    Returns:
+        dict[str, str]: Selected value per facet name.
+    """
+    selected = {}
+    if params.get('price') in {key for key, _, _ in price_buckets()}:
+        selected['price'] = params['price']
+    if params.get('author', '').strip():
+        selected['author'] = params['author'].strip()[:100]
+    try:
+        if 1 <= int(params.get('year', '')) <= 9999:
+            selected['year'] = str(int(params['year']))
+    except ValueError:
+        pass
+    if params.get('state') in STATES:
+        selected['state'] = params['state']
+    return selected
+
+
+def condition(name, value):
+    """
+    Return the filter for one selected facet value.
+
+    Args:
+        name (str): Facet name.
+        value (str): Value as returned by :func:`parse`.
+
+    Returns:
+        Q: A condition on :class:`Book`.
+    """
+    if name == 'price':
+        _, low, high = next(bucket for bucket in price_buckets() if bucket[0] == value)
+        return Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q())
+    if name == 'author':
+        return Q(author=value)
+    if name == 'year':
+        return Q(release_year=int(value))
+    return STATES[value]
+
+
+def apply(queryset, selected, exclude=None):
+    """
+    Narrow a book queryset to the selected facet values.
+
+    Args:
+        queryset (QuerySet): Books to filter.
+        selected (dict[str, str]): Selection from :func:`parse`.
+        exclude (str, optional): Facet to leave unfiltered.
+
+    Returns:
+        QuerySet: The filtered queryset.
+    """
+    for name, value in selected.items():
+        if name != exclude:
+            queryset = queryset.filter(condition(name, value))
+    return queryset
+
+
+def _summary_condition(name, value):
+    """:func:`condition`, restated over the :class:`FacetCount` columns."""
+    if name == 'price':
+        return Q(price_band=value)
+    return condition(name, value)
+
+
+def _grouped(selected, name, value):
+    """
+    One facet's ``(facet, value, count)`` rows, grouped in SQL.
+
+    ``value`` is the :class:`FacetCount` column to group by, or for the
+    state facet the state to count.
+    """
+    rows = FacetCount.objects.order_by()
+    for other, selected_value in selected.items():
+        if other != name:
+            rows = rows.filter(_summary_condition(other, selected_value))
+    if name == 'state':
+        rows = rows.filter(STATES[value])
+        value = Value(value, output_field=CharField())
+    else:
+        value = Cast(value, CharField())
+    return (
+        rows.annotate(facet=Value(name, output_field=CharField()), value=value)
+        .values('facet', 'value')
+        .annotate(count=Sum('books'))
+    )
+
+
+def _price_band():
+    return Case(
+        *[
+            When(Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q()), then=Value(key))
+            for key, low, high in price_buckets()
+        ],
+        default=Value(''),
+        output_field=CharField(),
+    )
+
+
+def compute_counts(selected):
+    """
+    Count the books behind every facet value in one query.
+
+    Args:
+        selected (dict[str, str]): Selection from :func:`parse`.
+
+    Returns:
+        dict[str, list[tuple[str, int]]]: ``(value, count)`` pairs per
+        facet: price ranges in configured order, the
+        ``BOOKS_FACET_AUTHORS`` most common authors, years newest first,
+        then states. Values without books are left out.
+    """
+    parts = [
+        _grouped(selected, 'price', 'price_band'),
+        _grouped(selected, 'author', 'author'),
+        _grouped(selected, 'year', 'release_year'),
+        *[_grouped(selected, 'state', state) for state in STATES],
+    ]
+    counts = {'price': {}, 'author': {}, 'year': {}, 'state': {}}
+    for row in parts[0].union(*parts[1:], all=True):
+        if row['value'] not in (None, '') and row['count']:
+            counts[row['facet']][str(row['value'])] = row['count']
+
+    authors = sorted(counts['author'].items(), key=lambda item: (-item[1], item[0]))
+    top_authors = authors[:settings.BOOKS_FACET_AUTHORS]
+    if 'author' in selected and selected['author'] not in dict(top_authors):
+        top_authors.append((selected['author'], counts['author'].get(selected['author'], 0)))
+    return {
+        'price': [(key, counts['price'][key]) for key, _, _ in price_buckets() if key in counts['price']],
+        'author': top_authors,
+        'year': sorted(counts['year'].items(), key=lambda item: int(item[0]), reverse=True),
+        'state': [(state, counts['state'][state]) for state in STATES if state in counts['state']],
+    }
+
+
+def rebuild():
+    """
+    Regenerate the :class:`FacetCount` summary from the catalog.
+
+    One grouped scan of the books; the summary is replaced in a single
+    transaction, so readers never see it half-built.
+
+    Returns:
+        int: Number of summary rows written.
+    """
+    groups = (
+        Book.objects.order_by()
+        .annotate(price_band=_price_band())
+        .values('price_band', 'author', 'release_year', 'is_popular', 'is_upcoming')
+        .annotate(books=Count('pk'))
+    )
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        created = FacetCount.objects.bulk_create((FacetCount(**group) for group in groups.iterator()), batch_size=5000)
+    transaction.on_commit(lambda: bump_version(NAMESPACE))
+    return len(created)
+
+
+def schedule_rebuild():
+    """
+    Queue a :func:`rebuild` after a book changed.
+
+    Saves within the same ``BOOKS_FACET_REBUILD_DELAY`` window share one
+    job, which runs when the window closes.
+    """
+    delay = settings.BOOKS_FACET_REBUILD_DELAY
+    now = timezone.now()
+    window, elapsed = divmod(now.timestamp(), delay)
+    jobs.enqueue(
+        'rebuild_facets', idempotency_key=f'facets:{int(window)}', run_at=now + timedelta(seconds=delay - elapsed),
+    )
+
+
+def ensure_facet_counts(sender, using, **kwargs):
+    """
+    ``post_migrate`` receiver that builds the summary if it is missing.
+
+    Args:
+        sender (AppConfig): The app whose migrations just ran.
+        using (str): Alias of the database that was migrated.
+    """
+    if using == DEFAULT_DB_ALIAS and not FacetCount.objects.exists() and Book.objects.exists():
+        rebuild()
+
+
+def counts(selected):
+    """
+    Return the facet counts for a selection, from the cache when possible.
+
+    Args:
+        selected (dict[str, str]): Selection from :func:`parse`.
+
+    Returns:
+        dict[str, list[tuple[str, int]]]: See :func:`compute_counts`.
+    """
+    digest = hashlib.blake2b(repr(sorted(selected.items())).encode(), digest_size=12).hexdigest()
+    return get_or_build(
+        versioned_key(NAMESPACE, digest), lambda: compute_counts(selected), timeout=settings.BOOKS_FACET_CACHE_TIMEOUT,
+    )
+
+
+LABELS = {'price': 'Price', 'author': 'Author', 'year': 'Released', 'state': 'Show'}
+
+
+def _value_label(name, value):
+    if name == 'price':
+        low, high = value.split('-')
+        return f'R{low}+' if not high else f'R{low}–R{high}'
+    if name == 'state':
+        return value.capitalize()
+    return value
+
+
+def links(params, counted, selected):
+    """
+    Build the facet menus for the listing template.
+
+    Each option links to the current listing with that value toggled and
+    the cursor dropped, so choosing a facet starts again at page one.
+
+    Args:
+        params (QueryDict): The request's GET parameters.
+        counted (dict): Counts from :func:`counts`.
+        selected (dict[str, str]): Selection from :func:`parse`.
+
+    Returns:
+        list[dict]: One ``{'name', 'label', 'options'}`` entry per facet;
+        options carry 'label', 'count', 'active' and 'url'.
+    """
+    groups = []
+    for name, values in counted.items():
+        options = []
+        for value, count in values:
+            query = params.copy()
+            query.pop('cursor', None)
+            active = selected.get(name) == value
+            if active:
+                query.pop(name, None)
+            else:
+                query[name] = value
+            options.append({
+                'label': _value_label(name, value), 'count': count, 'active': active, 'url': f'?{query.urlencode()}',
+            })
+        if options:
+            groups.append({'name': name, 'label': LABELS[name], 'options': options})
+    return groups
@@ -1,8 +1,60 @@
 from django import forms
 from .models import UpcomingBook
+from .uploads import check_image, check_size
 
 class UpcomingBookForm(forms.ModelForm):
     '''Form for creating or updating an upcoming book entry.'''
     class Meta:
         model = UpcomingBook
-        fields = ['title', 'author', 'description', 'release_date', 'cover_image']
+        fields = ['title', 'author', 'description', 'release_date', 'price', 'cover_image']
+
+    def clean_cover_image(self):
+        '''
+        Apply the upload limits of `books.uploads` to a newly uploaded cover.
+
+        Django has only read the image's header by now, so this works for
+        uploads that did not go through `CoverUploadHandler`, e.g. from
+        the admin.
+        '''
+        cover = self.cleaned_data.get('cover_image')
+        image = getattr(cover, 'image', None)
+        if image is not None:
+            check_size(cover.size)
+            check_image(image)
+        return cover
+
+
+
+class BookImportValidator:
+    '''
+    Validates rows of a bulk catalog import (see `manage.py import_books`).
+
+    Uses the form field classes directly rather than a Form, because a
+    Form deep-copies its fields on every instantiation, which dominates
+    the cost of validating hundreds of thousands of rows.
+    '''
+    fields = {
+        'isbn': forms.CharField(max_length=17),
+        'title': forms.CharField(max_length=200),
+        'author': forms.CharField(max_length=100),
+        'description': forms.CharField(required=False),
+        'price': forms.DecimalField(max_digits=6, decimal_places=2, min_value=0),
+        'release_date': forms.DateField(required=False),
+        'is_upcoming': forms.BooleanField(required=False),
+        'cover': forms.CharField(max_length=255, required=False),
+    }
+
+    def clean(self, row):
+        '''Return ``(cleaned_data, errors)`` for one input row.'''
+        data, errors = {}, {}
+        for name, field in self.fields.items():
+            try:
+                data[name] = field.clean(row.get(name))
+            except forms.ValidationError as exc:
+                errors[name] = exc.messages
+        if 'isbn' in data:
+            isbn = data['isbn'].replace('-', '').replace(' ', '').upper()
+            if len(isbn) not in (10, 13) or not isbn[:-1].isdigit():
+                errors['isbn'] = ['Enter a 10 or 13 character ISBN.']
+            data['isbn'] = isbn
+        return data, errors
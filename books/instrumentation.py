@@ -0,0 +1,255 @@
+"""
+Per-request query and rendering instrumentation.
+
+:class:`QueryBudgetMiddleware` opens a :class:`RequestProfile` for each
+request. :func:`record_query`, installed on every database connection as an
+execute wrapper, and :class:`InstrumentedTemplates`, the template backend,
+fill it in. Each response then gets:
+
+* with ``BOOKS_SERVER_TIMING``, a ``Server-Timing`` header (``db``,
+  ``render`` and ``total`` durations, plus the query count), visible in the
+  browser's network panel;
+* one JSON log line on the ``books.performance`` logger, which
+  ``manage.py perf_report`` aggregates per view;
+* a check against the view's budget in ``BOOKS_QUERY_BUDGETS``, which logs
+  a warning or, with ``BOOKS_QUERY_BUDGET_MODE = 'raise'``, raises
+  :class:`QueryBudgetExceeded`.
+
+Queries that repeat with the same SQL shape (``IN`` lists collapsed) are
+counted as duplicates; a high count usually means an N+1 loop.
+"""
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('books.performance')
+
+_profile = contextvars.ContextVar('books_request_profile', default=None)
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """A view went over its budget while ``BOOKS_QUERY_BUDGET_MODE`` is 'raise'."""
+
+
+@dataclass
+class RequestProfile:
+    """
+    What one request spent its time on.
+
+    Attributes:
+        queries (int): Number of SQL statements executed.
+        sql_time (float): Seconds spent executing them.
+        render_time (float): Seconds spent rendering templates, excluding
+            SQL issued while rendering.
+        signatures (Counter): Normalized SQL -> number of executions.
+    """
+    queries: int = 0
+    sql_time: float = 0.0
+    render_time: float = 0.0
+    signatures: Counter = field(default_factory=Counter)
+
+    @property
+    def duplicates(self):
+        """Executions of a SQL shape beyond its first."""
+        return sum(count - 1 for count in self.signatures.values())
+
+    def worst_duplicate(self):
+        """Return ``(sql, count)`` of the most repeated shape, or None."""
+        if not self.signatures:
+            return None
+        sql, count = self.signatures.most_common(1)[0]
+        return (sql, count) if count > 1 else None
+
+
+def signature(sql):
+    """
+    Reduce a SQL statement to its shape for duplicate detection.
+
+    Parameters are already placeholders; ``IN (%s, %s, ...)`` lists are
+    collapsed so batches of different sizes share a signature.
+
+    Args:
+        sql (str): The statement as passed to the cursor.
+
+    Returns:
+        str: The normalized statement.
+    """
+    return _IN_LIST.sub('(%s, ...)', sql)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper that times a statement into the current profile.
+
+    Installed on every connection by :func:`install_query_recorder`; does
+    nothing outside an instrumented request.
+    """
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.sql_time += time.perf_counter() - started
+        profile.queries += 1
+        profile.signatures[signature(sql)] += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """``connection_created`` receiver that adds :func:`record_query`."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class _TimedTemplate:
+    """Wraps a backend template to time ``render()`` into the profile."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _profile.get()
+        if profile is None:
+            return self.template.render(context, request)
+        started, sql_before = time.perf_counter(), profile.sql_time
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.render_time += time.perf_counter() - started - (profile.sql_time - sql_before)
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """The Django template backend, with render time recorded per request."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+def budget_for(view_name):
+    """
+    Return the limits that apply to a view.
+
+    Args:
+        view_name (str): The URL name of the view.
+
+    Returns:
+        dict: ``BOOKS_QUERY_BUDGETS['*']`` overlaid with the view's entry.
+    """
+    budgets = settings.BOOKS_QUERY_BUDGETS
+    return {**budgets.get('*', {}), **budgets.get(view_name, {})}
+
+
+def over_budget(profile, budget):
+    """
+    Compare a profile with a budget.
+
+    Args:
+        profile (RequestProfile): The finished request's profile.
+        budget (dict): Limits on 'queries', 'duplicates', 'sql_ms' and
+            'render_ms'; missing keys are unlimited.
+
+    Returns:
+        list[str]: One message per exceeded limit.
+    """
+    measured = {
+        'queries': profile.queries,
+        'duplicates': profile.duplicates,
+        'sql_ms': profile.sql_time * 1000,
+        'render_ms': profile.render_time * 1000,
+    }
+    return [
+        f'{name} {measured[name]:g} > {limit:g}'
+        for name, limit in budget.items()
+        if name in measured and measured[name] > limit
+    ]
+
+
+class QueryBudgetMiddleware:
+    """Profile each request, report it and enforce the view's budget."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self._finish(request, response, profile, started)
+
+    async def __acall__(self, request):
+        profile, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self._finish(request, response, profile, started)
+
+    def _start(self):
+        profile = RequestProfile()
+        return profile, _profile.set(profile), time.perf_counter()
+
+    def _finish(self, request, response, profile, started):
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view_name = (match.view_name if match else None) or 'unresolved'
+
+        if settings.BOOKS_SERVER_TIMING:
+            timing = (
+                f'db;dur={profile.sql_time * 1000:.1f};desc="{profile.queries} queries", '
+                f'render;dur={profile.render_time * 1000:.1f}, total;dur={total * 1000:.1f}'
+            )
+            existing = response.headers.get('Server-Timing')
+            response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        mode = settings.BOOKS_QUERY_BUDGET_MODE
+        exceeded = over_budget(profile, budget_for(view_name)) if mode != 'off' else []
+        worst = profile.worst_duplicate()
+        record = {
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'duplicates': profile.duplicates,
+            'sql_ms': round(profile.sql_time * 1000, 2),
+            'render_ms': round(profile.render_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'worst_duplicate': {'sql': worst[0][:300], 'count': worst[1]} if worst else None,
+            'over_budget': exceeded,
+        }
+        logger.info(json.dumps(record))
+
+        if exceeded:
+            message = f'{view_name} over budget: {"; ".join(exceeded)}'
+            if worst:
+                message += f' (most repeated query x{worst[1]}: {worst[0][:200]})'
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
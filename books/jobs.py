@@ -0,0 +1,205 @@
+"""
+A small database-backed job queue.
+
+Tasks are plain functions registered with the :func:`task` decorator (see
+:mod:`books.tasks`). :func:`enqueue` stores a :class:`~books.models.Job`
+row, and the ``runworker`` management command claims due jobs and runs
+them on a thread or process pool.
+
+Failed jobs are retried with exponential backoff until ``max_attempts`` is
+reached. Jobs left ``running`` by a crashed worker are requeued once their
+lock is older than ``BOOKS_JOBS_LOCK_TIMEOUT`` seconds, so tasks should be
+safe to run more than once. The crashed run counts as an attempt, so a job
+that keeps killing its worker fails instead of looping. Finished jobs are
+deleted ``BOOKS_JOBS_RETENTION_DAYS`` after they finish.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name=None):
+    """
+    Register a function as a task that can be enqueued by name.
+
+    Args:
+        name (str, optional): Task name; defaults to the function name.
+
+    Returns:
+        callable: Decorator returning the function unchanged.
+    """
+    def register(func):
+        TASKS[name or func.__name__] = func
+        return func
+    return register
+
+
+def enqueue(task_name, payload=None, idempotency_key=None, run_at=None, max_attempts=None):
+    """
+    Add a job to the queue.
+
+    If ``idempotency_key`` is given and a queued or running job has that
+    key, no new job is created and that one is returned. Keys of finished
+    jobs are free again, so the same work can be queued once more after it
+    succeeded or failed for good.
+
+    Args:
+        task_name (str): Name of a registered task.
+        payload (dict, optional): JSON-serialisable keyword arguments.
+        idempotency_key (str, optional): Deduplication key.
+        run_at (datetime, optional): Do not start before this time.
+        max_attempts (int, optional): Defaults to ``BOOKS_JOBS_MAX_ATTEMPTS``.
+
+    Returns:
+        Job: The new or pending job.
+
+    Raises:
+        KeyError: If no task is registered under ``task_name``.
+    """
+    if task_name not in TASKS:
+        raise KeyError(f'Unknown task {task_name!r}')
+    fields = {
+        'task': task_name,
+        'payload': payload or {},
+        'run_at': run_at or timezone.now(),
+        'max_attempts': max_attempts or settings.BOOKS_JOBS_MAX_ATTEMPTS,
+    }
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    pending = Job.objects.filter(idempotency_key=idempotency_key, status__in=Job.ACTIVE)
+    try:
+        with transaction.atomic():
+            job, _ = pending.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+    except IntegrityError:
+        # Another process queued the same key first.
+        job = pending.get()
+    return job
+
+
+def backoff(attempts):
+    """
+    Return the delay before retrying a job that has failed ``attempts`` times.
+
+    Doubles from ``BOOKS_JOBS_BACKOFF_BASE`` seconds up to
+    ``BOOKS_JOBS_BACKOFF_MAX``, with up to 10% random jitter so jobs that
+    failed together do not retry in lockstep.
+
+    Args:
+        attempts (int): Number of attempts made so far.
+
+    Returns:
+        timedelta: The retry delay.
+    """
+    delay = min(settings.BOOKS_JOBS_BACKOFF_BASE * 2 ** max(attempts - 1, 0), settings.BOOKS_JOBS_BACKOFF_MAX)
+    return timedelta(seconds=delay * (1 + random.random() / 10))
+
+
+def requeue_stale():
+    """
+    Return jobs whose worker died mid-run to the queue.
+
+    :func:`claim` already counted the crashed run in ``attempts``; jobs
+    that have used up ``max_attempts`` are marked failed instead.
+
+    Returns:
+        int: Number of jobs requeued or failed.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.BOOKS_JOBS_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    released = {'locked_by': '', 'locked_at': None, 'last_error': 'The worker stopped while running this job.'}
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, finished_at=now, **released)
+    if failed:
+        logger.error('%d job(s) left running by a stopped worker failed permanently.', failed)
+    return failed + stale.update(status=Job.QUEUED, **released)
+
+
+def prune_finished():
+    """
+    Delete jobs that finished more than ``BOOKS_JOBS_RETENTION_DAYS`` ago.
+
+    Returns:
+        int: Number of jobs deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.BOOKS_JOBS_RETENTION_DAYS)
+    deleted, _ = Job.objects.filter(status__in=(Job.SUCCEEDED, Job.FAILED), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def claim(worker_id, limit):
+    """
+    Atomically claim up to ``limit`` due jobs for a worker.
+
+    On databases with ``SELECT ... FOR UPDATE SKIP LOCKED`` the candidates
+    are locked while they are marked running. Elsewhere (SQLite) each
+    candidate is claimed with a conditional UPDATE, and candidates another
+    worker claimed first are simply skipped.
+
+    Args:
+        worker_id (str): Identifier recorded in ``locked_by``.
+        limit (int): Maximum number of jobs to claim.
+
+    Returns:
+        list[int]: Ids of the claimed jobs.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    claim_fields = {'status': Job.RUNNING, 'locked_by': worker_id, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claim_fields)
+        return ids
+
+    claimed = []
+    for job_id in due.values_list('id', flat=True)[:limit]:
+        if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(**claim_fields):
+            claimed.append(job_id)
+    return claimed
+
+
+def run(job_id):
+    """
+    Execute a claimed job and record the outcome.
+
+    Args:
+        job_id (int): Id of a job previously returned by :func:`claim`.
+
+    Returns:
+        str: The job's resulting status.
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        func = TASKS[job.task]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            status, retry_at, finished_at = Job.QUEUED, timezone.now() + backoff(job.attempts), None
+            logger.warning('Job %s (%s) failed; retrying at %s.', job.pk, job.task, retry_at)
+        else:
+            status, retry_at, finished_at = Job.FAILED, job.run_at, timezone.now()
+            logger.error('Job %s (%s) failed permanently.', job.pk, job.task)
+        Job.objects.filter(pk=job.pk).update(
+            status=status, run_at=retry_at, last_error=error, locked_by='', locked_at=None,
+            finished_at=finished_at,
+        )
+        return status
+
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.SUCCEEDED, last_error='', locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+    return Job.SUCCEEDED
@@ -0,0 +1,114 @@
+import random
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from books.db import sqlite_pragmas
+from books.models import Book, Review
+
+SCRATCH_TABLE = 'books_benchmark_write'
+
+
+def _read(book_ids):
+    """One catalog page plus one book with its newest reviews."""
+    book_id = random.randint(*book_ids)
+    list(Book.objects.only('id', 'title', 'author', 'price', 'cover_image')
+         .filter(title__gte=random.choice(string.ascii_uppercase)).order_by('title', 'id')[:24])
+    list(Book.objects.filter(pk=book_id)[:1])
+    list(Review.objects.filter(book_id=book_id).order_by('-created_at', '-id')[:20])
+
+
+def _write(book_ids):
+    """A short write transaction, like adding a review or a cart item."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SCRATCH_TABLE} (book_id, created_at) VALUES (%s, %s)',
+            [random.randint(*book_ids), timezone.now().isoformat()],
+        )
+
+
+def _client(role, book_ids, deadline):
+    """Run one kind of operation in a loop until ``deadline``; return timings."""
+    operation = _write if role == 'write' else _read
+    latencies, errors = [], 0
+    close_old_connections()
+    try:
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(book_ids)
+            except OperationalError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        connections.close_all()
+    return role, latencies, errors
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+class Command(BaseCommand):
+    """Measure read/write throughput and latency under concurrent clients."""
+
+    help = (
+        'Run concurrent reader and writer processes against the database and report '
+        'throughput, latency percentiles and "database is locked" errors. Writes go to '
+        'a scratch table that is dropped afterwards; the catalog is only read.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Reader processes (default: %(default)s).')
+        parser.add_argument('--writers', type=int, default=4, help='Writer processes (default: %(default)s).')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        bounds = Book.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stderr.write('The catalog is empty; import some books first.')
+            return
+        book_ids = (bounds['low'], bounds['high'])
+
+        if connection.vendor == 'sqlite':
+            pragmas = ', '.join(f'{name}={value}' for name, value in sqlite_pragmas(connection).items())
+            self.stdout.write(f'SQLite pragmas: {pragmas}')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {SCRATCH_TABLE} '
+                '(id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL, created_at VARCHAR(40) NOT NULL)'
+            )
+        connections.close_all()
+
+        roles = ['read'] * options['readers'] + ['write'] * options['writers']
+        deadline = time.time() + options['duration']
+        results = {'read': ([], 0), 'write': ([], 0)}
+        try:
+            with ProcessPoolExecutor(max_workers=len(roles)) as pool:
+                futures = [pool.submit(_client, role, book_ids, deadline) for role in roles]
+                for future in futures:
+                    role, latencies, errors = future.result()
+                    merged, failed = results[role]
+                    results[role] = (merged + latencies, failed + errors)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {SCRATCH_TABLE}')
+
+        for role, clients in (('read', options['readers']), ('write', options['writers'])):
+            latencies, errors = results[role]
+            if not clients:
+                continue
+            latencies.sort()
+            self.stdout.write(
+                f'{role:>5}: {clients} client(s), {len(latencies) / options["duration"]:,.0f} ops/s, '
+                f'p50 {_percentile(latencies, 0.50) * 1000:.1f} ms, '
+                f'p95 {_percentile(latencies, 0.95) * 1000:.1f} ms, '
+                f'p99 {_percentile(latencies, 0.99) * 1000:.1f} ms, '
+                f'{errors} locked error(s)'
+            )
@@ -0,0 +1,215 @@
+import json
+import logging
+import platform
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from books import synthetic
+from books.models import Book
+from books.pagination import encode_cursor
+
+
+def _scenarios(catalog):
+    """Map scenario name -> function returning (path, params, headers, login)."""
+    book_ids, hot_book = catalog['book_ids'], catalog['book_ids'][0]
+    return {
+        'home': lambda: (reverse('home'), {}, {}, False),
+        'book_list': lambda: (reverse('book_list'), {}, {}, False),
+        'book_list_deep_page': lambda: (reverse('book_list'), {'sort': 'price', 'cursor': catalog['deep_cursor']}, {}, False),
+        'book_list_faceted': lambda: (reverse('book_list'), {'year': '2020', 'state': 'popular'}, {}, False),
+        'search': lambda: (reverse('book_list'), {'q': random.choice(synthetic.WORDS)}, {}, False),
+        'popular_books': lambda: (reverse('popular_books'), {}, {}, False),
+        'autocomplete': lambda: (reverse('book_autocomplete'), {'q': random.choice(synthetic.WORDS)[:3]}, {}, False),
+        'book_detail': lambda: (reverse('book_detail', args=[random.choice(book_ids)]), {}, {}, False),
+        'book_detail_hot': lambda: (reverse('book_detail', args=[hot_book]), {}, {}, False),
+        'book_reviews': lambda: (reverse('book_reviews', args=[hot_book]), {'cursor': catalog['review_cursor']}, {}, False),
+        'upcoming_books': lambda: (reverse('upcoming_books'), {}, {}, False),
+        'api_books': lambda: (reverse('api_books'), {'fields': 'id,title,price'}, {}, False),
+        'api_book_not_modified': lambda: (
+            reverse('api_book', args=[hot_book]), {}, {'HTTP_IF_NONE_MATCH': catalog['hot_etag']}, False,
+        ),
+        'cart_detail': lambda: (reverse('cart_detail'), {}, {}, True),
+    }
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    """Measure view latency and throughput at several catalog sizes."""
+
+    help = (
+        'Fill a throwaway test database with synthetic catalogs of increasing size, '
+        'request each catalog view through the test client and write per-view latency '
+        'percentiles, throughput and query counts as JSON. Pass --compare to diff the '
+        'run against an earlier results file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,100000,1000000',
+            help='Comma-separated catalog sizes in books, ascending (default: %(default)s).',
+        )
+        parser.add_argument('--reviews-per-book', type=float, default=5, help='Default: %(default)s.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per view (default: %(default)s).')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads (default: %(default)s).')
+        parser.add_argument('--views', help='Comma-separated subset of scenarios to run.')
+        parser.add_argument('--seed', type=int, default=0, help='Data and request seed (default: %(default)s).')
+        parser.add_argument('--output', help='Write results to this JSON file.')
+        parser.add_argument('--compare', help='Earlier results file to compare against.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Relative p50 slowdown reported as a regression (default: %(default)s).',
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers.')
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as stream:
+                previous = json.load(stream)
+        random.seed(options['seed'])
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        performance_log = logging.getLogger('books.performance')
+        performance_log.disabled = True
+        try:
+            with override_settings(BOOKS_QUERY_BUDGET_MODE='off'):
+                results = self._run(sizes, options)
+        finally:
+            performance_log.disabled = False
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'seed': options['seed'],
+            },
+            'sizes': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, indent=2)
+            self.stdout.write(f'Wrote {options["output"]}.')
+        if previous:
+            self._compare(previous, report, options['tolerance'])
+
+    def _run(self, sizes, options):
+        results = {}
+        created = 0
+        for step, size in enumerate(sizes):
+            if size > created:
+                started = time.monotonic()
+                synthetic.generate(
+                    books=size - created, reviews=int((size - created) * options['reviews_per_book']),
+                    users=50 if step == 0 else 0, upcoming=20 if step == 0 else 0,
+                    seed=options['seed'] + step, prefix=f'bench{step}',
+                )
+                created = size
+                self.stdout.write(f'Generated {size} books in {time.monotonic() - started:.1f}s.')
+            results[str(size)] = self._measure(self._catalog(), options)
+        return results
+
+    def _catalog(self):
+        """Ids and cursors the scenarios need, looked up once per size."""
+        book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        middle = Book.objects.order_by('price', 'id').values_list('price', 'id')[len(book_ids) // 2]
+        client = Client()
+        detail = client.get(reverse('book_detail', args=[book_ids[0]]))
+        return {
+            'book_ids': book_ids,
+            'deep_cursor': encode_cursor(middle),
+            'review_cursor': detail.context['reviews'].next_cursor if detail.context else None,
+            'hot_etag': client.get(reverse('api_book', args=[book_ids[0]]))['ETag'],
+            'user': User.objects.filter(username__startswith='bench0-').first(),
+        }
+
+    def _measure(self, catalog, options):
+        scenarios = _scenarios(catalog)
+        if options['views']:
+            unknown = set(options['views'].split(',')) - set(scenarios)
+            if unknown:
+                raise CommandError(f'Unknown view(s): {", ".join(sorted(unknown))}')
+            scenarios = {name: scenarios[name] for name in options['views'].split(',')}
+
+        measured = {}
+        for name, scenario in scenarios.items():
+            clients = [Client() for _ in range(max(1, options['concurrency']))]
+            if scenario()[3]:
+                for client in clients:
+                    client.force_login(catalog['user'])
+
+            def request(index, scenario=scenario, clients=clients):
+                path, params, headers, _ = scenario()
+                started = time.perf_counter()
+                clients[index % len(clients)].get(path, params, **headers)
+                return time.perf_counter() - started
+
+            for index in range(3):
+                request(index)
+            with CaptureQueriesContext(connection) as queries:
+                request(0)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+                latencies = sorted(pool.map(request, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+            measured[name] = {
+                'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+                'rps': round(len(latencies) / elapsed, 1),
+                'queries': len(queries),
+            }
+            self.stdout.write(
+                f'{len(catalog["book_ids"]):>8} books  {name:<24} p50 {measured[name]["p50_ms"]:>8.2f} ms  '
+                f'p95 {measured[name]["p95_ms"]:>8.2f} ms  {measured[name]["rps"]:>8.1f} req/s  '
+                f'{measured[name]["queries"]} queries'
+            )
+        return measured
+
+    def _compare(self, previous, report, tolerance):
+        self.stdout.write('\nComparison with the earlier run (p50, new / old):')
+        regressions = 0
+        for size, views in report['sizes'].items():
+            for name, result in views.items():
+                old = previous.get('sizes', {}).get(size, {}).get(name)
+                if not old or not old['p50_ms']:
+                    continue
+                ratio = result['p50_ms'] / old['p50_ms']
+                line = (
+                    f'{size:>8} books  {name:<24} {old["p50_ms"]:>8.2f} -> {result["p50_ms"]:>8.2f} ms '
+                    f'(x{ratio:.2f}), queries {old["queries"]} -> {result["queries"]}'
+                )
+                if ratio > 1 + tolerance or result['queries'] > old['queries']:
+                    regressions += 1
+                    self.stdout.write(self.style.WARNING(line + '  REGRESSION'))
+                else:
+                    self.stdout.write(line)
+        self.stdout.write(f'{regressions} regression(s).')
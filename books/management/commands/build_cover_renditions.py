@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from books import renditions
+from books.models import Book, UpcomingBook
+
+
+class Command(BaseCommand):
+    """Generate cover renditions for every existing book and upcoming book."""
+
+    help = 'Backfill resized WebP/JPEG cover renditions using a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes (default: one per CPU).',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate renditions that already exist.',
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Book, UpcomingBook):
+            names.update(
+                model.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+                .values_list('cover_image', flat=True)
+            )
+        if not names:
+            self.stdout.write('No covers to process.')
+            return
+
+        # Worker processes only touch file storage; do not share sockets
+        # or file handles of open database connections with them.
+        connections.close_all()
+
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            results = pool.map(
+                renditions.generate_safely, sorted(names), [options['force']] * len(names), chunksize=8,
+            )
+            for name, written, error in results:
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                elif written:
+                    built += 1
+        skipped = len(names) - built - failed
+        self.stdout.write(self.style.SUCCESS(
+            f'Built renditions for {built} cover(s); {skipped} already up to date; {failed} failed.'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from books import recommendations
+
+
+class Command(BaseCommand):
+    """Recompute the "readers also reviewed" recommendation lists."""
+
+    help = (
+        'Recompute the stored "readers also reviewed" lists of every book touched '
+        'by reviews written since the last build, or of every book with --full. '
+        'Meant to run periodically; run --full after bulk imports or setting changes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every list.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, help='Lists replaced per transaction (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        result = recommendations.build(full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Rebuilt" if result.full else "Updated"} recommendations for {result.books} book(s); '
+            f'{result.neighbours} stored.'
+        ))
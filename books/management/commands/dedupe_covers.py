@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from books import covers
+
+
+class Command(BaseCommand):
+    """Move existing covers into content-addressed storage, once per distinct image."""
+
+    help = (
+        'Store every cover still kept under its upload name (book_covers/, '
+        'upcoming_book_covers/) once per distinct image in content-addressed '
+        'storage, repoint the rows, delete the old copies and recount '
+        'references. --prune also deletes unused covers past their grace period.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing it.')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Also delete unreferenced covers and files in the upload directories that no row uses.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        result = covers.dedupe(dry_run=dry_run, delete_orphans=options['prune'])
+        for name in result.missing:
+            self.stderr.write(f'{name}: referenced but missing from storage.')
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.moved} cover(s) into {result.stored} stored image(s): '
+            f'{result.bytes_before:,} -> {result.bytes_after:,} bytes.'
+        ))
+        if result.orphans:
+            action = 'deleted' if options['prune'] and not dry_run else 'left in place (use --prune)'
+            self.stdout.write(f'{len(result.orphans)} unreferenced upload(s) {action}.')
+        if options['prune'] and not dry_run:
+            deleted, freed = covers.prune()
+            self.stdout.write(f'Pruned {deleted} unused stored cover(s), {freed:,} bytes.')
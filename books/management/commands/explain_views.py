@@ -0,0 +1,194 @@
+import logging
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+
+from books import synthetic
+
+# (name, URL name, URL argument, query parameters, needs a logged-in user).
+# The argument is 'book' for the most reviewed book, 'upcoming' for an
+# upcoming book, or None.
+SCENARIOS = [
+    ('home', 'home', None, {}, False),
+    ('book_list', 'book_list', None, {}, False),
+    ('book_list_by_price', 'book_list', None, {'sort': 'price'}, False),
+    ('book_list_by_year', 'book_list', None, {'year': '2020', 'sort': 'price'}, False),
+    ('book_list_popular', 'book_list', None, {'state': 'popular'}, False),
+    ('search', 'book_list', None, {'q': 'silent garden'}, False),
+    ('popular_books', 'popular_books', None, {}, False),
+    ('book_autocomplete', 'book_autocomplete', None, {'q': 'si'}, False),
+    ('book_detail', 'book_detail', 'book', {}, False),
+    ('book_reviews', 'book_reviews', 'book', {}, False),
+    ('upcoming_books', 'upcoming_books', None, {}, False),
+    ('upcoming_book_detail', 'upcoming_book_detail', 'upcoming', {}, False),
+    ('cart_detail', 'cart_detail', None, {}, True),
+    ('api_books', 'api_books', None, {}, False),
+    ('api_books_by_title', 'api_books', None, {'sort': 'title'}, False),
+    ('api_book', 'api_book', 'book', {}, False),
+    ('api_book_reviews', 'api_book_reviews', 'book', {}, False),
+    ('api_upcoming_books', 'api_upcoming_books', None, {}, False),
+]
+
+# Tables a view reads in full by design, under '*' for every view. The
+# autocomplete index is built from every book, once per cache version, and
+# facet counts are added up from the whole (small) facet summary.
+EXPECTED_SCANS = {
+    '*': {'books_facetcount'},
+    'book_autocomplete': {'books_book'},
+}
+
+# Views whose sorts no index can serve: search ranks its matches by bm25
+# score, and the cart sorts one cart's items after the window totals.
+EXPECTED_SORTS = {'search', 'cart_detail'}
+
+# Plan lines that mean a full table read or a sort without an index, per vendor.
+PLAN_PATTERNS = {
+    'sqlite': (
+        re.compile(r'^SCAN (?P<table>\w+)\b(?! VIRTUAL TABLE)(?!.*\bUSING\b)'),
+        re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|GROUP BY|DISTINCT)'),
+    ),
+    'postgresql': (
+        re.compile(r'Seq Scan on (?P<table>\w+)'),
+        re.compile(r'^\s*(?:->\s*)?Sort\b'),
+    ),
+}
+
+
+def explain(sql, params):
+    """
+    Return the query plan of a statement as a list of lines.
+
+    Args:
+        sql (str): The statement, with placeholders.
+        params (sequence): Its parameters.
+
+    Returns:
+        list[str]: One line per plan node.
+    """
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(sql, plan, expected_tables=(), sorts_expected=False):
+    """
+    Find full scans and index-less sorts in a query plan.
+
+    A scan that walks a table's primary key in order under a LIMIT, as the
+    first page of an id-ordered keyset listing does, stops early and is not
+    reported. Nor are sorts in a statement that only reads expected tables.
+
+    Args:
+        sql (str): The statement the plan is for.
+        plan (list[str]): Lines returned by :func:`explain`.
+        expected_tables (iterable[str]): Tables allowed to be scanned.
+        sorts_expected (bool): Do not report sorts.
+
+    Returns:
+        list[str]: The offending plan lines.
+    """
+    scan, sort = PLAN_PATTERNS[connection.vendor]
+    tables = {match.group(1) for match in re.finditer(r'(?:SCAN|SEARCH|Scan on) (\w+)', '\n'.join(plan))}
+    sorts_expected = sorts_expected or tables <= set(expected_tables)
+    problems = []
+    for line in plan:
+        match = scan.search(line)
+        if match:
+            table = match.group('table')
+            limited = re.search(rf'ORDER BY "{table}"\."id" (?:ASC|DESC) LIMIT', sql)
+            if table not in expected_tables and not limited:
+                problems.append(line.strip())
+        elif sort.search(line) and not sorts_expected:
+            problems.append(line.strip())
+    return problems
+
+
+class Command(BaseCommand):
+    """EXPLAIN every query the catalog views run and flag full table scans."""
+
+    help = (
+        'Fill a throwaway test database with a synthetic catalog, request each '
+        'catalog view, run EXPLAIN on every query it made and report full table '
+        'scans and sorts that no index serves.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20000, help='Catalog size (default: %(default)s).')
+        parser.add_argument('--reviews', type=int, default=100000, help='Default: %(default)s.')
+        parser.add_argument('--views', help='Comma-separated subset of scenarios to run.')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not just problems.')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if anything is flagged.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+    def handle(self, *args, **options):
+        scenarios = SCENARIOS
+        if options['views']:
+            names = options['views'].split(',')
+            unknown = set(names) - {scenario[0] for scenario in SCENARIOS}
+            if unknown:
+                raise CommandError(f'Unknown view(s): {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in SCENARIOS if scenario[0] in names]
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        performance_log = logging.getLogger('books.performance')
+        performance_log.disabled = True
+        try:
+            if connection.vendor not in PLAN_PATTERNS:
+                raise CommandError(f'EXPLAIN parsing is not implemented for {connection.vendor}.')
+            data = synthetic.generate(books=options['books'], reviews=options['reviews'], prefix='explain')
+            flagged = self._explain(scenarios, data, options['verbose_plans'])
+        finally:
+            performance_log.disabled = False
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(f'{flagged} flagged quer{"y" if flagged == 1 else "ies"}.')
+        if flagged and options['fail_on_scan']:
+            raise CommandError('Full table scans or unindexed sorts found.')
+
+    def _explain(self, scenarios, data, verbose):
+        arguments = {'book': data.book_ids[0], 'upcoming': data.upcoming_ids[0]}
+        user = User.objects.get(pk=data.user_ids[0])
+        flagged = 0
+        for name, url_name, argument, params, login in scenarios:
+            client = Client()
+            if login:
+                client.force_login(user)
+            cache.clear()
+            statements = []
+
+            def collect(execute, sql, sql_params, many, context):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    statements.append((sql, sql_params))
+                return execute(sql, sql_params, many, context)
+
+            url = reverse(url_name, args=[arguments[argument]] if argument else [])
+            with connection.execute_wrapper(collect):
+                response = client.get(url, params)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {len(statements)} queries, HTTP {response.status_code}'))
+
+            seen = set()
+            for sql, sql_params in statements:
+                if sql in seen:
+                    continue
+                seen.add(sql)
+                plan = explain(sql, sql_params)
+                expected = EXPECTED_SCANS['*'] | EXPECTED_SCANS.get(name, set())
+                problems = plan_problems(sql, plan, expected, name in EXPECTED_SORTS)
+                if problems or verbose:
+                    self.stdout.write(f'  {sql[:300]}')
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+                if problems:
+                    flagged += 1
+                    for line in problems:
+                        self.stdout.write(self.style.WARNING(f'  ! {line}'))
+        return flagged
@@ -0,0 +1,66 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from books import exports
+
+
+class Command(BaseCommand):
+    """Stream the book catalog or review history to a file."""
+
+    help = (
+        'Export books or reviews as CSV, JSONL or columnar JSON chunks without '
+        'loading the table into memory. Use --since/--since-id to export only '
+        'rows newer than a previous run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write to (default: standard output).')
+        parser.add_argument(
+            '--since', help='Only export reviews created after this ISO timestamp.',
+        )
+        parser.add_argument(
+            '--since-id', help='Only export rows after this id (the tie-breaker for --since).',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Rows fetched and written at a time (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        dataset = options['dataset']
+        try:
+            since = exports.parse_since(dataset, options['since'], options['since_id'])
+            rows = exports.export_rows(dataset, since=since, chunk_size=options['chunk_size'])
+        except (ValueError, ValidationError) as exc:
+            raise CommandError(f'Invalid watermark: {exc}')
+
+        last = {'count': 0}
+
+        def tracked(rows):
+            for row in rows:
+                last['row'] = row
+                last['count'] += 1
+                yield row
+
+        rows = tracked(rows)
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for chunk in exports.encode(dataset, rows, options['fmt'], chunk_size=options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if 'row' not in last:
+            self.stderr.write('No new rows to export.')
+            return
+        watermark = exports.watermark_of(dataset, last['row'])
+        if dataset == 'reviews':
+            resume = f'--since {watermark[0].isoformat()} --since-id {watermark[1]}'
+        else:
+            resume = f'--since-id {watermark[0]}'
+        self.stderr.write(self.style.SUCCESS(f"Exported {last['count']} row(s). Resume with: {resume}"))
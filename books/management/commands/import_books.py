@@ -0,0 +1,190 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from books import covers, facets, jobs
+from books.caching import bump_version
+from books.forms import BookImportValidator
+from books.models import Book
+from books.storage import cover_storage
+
+UPDATE_FIELDS = ['title', 'author', 'description', 'price', 'release_date', 'is_upcoming', 'updated_at']
+
+
+def read_records(path, fmt):
+    """Yield ``(record_number, dict)`` pairs from a CSV or JSON Lines file."""
+    with open(path, newline='', encoding='utf-8') as stream:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(stream), start=1):
+                yield number, row
+        else:
+            for number, line in enumerate((line for line in stream if line.strip()), start=1):
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield number, {'__error__': f'invalid JSON: {exc.msg}'}
+
+
+def batched(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    """Stream a publisher feed into the catalog in batched upserts."""
+
+    help = (
+        'Import books from a CSV or JSON Lines file, upserting on ISBN. Columns: isbn, title, '
+        'author, price, and optionally description, release_date, is_upcoming and cover '
+        '(a file name inside --covers-dir). Interrupted imports resume from a checkpoint.'
+    )
+
+    validator = BookImportValidator()
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON Lines file to import.')
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='Input format (default: guessed from the file extension).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per INSERT ... ON CONFLICT statement and transaction (default: %(default)s).',
+        )
+        parser.add_argument('--covers-dir', help='Directory containing the cover images named in the feed.')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Threads used to store cover images (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Checkpoint file recording committed progress (default: <path>.checkpoint).',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore any existing checkpoint and import from the first record.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        covers_dir = options['covers_dir']
+        batch_size = max(1, options['batch_size'])
+
+        done = 0 if options['restart'] else self.read_checkpoint(checkpoint_path, path)
+        if done:
+            self.stdout.write(f'Resuming after record {done}.')
+
+        records = islice(read_records(path, fmt), done, None)
+        imported = invalid = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for batch in batched(records, batch_size):
+                books = {}
+                for number, record in batch:
+                    book, error = self.validate(record, with_cover=bool(covers_dir))
+                    if error:
+                        invalid += 1
+                        self.stderr.write(f'Record {number}: {error}')
+                    else:
+                        books[book.isbn] = book
+                books = list(books.values())
+
+                covered = [book for book in books if book.cover_image]
+                for book, name in zip(covered, pool.map(self.store_cover, covered, [covers_dir] * len(covered))):
+                    book.cover_image = name
+                # Only rows with a stored cover replace one; the others, including
+                # every row without --covers-dir, leave existing covers untouched.
+                covered = [book for book in covered if book.cover_image]
+                uncovered = [book for book in books if not book.cover_image]
+
+                with transaction.atomic():
+                    # The upsert replaces these books' covers; move their references.
+                    previous = Book.objects.filter(isbn__in=[book.isbn for book in covered])
+                    covers.release(previous.values_list('cover_image', flat=True))
+                    for rows, update_fields in ((covered, UPDATE_FIELDS + ['cover_image']), (uncovered, UPDATE_FIELDS)):
+                        if rows:
+                            Book.objects.bulk_create(
+                                rows, update_conflicts=True, unique_fields=['isbn'], update_fields=update_fields,
+                            )
+                    covers.retain(book.cover_image.name for book in covered)
+                for name in {book.cover_image.name for book in covered}:
+                    jobs.enqueue('build_cover_renditions', {'name': name}, idempotency_key=f'renditions:{name}')
+                done = batch[-1][0]
+                imported += len(books)
+                self.write_checkpoint(checkpoint_path, path, done)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{done} records read, {imported} upserted, {invalid} invalid '
+                    f'({imported / elapsed if elapsed else 0:,.0f} rows/s)'
+                )
+
+        self.after_import()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} book(s); {invalid} invalid record(s).'))
+
+    def validate(self, record, with_cover):
+        """Return ``(Book, None)`` for a valid record or ``(None, error)``."""
+        if '__error__' in record:
+            return None, record['__error__']
+        data, errors = self.validator.clean(record)
+        if errors:
+            return None, '; '.join(f'{field}: {" ".join(messages)}' for field, messages in errors.items())
+        return Book(
+            isbn=data['isbn'],
+            title=data['title'],
+            author=data['author'],
+            description=data['description'],
+            price=data['price'],
+            release_date=data['release_date'],
+            is_upcoming=data['is_upcoming'],
+            cover_image=(data['cover'] or None) if with_cover else None,
+        ), None
+
+    def store_cover(self, book, covers_dir):
+        """Store a book's cover, once per distinct image, and return its stored name."""
+        filename = os.path.basename(str(book.cover_image))
+        source = os.path.join(covers_dir, filename)
+        if not os.path.isfile(source):
+            self.stderr.write(f'ISBN {book.isbn}: cover {filename} not found; importing without it.')
+            return None
+        with open(source, 'rb') as image:
+            return cover_storage().save(filename, File(image, name=filename))
+
+    def after_import(self):
+        """Refresh derived state that bulk writes bypass (they send no signals)."""
+        for namespace in ('home', 'autocomplete', 'cart-summary'):
+            bump_version(namespace)
+        facets.rebuild()
+
+    def read_checkpoint(self, checkpoint_path, path):
+        """Return the number of records already committed for ``path``."""
+        try:
+            with open(checkpoint_path) as stream:
+                checkpoint = json.load(stream)
+        except (OSError, ValueError):
+            return 0
+        if checkpoint.get('path') != os.path.abspath(path):
+            return 0
+        return int(checkpoint.get('records', 0))
+
+    def write_checkpoint(self, checkpoint_path, path, records):
+        """Atomically record that the first ``records`` records are committed."""
+        temporary = f'{checkpoint_path}.tmp'
+        with open(temporary, 'w') as stream:
+            json.dump({'path': os.path.abspath(path), 'records': records}, stream)
+        os.replace(temporary, checkpoint_path)
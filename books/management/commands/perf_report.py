@@ -0,0 +1,88 @@
+import json
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    """Summarise the books.performance log per view."""
+
+    help = (
+        'Aggregate the JSON lines written by books.instrumentation into a per-view '
+        'table of request counts, query counts, SQL/render/total time and budget '
+        'violations. Reads log files, or standard input when none are given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('logs', nargs='*', help='Log files (default: standard input).')
+        parser.add_argument(
+            '--sort', choices=['total', 'p95', 'queries', 'requests'], default='total',
+            help='Column to sort views by, descending (default: %(default)s).',
+        )
+
+    def _records(self, paths):
+        streams = [open(path, encoding='utf-8') for path in paths] if paths else [sys.stdin]
+        try:
+            for stream in streams:
+                for line in stream:
+                    start = line.find('{"view"')
+                    if start == -1:
+                        continue
+                    try:
+                        yield json.loads(line[start:])
+                    except ValueError:
+                        continue
+        finally:
+            for stream in streams:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    def handle(self, *args, **options):
+        views = defaultdict(list)
+        try:
+            for record in self._records(options['logs']):
+                views[record['view']].append(record)
+        except OSError as exc:
+            raise CommandError(exc)
+        if not views:
+            self.stdout.write('No performance records found.')
+            return
+
+        rows = []
+        for view, records in views.items():
+            totals = [record['total_ms'] for record in records]
+            queries = [record['queries'] for record in records]
+            rows.append({
+                'view': view,
+                'requests': len(records),
+                'queries': sum(queries) / len(records),
+                'max_queries': max(queries),
+                'duplicates': max(record['duplicates'] for record in records),
+                'sql': sum(record['sql_ms'] for record in records) / len(records),
+                'render': sum(record['render_ms'] for record in records) / len(records),
+                'p50': _percentile(totals, 0.50),
+                'p95': _percentile(totals, 0.95),
+                'total': sum(totals),
+                'over': sum(1 for record in records if record['over_budget']),
+            })
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        header = (
+            f'{"view":<24} {"reqs":>6} {"queries":>8} {"max q":>6} {"dupes":>6} '
+            f'{"sql ms":>8} {"render ms":>10} {"p50 ms":>8} {"p95 ms":>8} {"over":>5}'
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            line = (
+                f'{row["view"]:<24} {row["requests"]:>6} {row["queries"]:>8.1f} {row["max_queries"]:>6} '
+                f'{row["duplicates"]:>6} {row["sql"]:>8.2f} {row["render"]:>10.2f} '
+                f'{row["p50"]:>8.2f} {row["p95"]:>8.2f} {row["over"]:>5}'
+            )
+            self.stdout.write(self.style.WARNING(line) if row['over'] else line)
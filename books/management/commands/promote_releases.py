@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books import releases
+
+
+class Command(BaseCommand):
+    """Publish upcoming titles whose release date has arrived."""
+
+    help = (
+        'Create catalog books for every upcoming title released on or before '
+        'today (or --date), remove them from the upcoming listings and clear '
+        'is_upcoming on released catalog books. Meant to run daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Release cut-off as YYYY-MM-DD (default: today).')
+        parser.add_argument(
+            '--batch-size', type=int, default=500, help='Titles promoted per transaction (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date must be YYYY-MM-DD.')
+        result = releases.promote_due(today=today, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Promoted {result.promoted} upcoming title(s); released {result.released} catalog book(s).'
+        ))
+        if result.unpriced:
+            self.stdout.write(self.style.WARNING(
+                f'{result.unpriced} due title(s) have no price and were left scheduled.'
+            ))
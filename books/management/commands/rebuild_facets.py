@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from books import facets
+
+
+class Command(BaseCommand):
+    """Regenerate the catalog facet count summary."""
+
+    help = (
+        'Rebuild the FacetCount summary that catalog facet counts are read from. '
+        'Run after changing BOOKS_PRICE_FACETS or editing books outside Django.'
+    )
+
+    def handle(self, *args, **options):
+        rows = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt facet counts ({rows} summary row(s)).'))
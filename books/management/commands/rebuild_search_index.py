@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from books import search
+
+
+class Command(BaseCommand):
+    """Rebuild the full-text catalog search index from the ``Book`` table."""
+
+    help = 'Rebuild the full-text search index over book titles, authors and descriptions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to rebuild the index on (default: "default").',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index on "{connection.alias}".'))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books import facets, popularity
+from books.caching import bump_version
+
+
+class Command(BaseCommand):
+    """Recompute time-decayed popularity scores from recent reviews."""
+
+    help = (
+        'Recompute every book\'s time-decayed popularity score and flag the '
+        'highest-scoring books as popular. Overwrites manual is_popular flags.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float, default=settings.BOOKS_POPULARITY_HALF_LIFE_DAYS,
+            help='Days after which a review counts half as much (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--top', type=int, default=settings.BOOKS_POPULAR_COUNT,
+            help='Number of books to flag as popular (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        scored, ranked = popularity.recompute(half_life_days=options['half_life'], top=options['top'])
+        bump_version('home')
+        facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {scored} book(s); flagged {len(ranked)} as popular.'
+        ))
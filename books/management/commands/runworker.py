@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from books import jobs
+
+# Seconds between deletions of old finished jobs.
+PRUNE_INTERVAL = 3600
+
+
+def _run_job(job_id):
+    """Run one job in a pool worker, on a fresh database connection."""
+    close_old_connections()
+    try:
+        return job_id, jobs.run(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    """Run background jobs from the database queue until interrupted."""
+
+    help = 'Claim and execute queued background jobs on a thread or process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.BOOKS_JOBS_CONCURRENCY,
+            help='Number of jobs to run at once (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Run jobs in worker processes instead of threads (for CPU-bound tasks).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.BOOKS_JOBS_POLL_INTERVAL,
+            help='Seconds to sleep when the queue is empty (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue has no due jobs instead of waiting for more.',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+        if options['processes']:
+            # Spawn rather than fork: the pool starts children as jobs are
+            # submitted, by when this process holds an open (persistent)
+            # database connection that forked children would share.
+            pool = ProcessPoolExecutor(
+                max_workers=concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        else:
+            pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='books-worker')
+
+        self.stdout.write(f'Worker {worker_id} started with {concurrency} slot(s).')
+        running = set()
+        pruned_at = float('-inf')
+        try:
+            while not stopping.is_set():
+                jobs.requeue_stale()
+                claimed = jobs.claim(worker_id, concurrency - len(running)) if len(running) < concurrency else []
+                running.update(pool.submit(_run_job, job_id) for job_id in claimed)
+
+                if not running:
+                    if time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                        pruned_at = time.monotonic()
+                        jobs.prune_finished()
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                running = set(running)
+                for future in done:
+                    try:
+                        job_id, status = future.result()
+                    except Exception as exc:
+                        self.stderr.write(f'Worker error: {exc!r}')
+                    else:
+                        self.stdout.write(f'Job {job_id}: {status}')
+        except KeyboardInterrupt:
+            stopping.set()
+        finally:
+            self.stdout.write('Waiting for running jobs to finish...')
+            pool.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped.'))
@@ -0,0 +1,42 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """Copy the primary SQLite database into a replica file."""
+
+    help = (
+        'Stand in for replication when trying the read-replica router locally: copy '
+        'the primary SQLite database into each SQLite replica with the online backup API. '
+        'Reads routed to a replica see the primary as of the last sync.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='replicas',
+            help='Replica alias to refresh; repeatable (default: every BOOKS_READ_REPLICAS alias).',
+        )
+
+    def handle(self, *args, **options):
+        replicas = options['replicas'] or settings.BOOKS_READ_REPLICAS
+        if not replicas:
+            raise CommandError('No replicas configured; set BOOKS_REPLICA_DB.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in replicas:
+            if alias not in settings.BOOKS_READ_REPLICAS:
+                raise CommandError(f'{alias!r} is not a read replica.')
+            replica = connections[alias]
+            if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('sync_replica only copies SQLite databases.')
+            replica.close()
+            source = sqlite3.connect(primary.settings_dict['NAME'])
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied {primary.settings_dict["NAME"]} to {alias}.'))
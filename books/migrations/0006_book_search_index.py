@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from books import search
+
+
+def install_search_index(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_upcomingbook_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
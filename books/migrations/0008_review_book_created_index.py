@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_book_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-created_at', '-id'], name='review_book_created_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:34
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Review = apps.get_model('books', 'Review')
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.using(schema_editor.connection.alias).update(
+        review_count=Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), 0),
+        last_reviewed_at=Subquery(reviews.annotate(latest=Max('created_at')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_review_book_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='last_reviewed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='popularity_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-popularity_score', '-id'], name='book_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
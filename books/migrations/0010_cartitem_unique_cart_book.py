@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:36
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    CartItem = apps.get_model('books', 'CartItem')
+    items = CartItem.objects.using(schema_editor.connection.alias)
+    duplicates = (
+        items.values('cart', 'book')
+        .annotate(rows=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        items.filter(pk=group['keep']).update(quantity=group['total'])
+        items.filter(cart=group['cart'], book=group['book']).exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'book'), name='unique_cart_book'),
+        ),
+    ]
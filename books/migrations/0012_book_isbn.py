@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(blank=True, max_length=13, null=True, unique=True),
+        ),
+    ]
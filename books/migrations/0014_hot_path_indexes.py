@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_empty_items(apps, schema_editor):
+    # update_cart used to store a quantity of 0 rather than remove the item.
+    CartItem = apps.get_model('books', 'CartItem')
+    CartItem.objects.using(schema_editor.connection.alias).filter(quantity__lt=1).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_book_upcomingbook_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cartitem',
+            name='cart',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='books.cart'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='books.book'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_popular', True)), fields=['-popularity_score', '-id'], name='book_flagged_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='upcomingbook',
+            index=models.Index(fields=['release_date', 'id'], name='upcoming_release_idx'),
+        ),
+        migrations.RunPython(delete_empty_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity__gte', 1)), name='cartitem_quantity_positive'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='upcomingbook',
+            name='upcoming_release_idx',
+        ),
+        migrations.AddField(
+            model_name='upcomingbook',
+            name='book',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pre_release', to='books.book'),
+        ),
+        migrations.AddField(
+            model_name='upcomingbook',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='upcomingbook',
+            name='promoted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='upcomingbook',
+            index=models.Index(condition=models.Q(('promoted_at__isnull', True)), fields=['release_date', 'id'], name='upcoming_scheduled_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:10
+
+import books.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_upcomingbook_release_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_band', models.CharField(max_length=20)),
+                ('author', models.CharField(max_length=100)),
+                ('release_year', models.IntegerField(null=True)),
+                ('is_popular', models.BooleanField()),
+                ('is_upcoming', models.BooleanField()),
+                ('books', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='release_year',
+            field=models.GeneratedField(db_persist=True, expression=books.models.DateYear('release_date'), output_field=models.IntegerField(null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'title', 'id'], name='book_author_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['release_year', 'title', 'id'], name='book_year_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['release_year', 'price', 'id'], name='book_year_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_popular', True)), fields=['title', 'id'], name='book_popular_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_popular', True)), fields=['price', 'id'], name='book_popular_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_upcoming', True)), fields=['title', 'id'], name='book_upcoming_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_upcoming', True)), fields=['price', 'id'], name='book_upcoming_price_idx'),
+        ),
+    ]
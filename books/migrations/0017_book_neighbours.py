@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_book_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('shared', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='books.book')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='books.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['computed_at'], name='neighbour_computed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='unique_book_neighbour_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:23
+
+import books.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_book_neighbours'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=books.storage.cover_storage, upload_to='book_covers/'),
+        ),
+        migrations.AlterField(
+            model_name='upcomingbook',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=books.storage.cover_storage, upload_to='upcoming_book_covers/'),
+        ),
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('references', 0)), fields=['updated_at'], name='storedfile_unreferenced_idx')],
+            },
+        ),
+    ]
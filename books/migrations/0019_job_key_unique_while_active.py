@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_content_addressed_covers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('queued', 'running'))), fields=('idempotency_key',), name='unique_active_job_key'),
+        ),
+    ]
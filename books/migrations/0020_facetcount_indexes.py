@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_job_key_unique_while_active'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=['author', 'books'], name='facet_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=['price_band', 'books'], name='facet_price_band_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=['release_year', 'books'], name='facet_release_year_idx'),
+        ),
+    ]
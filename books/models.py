@@ -1,5 +1,26 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import ExtractYear
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .storage import cover_storage
+
+
+class DateYear(ExtractYear):
+    """
+    The year of a date, computed in plain SQL on SQLite too.
+
+    Django's ``ExtractYear`` calls a Python function on SQLite, which a
+    generated column cannot depend on; SQLite stores dates as ISO text, so
+    the year is its first four characters.
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.lhs)
+        return f'CAST(SUBSTR({sql}, 1, 4) AS INTEGER)', params
 
 
 class Book(models.Model):
@@ -11,10 +32,23 @@ class Book(models.Model):
         author (CharField): The author's name.
         description (TextField): A detailed summary of the book.
         price (DecimalField): The retail price of the book.
-        cover_image (ImageField): Optional image of the book's cover.
+        isbn (CharField): Optional unique ISBN, used to match rows on import.
+        cover_image (ImageField): Optional image of the book's cover, stored
+            once per distinct image (see :mod:`books.covers`).
         release_date (DateField): Optional release date of the book.
+        release_year (GeneratedField): Year of ``release_date``, stored and
+            indexed for the release-year facet.
         is_popular (BooleanField): Flag to mark book as popular.
-        is_upcoming (BooleanField): Flag to indicate if the book is unreleased.
+        is_upcoming (BooleanField): Flag to indicate if the book is unreleased;
+            cleared by ``manage.py promote_releases`` once its release date
+            arrives.
+        review_count (PositiveIntegerField): Number of reviews, kept in step
+            with the Review table by signals.
+        last_reviewed_at (DateTimeField): When the newest review was written.
+        popularity_score (FloatField): Time-decayed review activity,
+            recomputed by the ``recompute_popularity`` command.
+        updated_at (DateTimeField): When the row last changed; the version
+            the JSON API derives ETags from.
 
     Returns:
         str: Title of the book.
@@ -23,15 +57,83 @@ class Book(models.Model):
     author = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
-    cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
+    isbn = models.CharField(max_length=13, unique=True, null=True, blank=True)
+    cover_image = models.ImageField(upload_to='book_covers/', storage=cover_storage, blank=True, null=True)
     release_date = models.DateField(null=True, blank=True)
+    release_year = models.GeneratedField(
+        expression=DateYear('release_date'), output_field=models.IntegerField(null=True), db_persist=True,
+    )
     is_popular = models.BooleanField(default=False)
     is_upcoming = models.BooleanField(default=False)
+    review_count = models.PositiveIntegerField(default=0)
+    last_reviewed_at = models.DateTimeField(null=True, blank=True)
+    popularity_score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination orderings used by the catalog listing.
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            models.Index(fields=['price', 'id'], name='book_price_id_idx'),
+            # Most-popular-first ordering used by the home page and popular listing.
+            models.Index(fields=['-popularity_score', '-id'], name='book_popularity_idx'),
+            # The home page's popular shelf; only a few dozen rows are flagged.
+            models.Index(
+                fields=['-popularity_score', '-id'], name='book_flagged_popular_idx',
+                condition=models.Q(is_popular=True),
+            ),
+            # Facet filters on the catalog listing (see books.facets), each
+            # followed by a listing order so a filtered page is an index
+            # range scan with no sort. The popular and upcoming indexes are
+            # partial and hold only the flagged books.
+            models.Index(fields=['author', 'title', 'id'], name='book_author_title_idx'),
+            models.Index(fields=['release_year', 'title', 'id'], name='book_year_title_idx'),
+            models.Index(fields=['release_year', 'price', 'id'], name='book_year_price_idx'),
+            models.Index(fields=['title', 'id'], name='book_popular_title_idx', condition=models.Q(is_popular=True)),
+            models.Index(fields=['price', 'id'], name='book_popular_price_idx', condition=models.Q(is_popular=True)),
+            models.Index(fields=['title', 'id'], name='book_upcoming_title_idx', condition=models.Q(is_upcoming=True)),
+            models.Index(fields=['price', 'id'], name='book_upcoming_price_idx', condition=models.Q(is_upcoming=True)),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class FacetCount(models.Model):
+    """
+    Number of books sharing one combination of catalog facet values.
+
+    A grouped summary of :class:`Book` that facet counts are added up from
+    instead of scanning the catalog; rebuilt by :func:`books.facets.rebuild`.
+
+    Fields:
+        price_band (CharField): Key of the ``BOOKS_PRICE_FACETS`` range.
+        author (CharField): Author name.
+        release_year (IntegerField): Release year, or null if unknown.
+        is_popular (BooleanField): Popular flag.
+        is_upcoming (BooleanField): Upcoming flag.
+        books (PositiveIntegerField): Books with these values.
+    """
+    price_band = models.CharField(max_length=20)
+    author = models.CharField(max_length=100)
+    release_year = models.IntegerField(null=True)
+    is_popular = models.BooleanField()
+    is_upcoming = models.BooleanField()
+    books = models.PositiveIntegerField()
+
+    class Meta:
+        # Selecting a facet value filters the other facets' counts by it;
+        # with ``books`` included, each count is read from its index alone.
+        indexes = [
+            models.Index(fields=['author', 'books'], name='facet_author_idx'),
+            models.Index(fields=['price_band', 'books'], name='facet_price_band_idx'),
+            models.Index(fields=['release_year', 'books'], name='facet_release_year_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.author}, {self.price_band}, {self.release_year}: {self.books}'
+
+
 class Review(models.Model):
     """
     Stores a review submitted by a user for a specific book.
@@ -45,14 +147,69 @@ class Review(models.Model):
     Returns:
         str: Username and book title of the review.
     """
-    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
+    # The (book, created_at, id) index below also serves lookups by book.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Newest-first review pages for a single book.
+            models.Index(fields=['book', '-created_at', '-id'], name='review_book_created_idx'),
+            # Newest reviews across the catalog (home page, popularity window, exports).
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ]
+
     def __str__(self):
         return f'Review by {self.user.username} on {self.book.title}'
 
+    def save(self, *args, **kwargs):
+        """
+        Save the review in the same transaction as the book's review counters.
+
+        The counters on :class:`Book` are updated by a post_save receiver,
+        which runs inside this atomic block.
+        """
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class BookNeighbour(models.Model):
+    """
+    One precomputed "readers also reviewed" recommendation for a book.
+
+    Each book keeps its ``BOOKS_RECOMMENDATIONS`` most similar books, ranked
+    from 1; the lists are written by :mod:`books.recommendations`.
+
+    Fields:
+        book (ForeignKey): The book the recommendation is shown on.
+        neighbour (ForeignKey): The recommended book.
+        rank (PositiveSmallIntegerField): Position in the book's list, from 1.
+        score (FloatField): Cosine similarity of the two books' readers.
+        shared (PositiveIntegerField): Readers the two books have in common.
+        computed_at (DateTimeField): When the book's list was last computed.
+    """
+    # The unique (book, rank) constraint below also serves lookups by book.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbours', db_index=False)
+    neighbour = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    shared = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_book_neighbour_rank'),
+        ]
+        indexes = [
+            # Watermark of the last incremental build.
+            models.Index(fields=['computed_at'], name='neighbour_computed_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} -> {self.neighbour_id} (#{self.rank})'
+
 
 class Cart(models.Model):
     """
@@ -79,10 +236,35 @@ class Cart(models.Model):
         """
         Calculate the total cost of all items in the cart.
 
+        The sum is computed by the database in a single query.
+
         Returns:
             Decimal: Sum of all cart item prices.
         """
-        return sum(item.total_price for item in self.items.all())
+        total = self.items.aggregate(total=Sum(F('book__price') * F('quantity')))['total']
+        return total if total is not None else Decimal('0.00')
+
+
+class CartItemQuerySet(models.QuerySet):
+    """Query helpers for cart line items."""
+
+    def with_totals(self):
+        """
+        Join each item's book and compute line and cart totals in SQL.
+
+        Each row is annotated with ``line_total`` (price * quantity), plus
+        the cart-wide ``cart_total`` and ``cart_quantity`` computed with
+        window functions, so a whole cart page comes back in one query.
+
+        Returns:
+            QuerySet: Items with their book and the totals annotated.
+        """
+        line_total = F('book__price') * F('quantity')
+        return self.select_related('book').annotate(
+            line_total=line_total,
+            cart_total=Window(Sum(line_total), partition_by=[F('cart_id')]),
+            cart_quantity=Window(Sum('quantity'), partition_by=[F('cart_id')]),
+        )
 
 
 class CartItem(models.Model):
@@ -97,31 +279,89 @@ class CartItem(models.Model):
     Properties:
         total_price (Decimal): Total price for this line item (price * quantity).
     """
-    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    # The unique (cart, book) constraint below also serves lookups by cart.
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items', db_index=False)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'book'], name='unique_cart_book'),
+            # Setting a quantity to zero removes the item instead.
+            models.CheckConstraint(condition=models.Q(quantity__gte=1), name='cartitem_quantity_positive'),
+        ]
+
     @property
     def total_price(self):
         """
         Calculate the total cost for this item based on quantity.
 
+        Uses the ``line_total`` annotation from
+        :meth:`CartItemQuerySet.with_totals` when present.
+
         Returns:
             Decimal: Total price for the book(s) in this item.
         """
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.book.price * self.quantity
 
 
+class UpcomingBookQuerySet(models.QuerySet):
+    """Query helpers for the release schedule."""
+
+    def scheduled(self, today=None):
+        """
+        Titles not yet released, for the upcoming listings.
+
+        Served by the partial ``upcoming_scheduled_idx`` index, which holds
+        only unpromoted titles, so the listings stay fast however many
+        releases have been promoted.
+
+        Args:
+            today (date, optional): Defaults to the current local date.
+
+        Returns:
+            QuerySet: Unpromoted titles releasing today or later.
+        """
+        return self.filter(promoted_at__isnull=True, release_date__gte=today or timezone.localdate())
+
+    def due(self, today=None):
+        """
+        Unpromoted titles whose release date has arrived.
+
+        Args:
+            today (date, optional): Defaults to the current local date.
+
+        Returns:
+            QuerySet: Titles for ``manage.py promote_releases`` to publish.
+        """
+        return self.filter(promoted_at__isnull=True, release_date__lte=today or timezone.localdate())
+
+
 class UpcomingBook(models.Model):
     """
     Represents a book that is planned for future release.
 
+    On its release date, ``manage.py promote_releases`` copies it into the
+    catalog as a :class:`Book` and records the link; it then drops out of
+    the upcoming listings.
+
     Fields:
         title (CharField): The title of the upcoming book.
         author (CharField): The author’s name.
         release_date (DateField): The expected release date.
-        cover_image (ImageField): Optional cover image of the upcoming book.
+        cover_image (ImageField): Optional cover image of the upcoming book,
+            shared with its catalog book once promoted.
         description (TextField): Optional short summary.
+        price (DecimalField): Retail price once released; a title is only
+            promoted once it has one.
+        book (OneToOneField): The catalog book it was promoted to.
+        promoted_at (DateTimeField): When it was promoted; null while it is
+            still scheduled.
+        updated_at (DateTimeField): When the row last changed.
 
     Returns:
         str: Title of the upcoming book.
@@ -129,8 +369,128 @@ class UpcomingBook(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100)
     release_date = models.DateField()
-    cover_image = models.ImageField(upload_to='upcoming_book_covers/', blank=True, null=True)
+    cover_image = models.ImageField(
+        upload_to='upcoming_book_covers/', storage=cover_storage, blank=True, null=True,
+    )
     description = models.TextField(blank=True)
+    price = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    book = models.OneToOneField(
+        Book, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='pre_release',
+    )
+    promoted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UpcomingBookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Soonest releases first, on the home page and the upcoming
+            # listings; promoted titles are left out of the index.
+            models.Index(
+                fields=['release_date', 'id'], name='upcoming_scheduled_idx',
+                condition=models.Q(promoted_at__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class StoredFile(models.Model):
+    """
+    A cover image in content-addressed storage and how many rows use it.
+
+    Kept up to date by :mod:`books.covers`. A file nothing refers to any
+    more is deleted by ``manage.py dedupe_covers --prune`` after a grace
+    period, so an upload that is about to be saved is never lost.
+
+    Fields:
+        name (CharField): Storage name, derived from the file's digest.
+        size (PositiveBigIntegerField): Size in bytes.
+        references (PositiveIntegerField): Book and upcoming book covers
+            using the file.
+        updated_at (DateTimeField): When the reference count last changed.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Files waiting to be pruned.
+            models.Index(
+                fields=['updated_at'], name='storedfile_unreferenced_idx', condition=models.Q(references=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.references} reference(s))'
+
+
+class Job(models.Model):
+    """
+    A unit of background work stored in the database queue.
+
+    Jobs are created with :func:`books.jobs.enqueue` and executed by the
+    ``runworker`` management command.
+
+    Fields:
+        task (CharField): Name of the registered task to run.
+        payload (JSONField): Keyword arguments passed to the task.
+        status (CharField): One of queued, running, succeeded or failed.
+        idempotency_key (CharField): Optional deduplication key, unique among
+            queued and running jobs; enqueueing a job whose key is taken by
+            one of those returns it instead. Finished jobs release the key.
+        attempts (PositiveIntegerField): Number of times the job has started.
+        max_attempts (PositiveIntegerField): Attempts before giving up.
+        run_at (DateTimeField): Earliest time the job may (re)start.
+        locked_by (CharField): Worker that claimed the job.
+        locked_at (DateTimeField): When the job was claimed.
+        last_error (TextField): Traceback of the most recent failure.
+        created_at (DateTimeField): Timestamp when the job was enqueued.
+        finished_at (DateTimeField): When the job succeeded or finally failed.
+
+    Returns:
+        str: Task name and status of the job.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    # Statuses of jobs that have not finished, and so hold their key.
+    ACTIVE = (QUEUED, RUNNING)
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for the oldest due job in a given status.
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['idempotency_key'], condition=models.Q(status__in=('queued', 'running')),
+                name='unique_active_job_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.status})'
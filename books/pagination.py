@@ -0,0 +1,172 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Instead of ``OFFSET``, each page remembers the sort key of its last row and
+the next page asks for rows strictly after it. With an index on the sort
+key, fetching page N costs the same as fetching page 1.
+
+Cursors are opaque, URL-safe tokens wrapping the last row's key values.
+"""
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """JSON encoder that keeps datetimes at full (microsecond) precision."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+@dataclass
+class KeysetPage:
+    """
+    A single page of keyset-paginated results.
+
+    Attributes:
+        items (list): The rows on this page.
+        next_cursor (str or None): Cursor for the following page, if any.
+    """
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    """
+    Encode a row's sort key values as an opaque cursor.
+
+    Args:
+        values (list): The sort key values of the last row on a page.
+
+    Returns:
+        str: A URL-safe cursor token.
+    """
+    raw = json.dumps(list(values), cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size=None):
+    """
+    Decode a cursor produced by :func:`encode_cursor`.
+
+    Args:
+        token (str): The cursor from the query string.
+        size (int, optional): Expected number of key values.
+
+    Returns:
+        list or None: The key values, or None if the cursor is missing or
+        malformed (callers treat that as "start from the first page").
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(values, list) or (size is not None and len(values) != size):
+        return None
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Build a filter selecting the rows that sort strictly after ``values``.
+
+    For an ordering of ``('title', 'id')`` this is
+    ``title > v0 OR (title = v0 AND id > v1)``; fields prefixed with ``-``
+    sort descending and compare with ``<`` instead.
+
+    Args:
+        ordering (tuple[str]): Sort fields; the last one must be unique.
+        values (list): Key values of the last row already seen.
+
+    Returns:
+        Q: The filter to apply to the queryset.
+    """
+    condition = Q()
+    for position in range(len(ordering) - 1, -1, -1):
+        name = ordering[position].lstrip('-')
+        lookup = 'lt' if ordering[position].startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[position]})
+        if position < len(ordering) - 1:
+            step |= Q(**{name: values[position]}) & condition
+        condition = step
+    return condition
+
+
+def paginate(queryset, ordering, cursor, page_size):
+    """
+    Return one keyset page of ``queryset``.
+
+    Fetches ``page_size + 1`` rows to learn whether another page exists
+    without a separate COUNT query.
+
+    Args:
+        queryset (QuerySet): The rows to paginate.
+        ordering (tuple[str]): Sort fields, ending with a unique field.
+        cursor (str): Cursor from the previous page, or None for the first.
+        page_size (int): Number of rows per page.
+
+    Returns:
+        KeysetPage: The requested page.
+    """
+    return _make_page(list(_page_queryset(queryset, ordering, cursor, page_size)), ordering, page_size)
+
+
+async def apaginate(queryset, ordering, cursor, page_size):
+    """
+    Async version of :func:`paginate`, for use in async views.
+
+    Args:
+        queryset (QuerySet): The rows to paginate.
+        ordering (tuple[str]): Sort fields, ending with a unique field.
+        cursor (str): Cursor from the previous page, or None for the first.
+        page_size (int): Number of rows per page.
+
+    Returns:
+        KeysetPage: The requested page.
+    """
+    rows = [row async for row in _page_queryset(queryset, ordering, cursor, page_size)]
+    return _make_page(rows, ordering, page_size)
+
+
+def _page_queryset(queryset, ordering, cursor, page_size):
+    """The unevaluated query for one page plus one look-ahead row."""
+    values = decode_cursor(cursor, size=len(ordering))
+    if values is not None:
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        except (ValidationError, TypeError, ValueError):
+            # A tampered cursor whose values do not fit the sort fields.
+            pass
+    return queryset.order_by(*ordering)[:page_size + 1]
+
+
+def _make_page(rows, ordering, page_size):
+    page = KeysetPage(items=rows[:page_size])
+    if len(rows) > page_size:
+        last = page.items[-1]
+        page.next_cursor = encode_cursor(
+            [getattr(last, name.lstrip('-')) for name in ordering]
+        )
+    return page
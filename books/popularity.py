@@ -0,0 +1,82 @@
+"""
+Time-decayed popularity scores for books.
+
+Each review contributes ``0.5 ** (age / half_life)`` to its book's score, so
+a review written today counts 1, one written a half-life ago counts 0.5,
+and so on. Reviews older than ``HORIZON_HALF_LIVES`` half-lives contribute
+less than 0.4% each and are skipped, which keeps a recompute proportional
+to recent activity rather than to the whole review history.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Book, Review
+
+HORIZON_HALF_LIVES = 8
+
+
+def compute_scores(now, half_life_days):
+    """
+    Compute the decayed review score of every recently reviewed book.
+
+    Args:
+        now (datetime): The instant scores are computed for.
+        half_life_days (float): Days after which a review's weight halves.
+
+    Returns:
+        dict[int, float]: Scores keyed by book id; books without recent
+        reviews are absent.
+    """
+    half_life = timedelta(days=half_life_days).total_seconds()
+    cutoff = now - timedelta(days=half_life_days * HORIZON_HALF_LIVES)
+    scores = defaultdict(float)
+    recent = Review.objects.filter(created_at__gte=cutoff).values_list('book_id', 'created_at')
+    for book_id, created_at in recent.iterator(chunk_size=5000):
+        age = max((now - created_at).total_seconds(), 0)
+        scores[book_id] += 0.5 ** (age / half_life)
+    return scores
+
+
+def recompute(now=None, half_life_days=None, top=None, batch_size=1000):
+    """
+    Store fresh popularity scores and flag the top books as popular.
+
+    Runs in one transaction so readers never see a half-updated ranking.
+    ``is_popular`` is set on exactly the ``top`` highest-scoring books, so
+    flags set by hand are overridden. Every book whose score is stored gets
+    a new ``updated_at``, and with it a new API ETag.
+
+    Args:
+        now (datetime, optional): Defaults to the current time.
+        half_life_days (float, optional): Defaults to
+            ``BOOKS_POPULARITY_HALF_LIFE_DAYS``.
+        top (int, optional): Defaults to ``BOOKS_POPULAR_COUNT``.
+        batch_size (int): Rows per bulk UPDATE.
+
+    Returns:
+        tuple[int, list[int]]: Number of scored books and the ids flagged
+        as popular, most popular first.
+    """
+    now = now or timezone.now()
+    half_life_days = half_life_days or settings.BOOKS_POPULARITY_HALF_LIFE_DAYS
+    top = settings.BOOKS_POPULAR_COUNT if top is None else top
+
+    scores = compute_scores(now, half_life_days)
+    ranked = sorted(scores, key=lambda book_id: (-scores[book_id], -book_id))[:top]
+
+    with transaction.atomic():
+        Book.objects.filter(popularity_score__gt=0).update(popularity_score=0, updated_at=Now())
+        # bulk_update() skips auto_now, so updated_at is set explicitly.
+        Book.objects.bulk_update(
+            [Book(pk=book_id, popularity_score=score, updated_at=now) for book_id, score in scores.items()],
+            ['popularity_score', 'updated_at'],
+            batch_size=batch_size,
+        )
+        Book.objects.filter(is_popular=True).exclude(pk__in=ranked).update(is_popular=False, updated_at=Now())
+        Book.objects.filter(pk__in=ranked, is_popular=False).update(is_popular=True, updated_at=Now())
+    return len(scores), ranked
@@ -0,0 +1,183 @@
+"""
+"Readers also reviewed" recommendations.
+
+Two books are similar when the same people read them. Reading is taken
+from reviews, and from cart contents when ``BOOKS_RECOMMENDATION_USE_CARTS``
+is on. The user x book reading matrix is held sparsely, as the set of books
+each reader has read and the set of readers of each book. The similarity of
+books ``a`` and ``b`` is the cosine of their reader columns::
+
+    shared(a, b) / sqrt(readers(a) * readers(b))
+
+A book's candidates are every book read by one of its readers. They are
+counted in one ``Counter.update`` per book, and only the
+``BOOKS_RECOMMENDATIONS`` best are kept. Only the
+``BOOKS_RECOMMENDATION_READER_LIMIT`` most recent books of each reader
+count, which bounds the work per reader.
+
+The lists are stored in :class:`~books.models.BookNeighbour`, so
+``book_detail`` reads them with one indexed lookup. :func:`build` is run by
+``manage.py build_recommendations`` (or the ``build_recommendations`` job).
+By default it recomputes only the lists touched by reviews written since
+the previous build:
+
+* the lists of the reviewed books;
+* the lists of every other book their reviewers have read.
+
+Other books that share readers with a reviewed book only see their score
+for it drift down slightly. They are brought up to date by the next full
+build.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import BookNeighbour, CartItem, Review
+
+
+@dataclass
+class BuildResult:
+    """
+    Outcome of :func:`build`.
+
+    Attributes:
+        full (bool): Whether every list was recomputed.
+        books (int): Books whose list was recomputed.
+        neighbours (int): Recommendations written.
+    """
+    full: bool = False
+    books: int = 0
+    neighbours: int = 0
+
+
+def load_readers(limit=None, use_carts=None):
+    """
+    Read the sparse user x book reading matrix.
+
+    Args:
+        limit (int, optional): Most recent books counted per reader;
+            defaults to ``BOOKS_RECOMMENDATION_READER_LIMIT``.
+        use_carts (bool, optional): Count cart contents as reading;
+            defaults to ``BOOKS_RECOMMENDATION_USE_CARTS``.
+
+    Returns:
+        tuple[dict[int, set], dict[int, set]]: Books read per user id and
+        readers per book id.
+    """
+    limit = limit or settings.BOOKS_RECOMMENDATION_READER_LIMIT
+    use_carts = settings.BOOKS_RECOMMENDATION_USE_CARTS if use_carts is None else use_carts
+    # Newest first, so the limit keeps each reader's most recent books.
+    pairs = Review.objects.order_by('-created_at', '-id').values_list('user_id', 'book_id')
+    if use_carts:
+        pairs = chain(pairs.iterator(chunk_size=10000), CartItem.objects.values_list('cart__user_id', 'book_id'))
+    else:
+        pairs = pairs.iterator(chunk_size=10000)
+
+    books_of = defaultdict(set)
+    for user_id, book_id in pairs:
+        books = books_of[user_id]
+        if len(books) < limit:
+            books.add(book_id)
+    readers_of = defaultdict(set)
+    for user_id, books in books_of.items():
+        for book_id in books:
+            readers_of[book_id].add(user_id)
+    return books_of, readers_of
+
+
+def neighbours(book_id, books_of, readers_of, size, min_shared):
+    """
+    Rank the books most similar to one book.
+
+    Args:
+        book_id (int): The book to find neighbours for.
+        books_of (dict[int, set]): Books read per user, from
+            :func:`load_readers`.
+        readers_of (dict[int, set]): Readers per book, from
+            :func:`load_readers`.
+        size (int): Neighbours to return.
+        min_shared (int): Readers a neighbour must have in common.
+
+    Returns:
+        list[tuple[int, float, int]]: ``(neighbour_id, score, shared)``,
+        most similar first; ties go to more shared readers, then the lower
+        id.
+    """
+    readers = readers_of.get(book_id, ())
+    shared = Counter()
+    for user_id in readers:
+        shared.update(books_of[user_id])
+    shared.pop(book_id, None)
+    scored = (
+        (count / math.sqrt(len(readers) * len(readers_of[other])), count, -other)
+        for other, count in shared.items()
+        if count >= min_shared
+    )
+    return [(-other, score, count) for score, count, other in heapq.nlargest(size, scored)]
+
+
+def build(full=False, batch_size=1000, now=None):
+    """
+    Recompute the stored recommendation lists.
+
+    Lists are replaced one batch of books per transaction, so readers see
+    each book's old list or its new one, never a mix. A full build ends by
+    dropping the lists of books that no longer have any neighbours.
+
+    Args:
+        full (bool): Recompute every list, not just those touched by new
+            reviews. Implied when nothing has been built yet.
+        batch_size (int): Books whose lists are replaced per transaction.
+        now (datetime, optional): Build timestamp; defaults to the current
+            time. The next incremental build starts from it.
+
+    Returns:
+        BuildResult: How many lists and recommendations were written.
+    """
+    now = now or timezone.now()
+    since = None if full else BookNeighbour.objects.aggregate(since=Max('computed_at'))['since']
+    result = BuildResult(full=since is None)
+    if not result.full:
+        new = list(Review.objects.filter(created_at__gte=since).values_list('user_id', 'book_id'))
+        if not new:
+            return result
+    books_of, readers_of = load_readers()
+
+    if result.full:
+        sources = set(readers_of)
+    else:
+        sources = set()
+        for user_id, book_id in new:
+            sources.add(book_id)
+            sources.update(books_of.get(user_id, ()))
+
+    size = settings.BOOKS_RECOMMENDATIONS
+    min_shared = settings.BOOKS_RECOMMENDATION_MIN_SHARED
+    ordered = sorted(sources)
+    for start in range(0, len(ordered), batch_size):
+        batch = ordered[start:start + batch_size]
+        rows = [
+            BookNeighbour(
+                book_id=book_id, neighbour_id=other, rank=rank, score=score, shared=shared, computed_at=now,
+            )
+            for book_id in batch
+            for rank, (other, score, shared) in enumerate(
+                neighbours(book_id, books_of, readers_of, size, min_shared), start=1,
+            )
+        ]
+        with transaction.atomic():
+            BookNeighbour.objects.filter(book_id__in=batch).delete()
+            BookNeighbour.objects.bulk_create(rows, batch_size=5000)
+        result.books += len(batch)
+        result.neighbours += len(rows)
+
+    if result.full:
+        BookNeighbour.objects.filter(computed_at__lt=now).delete()
+    return result
@@ -0,0 +1,93 @@
+"""
+Promotion of scheduled releases into the live catalog.
+
+An :class:`~books.models.UpcomingBook` stays on the upcoming listings until
+its release date. :func:`promote_due`, run daily by
+``manage.py promote_releases`` (or the ``promote_releases`` job), then
+creates the catalog :class:`~books.models.Book` for every due title in
+bulk, links the two and clears ``Book.is_upcoming`` on imported books whose
+release date has arrived. Promoted titles leave the partial index that
+serves the listings, so those stay small as the release history grows.
+
+Books are inserted with ``bulk_create``, which skips model signals; the
+search index is kept in step by database triggers, the homepage and
+autocomplete caches are invalidated, the facet counts rebuilt and the
+shared covers' reference counts raised here instead.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from . import covers, facets
+from .caching import bump_version
+from .models import Book, UpcomingBook
+
+
+@dataclass
+class PromotionResult:
+    """
+    Outcome of :func:`promote_due`.
+
+    Attributes:
+        promoted (int): Upcoming titles published as catalog books.
+        released (int): Catalog books whose ``is_upcoming`` flag was cleared.
+        unpriced (int): Due titles held back because they have no price.
+    """
+    promoted: int = 0
+    released: int = 0
+    unpriced: int = 0
+
+
+def promote_due(today=None, batch_size=500):
+    """
+    Publish every due upcoming title to the catalog.
+
+    Each batch is promoted in its own transaction, so an interrupted run
+    resumes where it stopped. Titles without a price are left scheduled,
+    since a catalog book needs one.
+
+    Args:
+        today (date, optional): Release cut-off; defaults to the current
+            local date.
+        batch_size (int): Titles promoted per transaction.
+
+    Returns:
+        PromotionResult: What was promoted, released and held back.
+    """
+    today = today or timezone.localdate()
+    result = PromotionResult()
+    due = UpcomingBook.objects.due(today).filter(price__isnull=False).order_by('release_date', 'id')
+    while True:
+        with transaction.atomic():
+            batch = list(due.select_for_update()[:batch_size])
+            if not batch:
+                break
+            books = Book.objects.bulk_create([
+                Book(
+                    title=upcoming.title,
+                    author=upcoming.author,
+                    description=upcoming.description,
+                    price=upcoming.price,
+                    release_date=upcoming.release_date,
+                    cover_image=upcoming.cover_image.name or None,
+                )
+                for upcoming in batch
+            ])
+            now = timezone.now()
+            for upcoming, book in zip(batch, books):
+                upcoming.book, upcoming.promoted_at, upcoming.updated_at = book, now, now
+            UpcomingBook.objects.bulk_update(batch, ['book', 'promoted_at', 'updated_at'])
+            covers.retain(book.cover_image.name for book in books)
+        result.promoted += len(batch)
+
+    result.released = Book.objects.filter(is_upcoming=True, release_date__lte=today).update(
+        is_upcoming=False, updated_at=Now(),
+    )
+    result.unpriced = UpcomingBook.objects.due(today).filter(price__isnull=True).count()
+    if result.promoted or result.released:
+        for namespace in ('home', 'autocomplete'):
+            bump_version(namespace)
+        facets.rebuild()
+    return result
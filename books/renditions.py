@@ -0,0 +1,173 @@
+"""
+Resized cover image renditions.
+
+Every uploaded cover is resized to a few fixed widths, each saved as both
+WebP and JPEG next to the original, e.g. ``book_covers/caraval.jpg`` gets
+``book_covers/caraval.card.webp``, ``book_covers/caraval.card.jpg`` and so
+on. Templates use them through the ``{% cover_image %}`` tag, which emits a
+lazy-loaded ``<picture>`` with a ``srcset`` over all widths.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Rendition name -> target width in pixels, smallest first.
+RENDITIONS = {
+    'card': 320,
+    'detail': 640,
+    'retina': 1280,
+}
+
+# File extension -> (Pillow format, MIME type, save options).
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_name(name, rendition, extension):
+    """
+    Return the storage name of one rendition of an image.
+
+    Args:
+        name (str): Storage name of the original image.
+        rendition (str): A key of ``RENDITIONS``.
+        extension (str): A key of ``FORMATS``.
+
+    Returns:
+        str: The rendition's storage name, next to the original.
+    """
+    directory, filename = posixpath.split(name)
+    stem = filename.rsplit('.', 1)[0]
+    return posixpath.join(directory, f'{stem}.{rendition}.{extension}')
+
+
+def all_rendition_names(name):
+    """
+    List the storage names of every rendition of an image.
+
+    Args:
+        name (str): Storage name of the original image.
+
+    Returns:
+        list[str]: One name per rendition and format.
+    """
+    return [
+        rendition_name(name, rendition, extension)
+        for rendition in RENDITIONS
+        for extension in FORMATS
+    ]
+
+
+def has_renditions(name, storage=default_storage):
+    """
+    Check whether an image's renditions have been generated.
+
+    Only the last file written by :func:`generate` is checked.
+
+    Args:
+        name (str): Storage name of the original image.
+        storage (Storage): Where the image is stored.
+
+    Returns:
+        bool: True if the renditions exist.
+    """
+    return storage.exists(all_rendition_names(name)[-1])
+
+
+def generate(name, storage=default_storage, force=False):
+    """
+    Write every rendition of an image to ``storage``.
+
+    Images narrower than a rendition's width are re-encoded at their own
+    width rather than upscaled.
+
+    Args:
+        name (str): Storage name of the original image.
+        storage (Storage): Where the image is stored.
+        force (bool): Regenerate even if the renditions already exist.
+
+    Returns:
+        list[str]: Names of the renditions written (empty if skipped).
+    """
+    if not name or (not force and has_renditions(name, storage)):
+        return []
+
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    written = []
+    for rendition, width in RENDITIONS.items():
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = image
+        for extension, (image_format, _, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            target = rendition_name(name, rendition, extension)
+            if storage.exists(target):
+                storage.delete(target)
+            written.append(storage.save(target, ContentFile(buffer.getvalue())))
+    return written
+
+
+def delete(name, storage=default_storage):
+    """
+    Remove every rendition of an image.
+
+    Args:
+        name (str): Storage name of the original image.
+        storage (Storage): Where the image is stored.
+    """
+    for target in all_rendition_names(name):
+        if storage.exists(target):
+            storage.delete(target)
+
+
+def srcset(name, extension, storage=default_storage):
+    """
+    Build a ``srcset`` attribute value over all widths of one format.
+
+    Args:
+        name (str): Storage name of the original image.
+        extension (str): A key of ``FORMATS``.
+        storage (Storage): Where the image is stored.
+
+    Returns:
+        str: e.g. ``"/media/a.card.webp 320w, /media/a.detail.webp 640w"``.
+    """
+    return ', '.join(
+        f'{storage.url(rendition_name(name, rendition, extension))} {width}w'
+        for rendition, width in RENDITIONS.items()
+    )
+
+
+def generate_safely(name, force=False):
+    """
+    Generate renditions, logging instead of raising on unreadable images.
+
+    Args:
+        name (str): Storage name of the original image.
+        force (bool): Regenerate even if the renditions already exist.
+
+    Returns:
+        tuple[str, int, str or None]: The name, the number of renditions
+        written and an error message if generation failed.
+    """
+    try:
+        return name, len(generate(name, force=force)), None
+    except (OSError, ValueError) as exc:
+        logger.warning('Could not build renditions for %s: %s', name, exc)
+        return name, 0, str(exc)
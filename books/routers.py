@@ -0,0 +1,209 @@
+"""
+Read-replica routing for the catalog.
+
+:class:`CatalogReplicaRouter` sends reads of ``Book``, ``Review`` and
+``UpcomingBook`` to the aliases in ``BOOKS_READ_REPLICAS``. Replicas are
+picked round-robin or by lowest measured latency (``BOOKS_REPLICA_SELECTION``).
+Everything else, and every write, goes to ``default``.
+
+Reads stay on the primary whenever a replica might be behind:
+
+* outside a request (management commands, job workers), which read and
+  write the same rows;
+* inside a transaction, and for the rest of a request once it has written
+  anything;
+* for unsafe (POST, ...) requests;
+* for ``BOOKS_PRIMARY_PIN_SECONDS`` after a request that wrote, via a cookie
+  set by :class:`PrimaryPinningMiddleware`, so that a redirect after a POST
+  shows the user their own change;
+* inside :func:`use_primary` blocks, e.g. while building cached values.
+"""
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Models whose reads may be served by a replica.
+CATALOG_MODELS = {'books.book', 'books.review', 'books.upcomingbook'}
+
+# Seconds between latency probes of each replica, and the weight given to
+# the newest probe in the moving average.
+PROBE_INTERVAL = 30
+PROBE_WEIGHT = 0.3
+
+
+@dataclass
+class RoutingState:
+    """
+    Per-request routing state.
+
+    Attributes:
+        pinned (bool): Send every read to the primary.
+        wrote (bool): The request has written to the primary.
+    """
+    pinned: bool = False
+    wrote: bool = False
+
+
+_state = contextvars.ContextVar('books_routing_state', default=None)
+_cycle = itertools.count()
+_latency = {}
+_probed_at = {}
+_probe_lock = threading.Lock()
+
+
+@contextmanager
+def use_primary():
+    """Route every read inside the block to the primary database."""
+    state = _state.get()
+    token = _state.set(RoutingState(pinned=True, wrote=state.wrote if state else False))
+    try:
+        yield
+    finally:
+        if state is not None and _state.get().wrote:
+            state.wrote = True
+        _state.reset(token)
+
+
+def _probe(alias):
+    """Time a trivial query on ``alias``; return seconds, or None if it failed."""
+    started = time.perf_counter()
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError:
+        logger.warning('Replica %s failed its latency probe.', alias, exc_info=True)
+        return None
+    return time.perf_counter() - started
+
+
+def replica_latency(alias):
+    """
+    Return the smoothed latency of a replica, probing it when stale.
+
+    Args:
+        alias (str): A database alias from ``BOOKS_READ_REPLICAS``.
+
+    Returns:
+        float: Seconds; ``inf`` if the last probe failed.
+    """
+    now = time.monotonic()
+    if now - _probed_at.get(alias, float('-inf')) >= PROBE_INTERVAL:
+        with _probe_lock:
+            if now - _probed_at.get(alias, float('-inf')) >= PROBE_INTERVAL:
+                _probed_at[alias] = now
+                sample = _probe(alias)
+                if sample is None:
+                    _latency[alias] = float('inf')
+                elif alias not in _latency or _latency[alias] == float('inf'):
+                    _latency[alias] = sample
+                else:
+                    _latency[alias] = PROBE_WEIGHT * sample + (1 - PROBE_WEIGHT) * _latency[alias]
+    return _latency.get(alias, float('inf'))
+
+
+def choose_replica(replicas=None):
+    """
+    Pick the replica to serve a read.
+
+    Args:
+        replicas (list[str], optional): Candidate aliases; defaults to
+            ``BOOKS_READ_REPLICAS``.
+
+    Returns:
+        str: A replica alias, or ``"default"`` if none is configured or
+        (with least-latency selection) every replica is failing.
+    """
+    replicas = settings.BOOKS_READ_REPLICAS if replicas is None else replicas
+    if not replicas:
+        return DEFAULT_DB_ALIAS
+    if settings.BOOKS_REPLICA_SELECTION == 'least_latency':
+        latencies = {alias: replica_latency(alias) for alias in replicas}
+        best = min(replicas, key=latencies.__getitem__)
+        return best if latencies[best] != float('inf') else DEFAULT_DB_ALIAS
+    return replicas[next(_cycle) % len(replicas)]
+
+
+class CatalogReplicaRouter:
+    """Route catalog reads to replicas and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in CATALOG_MODELS:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is None or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class PrimaryPinningMiddleware:
+    """
+    Track per-request routing state and pin recent writers to the primary.
+
+    Unsafe requests, and requests carrying the pin cookie, read from the
+    primary throughout. A request that writes sets the cookie for
+    ``BOOKS_PRIMARY_PIN_SECONDS``, long enough for replicas to catch up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    def _start(self, request):
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or (
+            settings.BOOKS_PRIMARY_PIN_COOKIE in request.COOKIES
+        )
+        state = RoutingState(pinned=pinned)
+        return state, _state.set(state)
+
+    def _finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                settings.BOOKS_PRIMARY_PIN_COOKIE, '1', max_age=settings.BOOKS_PRIMARY_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,238 @@
+"""
+Full-text search over the book catalog.
+
+On SQLite the catalog is indexed by an external-content FTS5 table
+(``books_book_fts``) that triggers keep in sync with ``books_book``. On
+PostgreSQL a GIN expression index over a weighted ``tsvector`` plays the
+same role. Any other backend falls back to ``icontains`` matching.
+
+Results are ranked by relevance (title matches weigh more than author
+matches, which weigh more than description matches) and every search term
+is treated as a prefix, so ``"cru pri"`` finds *The Cruel Prince*.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db import connections, router
+from django.db.models import Q
+
+FTS_TABLE = 'books_book_fts'
+MAX_TERMS = 8
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books_book BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, author, description)
+            VALUES (new.id, new.title, new.author, new.description);
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books_book BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description)
+            VALUES ('delete', old.id, old.title, old.author, old.description);
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author, description ON books_book BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description)
+            VALUES ('delete', old.id, old.title, old.author, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, title, author, description)
+            VALUES (new.id, new.title, new.author, new.description);
+        END
+    """,
+}
+
+# Kept identical to the expression in the index so PostgreSQL can use it.
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+
+def _sqlite_triggers_missing(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'books_book'"
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    return set(SQLITE_TRIGGERS) - existing
+
+
+def install(connection=default_connection):
+    """
+    Create the search index and its sync triggers if they are missing.
+
+    SQLite drops a table's triggers whenever Django rebuilds the table during
+    a migration, so this is safe (and necessary) to call after every migrate.
+    The index is rebuilt from ``books_book`` whenever a trigger had to be
+    recreated, since writes made without it would otherwise be missing.
+
+    Args:
+        connection: The database connection to install the index on.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, author, description, "
+                "content='books_book', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            missing = _sqlite_triggers_missing(cursor)
+            for name in missing:
+                cursor.execute(SQLITE_TRIGGERS[name])
+            if missing:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS books_book_search_idx "
+                f"ON books_book USING GIN (({POSTGRES_VECTOR}))"
+            )
+
+
+def uninstall(connection=default_connection):
+    """
+    Drop the search index and its sync triggers.
+
+    Args:
+        connection: The database connection to remove the index from.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS books_book_search_idx')
+
+
+def rebuild(connection=default_connection):
+    """
+    Rebuild the search index from the current contents of ``books_book``.
+
+    Args:
+        connection: The database connection whose index should be rebuilt.
+    """
+    install(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute('REINDEX INDEX books_book_search_idx')
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """
+    ``post_migrate`` receiver that (re)installs the search index.
+
+    Args:
+        sender (AppConfig): The app whose migrations just ran.
+        using (str): Alias of the database that was migrated.
+    """
+    install(connections[using])
+
+
+def parse_terms(query):
+    """
+    Split a raw search string into lower-cased word terms.
+
+    Args:
+        query (str): The text typed into the search box.
+
+    Returns:
+        list[str]: At most ``MAX_TERMS`` terms, punctuation removed.
+    """
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search_book_ids(query, limit, after=None, connection=None):
+    """
+    Find the ids of books matching ``query``, best matches first.
+
+    Every term must match (as a prefix) in the title, author or description.
+    Results are ordered by ``(score, id)`` where a lower score is a better
+    match, which makes ``(score, id)`` usable as a keyset cursor.
+
+    Args:
+        query (str): The raw search string.
+        limit (int): Maximum number of hits to return.
+        after (tuple, optional): ``(score, id)`` of the last hit already seen.
+        connection: The database connection to search; defaults to the one
+            the router picks for reading books (possibly a replica).
+
+    Returns:
+        list[tuple[float, int]]: ``(score, id)`` pairs in rank order.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    if connection is None:
+        from .models import Book
+
+        connection = connections[router.db_for_read(Book)]
+    if after:
+        try:
+            after = (float(after[0]), int(after[1]))
+        except (TypeError, ValueError):
+            after = None
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        inner = (
+            f"SELECT rowid AS id, bm25({FTS_TABLE}, 10.0, 5.0, 1.0) AS score "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        )
+        params = [match]
+    elif connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        inner = (
+            f"SELECT id, -ts_rank({POSTGRES_VECTOR}, to_tsquery('english', %s)) AS score "
+            f"FROM books_book WHERE ({POSTGRES_VECTOR}) @@ to_tsquery('english', %s)"
+        )
+        params = [tsquery, tsquery]
+    else:
+        from .models import Book
+
+        matches = Book.objects.using(connection.alias)
+        for term in terms:
+            matches = matches.filter(
+                Q(title__icontains=term) | Q(author__icontains=term) | Q(description__icontains=term)
+            )
+        if after:
+            matches = matches.filter(pk__gt=after[1])
+        return [(0.0, pk) for pk in matches.order_by('pk').values_list('pk', flat=True)[:limit]]
+
+    sql = f'SELECT id, score FROM ({inner}) hits'
+    if after:
+        sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY score, id LIMIT %s'
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(score, pk) for pk, score in cursor.fetchall()]
+
+
+def search_books(query, limit, after=None, queryset=None):
+    """
+    Return the books matching ``query`` in relevance order.
+
+    Args:
+        query (str): The raw search string.
+        limit (int): Maximum number of books to return.
+        after (tuple, optional): ``(score, id)`` of the last hit already seen.
+        queryset (QuerySet, optional): Base queryset used to load the books,
+            e.g. one restricted with ``.only()``.
+
+    Returns:
+        tuple[list[Book], list[tuple[float, int]]]: The books, and the
+        ``(score, id)`` hits they were loaded from.
+    """
+    from .models import Book
+
+    hits = search_book_ids(query, limit, after=after)
+    queryset = Book.objects.all() if queryset is None else queryset
+    by_id = queryset.in_bulk([pk for _, pk in hits])
+    return [by_id[pk] for _, pk in hits if pk in by_id], hits
@@ -0,0 +1,146 @@
+"""
+Signal receivers that keep derived catalog state in sync with the models.
+
+Receivers defer their work with ``transaction.on_commit`` so that nothing
+derived from a write is published before the write itself is durable.
+"""
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, covers, facets, jobs, renditions
+from .caching import bump_version
+from .cart import invalidate_cart_summary
+from .models import Book, Cart, CartItem, Review, UpcomingBook
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    """Refresh the autocomplete index entries for a saved book."""
+    transaction.on_commit(lambda: autocomplete.book_changed(instance))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    """Drop a deleted book from the autocomplete index."""
+    book_id = instance.pk
+    transaction.on_commit(lambda: autocomplete.book_removed(book_id))
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, using, **kwargs):
+    """Count a new review on its book, inside the review's transaction."""
+    if not created:
+        return
+    written = Value(instance.created_at, output_field=models.DateTimeField())
+    Book.objects.using(using).filter(pk=instance.book_id).update(
+        review_count=F('review_count') + 1,
+        last_reviewed_at=Greatest(Coalesce('last_reviewed_at', written), written),
+        updated_at=Now(),
+    )
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, using, **kwargs):
+    """Uncount a deleted review and find the book's new latest review."""
+    latest = (
+        Review.objects.using(using)
+        .filter(book_id=OuterRef('pk'))
+        .order_by('-created_at')
+        .values('created_at')[:1]
+    )
+    Book.objects.using(using).filter(pk=instance.book_id).update(
+        review_count=Greatest(F('review_count') - 1, 0),
+        last_reviewed_at=Subquery(latest),
+        updated_at=Now(),
+    )
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=UpcomingBook)
+@receiver(post_delete, sender=UpcomingBook)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_home(sender, **kwargs):
+    """Invalidate the cached homepage when any model it shows changes."""
+    transaction.on_commit(lambda: bump_version('home'))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def refresh_facets(sender, **kwargs):
+    """Schedule a rebuild of the facet count summary when a book changes."""
+    transaction.on_commit(facets.schedule_rebuild)
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart(sender, instance, using, **kwargs):
+    """Drop the cached navbar summary of the cart an item belongs to."""
+    if CartItem.cart.is_cached(instance):
+        user_id = instance.cart.user_id
+    else:
+        user_id = Cart.objects.using(using).filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        transaction.on_commit(lambda: invalidate_cart_summary(user_id), using=using)
+
+
+@receiver(post_save, sender=Book)
+def invalidate_cart_prices(sender, instance, **kwargs):
+    """A book's price changed, so every cached cart total containing it is suspect."""
+    if instance._previous_price != instance.price:
+        transaction.on_commit(lambda: bump_version('cart-summary'))
+    instance._previous_price = instance.price
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=UpcomingBook)
+def remember_previous_values(sender, instance, using, update_fields, **kwargs):
+    """
+    Note the cover a row had before this save, so its reference can move,
+    and a book's price, so cart totals are only invalidated when it changes.
+    """
+    previous = {'cover_image': instance.cover_image.name, 'price': instance.price}
+    if instance._state.adding:
+        previous['cover_image'] = ''
+    else:
+        stored = [name for name in ('cover_image', 'price') if update_fields is None or name in update_fields]
+        if stored:
+            row = sender._base_manager.using(using).filter(pk=instance.pk).values(*stored).first()
+            previous.update(row or dict.fromkeys(stored))
+    instance._previous_cover = previous['cover_image'] or ''
+    instance._previous_price = previous['price']
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=UpcomingBook)
+def count_cover_references(sender, instance, **kwargs):
+    """Move a cover reference from the previous image to the saved one."""
+    current = instance.cover_image.name or ''
+    previous = getattr(instance, '_previous_cover', current)
+    if previous != current:
+        covers.release([previous])
+        covers.retain([current])
+    instance._previous_cover = current
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=UpcomingBook)
+def release_cover(sender, instance, **kwargs):
+    """Drop a deleted row's cover reference."""
+    covers.release([instance.cover_image.name or ''])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=UpcomingBook)
+def build_cover_renditions(sender, instance, **kwargs):
+    """Queue a background job to resize a newly uploaded cover."""
+    cover = instance.cover_image
+    if cover and not renditions.has_renditions(cover.name, cover.storage):
+        name = cover.name
+        transaction.on_commit(
+            lambda: jobs.enqueue('build_cover_renditions', {'name': name}, idempotency_key=f'renditions:{name}')
+        )
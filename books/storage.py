@@ -0,0 +1,204 @@
+"""
+Storage backends.
+
+:class:`ContentAddressedStorage` stores book and upcoming book covers (the
+``covers`` entry of ``STORAGES``). Each upload is hashed while it is
+streamed to disk and kept under its SHA-256 digest, e.g.
+``covers/3f/3f9a...c1.jpg``, whatever it was called when uploaded. The same
+image uploaded twice, or used by a book and an upcoming book, is stored
+once; :mod:`books.covers` counts its references. A stored file never
+changes, so its URL can be cached forever.
+
+:class:`CompressedManifestStaticFilesStorage` is the static files storage
+when ``BOOKS_HASHED_STATIC`` is on. ``collectstatic`` then writes every file
+under a content-hashed name such as ``css/styles.4f1c2a9b7e3d.css``, which
+``{% static %}`` links to, so a changed file always gets a new URL. Text
+assets also get ``.gz`` and, when the optional ``brotli`` package is
+installed, ``.br`` variants next to them. :mod:`books.assets` serves those
+without compressing anything per request.
+"""
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# A content-addressed name, or one of its renditions (books.renditions).
+_CONTENT_ADDRESSED = re.compile(r'^covers/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)*$')
+
+# Extensions worth compressing; images and fonts are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico')
+
+# A variant is only kept if it is at most this fraction of the original.
+MIN_SAVING = 0.95
+
+
+def compressed_variants(content):
+    """
+    Compress content with every available encoding.
+
+    Args:
+        content (bytes): The file's bytes.
+
+    Returns:
+        dict[str, bytes]: File suffix (``'.br'``, ``'.gz'``) -> compressed
+        bytes, for encodings that shrink the content enough to be worth it.
+    """
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {
+        suffix: compressed for suffix, compressed in variants.items()
+        if len(compressed) <= len(content) * MIN_SAVING
+    }
+
+
+def is_content_addressed(name):
+    """
+    Check whether a media file name was derived from the file's content.
+
+    Args:
+        name (str): Storage name relative to ``MEDIA_ROOT``.
+
+    Returns:
+        bool: True for :class:`ContentAddressedStorage` names and the
+        renditions stored next to them.
+    """
+    return bool(_CONTENT_ADDRESSED.match(name))
+
+
+def is_staged(name):
+    """
+    Check whether a media file is in the cover staging directory.
+
+    Args:
+        name (str): Path relative to ``MEDIA_ROOT``.
+
+    Returns:
+        bool: True for uploads still being written, or left behind by a
+        failed save, which are never served.
+    """
+    name = posixpath.normpath(name.replace('\\', '/'))
+    return name == ContentAddressedStorage.staging or name.startswith(ContentAddressedStorage.staging + '/')
+
+
+def cover_storage():
+    """Return the storage for cover images; the ``storage`` of both cover fields."""
+    return storages['covers']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after its SHA-256 digest.
+
+    The upload is written to a temporary file in the storage's ``covers``
+    directory while it is hashed, then renamed into place; an upload that
+    is already a temporary file is hashed and moved there instead. When a
+    file with the same digest is already stored, the copy is discarded and
+    the existing name returned. The requested name only contributes its
+    extension.
+    """
+
+    directory = 'covers'
+    # Uploads are written here while they are hashed.
+    staging = f'{directory}/tmp'
+
+    def get_available_name(self, name, max_length=None):
+        # Names come from the content, so a taken name means the same file.
+        return name
+
+    def name_for(self, digest, name):
+        """
+        Return the storage name of content with a given digest.
+
+        Args:
+            digest (str): Hex SHA-256 of the content.
+            name (str): Name the content was uploaded under; only its
+                extension is kept.
+
+        Returns:
+            str: e.g. ``covers/3f/3f9a...c1.jpg``.
+        """
+        return f'{self.directory}/{digest[:2]}/{digest}{os.path.splitext(name)[1].lower()}'
+
+    def _save(self, name, content):
+        staging = self.path(self.staging)
+        os.makedirs(staging, exist_ok=True)
+        # An upload streamed to disk (see books.uploads) is moved rather than
+        # written out a second time.
+        uploaded = content.temporary_file_path() if hasattr(content, 'temporary_file_path') else None
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=staging, delete=False) as temporary:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    if uploaded is None:
+                        temporary.write(chunk)
+            except BaseException:
+                os.unlink(temporary.name)
+                raise
+        name = self.name_for(digest.hexdigest(), name)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.unlink(temporary.name)
+            # Mark it as just used, so a pending prune leaves it alone.
+            os.utime(full_path)
+            return name
+        if uploaded is not None:
+            file_move_safe(uploaded, temporary.name, allow_overwrite=True)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary.name, self.file_permissions_mode)
+        # An atomic rename, so readers never see a partial file and two
+        # uploads of the same image race harmlessly.
+        os.replace(temporary.name, full_path)
+        return name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest (content-hashed) static storage that also precompresses.
+
+    After the usual hashing pass, every compressible file, both under its
+    original and its hashed name, is written again as ``<name>.gz`` and
+    ``<name>.br``. Stale variants of a file that no longer compresses
+    well are removed.
+
+    URLs point at the hashed names even with ``DEBUG`` on, since the
+    storage is only enabled once the files have been collected.
+    """
+
+    def url(self, name, force=False):
+        return super().url(name, force=True)
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(filter(None, names)):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self._compress(name)
+
+    def _compress(self, name):
+        with self.open(name) as file:
+            variants = compressed_variants(file.read())
+        for suffix in ('.gz', '.br'):
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            if suffix in variants:
+                self._save(name + suffix, ContentFile(variants[suffix]))
@@ -0,0 +1,174 @@
+"""
+Seeded synthetic catalog data for tests and benchmarks.
+
+:func:`generate` bulk-inserts books, upcoming books, users with carts and
+reviews. The same seed always produces the same catalog shape: titles,
+prices, which books get reviewed and what is in each cart. Review activity
+is skewed so that a few books get most reviews, as in the real catalog.
+
+Rows are written with ``bulk_create`` in batches, so signals do not fire.
+The denormalised review counters and popularity scores are recomputed
+afterwards, the facet counts and recommendations rebuilt, and the caches
+that depend on the catalog are invalidated.
+"""
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from . import facets, popularity, recommendations
+from .caching import bump_version
+from .models import Book, Cart, CartItem, Review, UpcomingBook
+
+WORDS = (
+    'silent', 'crimson', 'garden', 'winter', 'empire', 'shadow', 'river', 'glass', 'midnight',
+    'letters', 'stone', 'summer', 'kingdom', 'secret', 'ember', 'orchard', 'harbor', 'paper',
+    'storm', 'queen', 'house', 'salt', 'bone', 'city', 'wolves', 'library', 'daughter', 'sea',
+)
+FIRST_NAMES = ('Ada', 'Ben', 'Chidi', 'Dana', 'Elena', 'Farah', 'Goran', 'Hana', 'Ivan', 'Jun')
+LAST_NAMES = ('Armas', 'Black', 'Cole', 'Dube', 'Evans', 'Fischer', 'Garber', 'Haddad', 'Ito', 'Jones')
+
+
+@dataclass
+class SyntheticData:
+    """
+    Ids of the rows created by :func:`generate`.
+
+    Attributes:
+        book_ids (list[int]): Books, in creation order.
+        user_ids (list[int]): Users, each with a cart.
+        upcoming_ids (list[int]): Upcoming books.
+        reviews (int): Number of reviews written.
+    """
+    book_ids: list = field(default_factory=list)
+    user_ids: list = field(default_factory=list)
+    upcoming_ids: list = field(default_factory=list)
+    reviews: int = 0
+
+
+@contextmanager
+def _explicit_timestamps():
+    """Let bulk inserts keep the backdated timestamps they are given."""
+    created_at = Review._meta.get_field('created_at')
+    saved = created_at.auto_now_add
+    created_at.auto_now_add = False
+    try:
+        yield
+    finally:
+        created_at.auto_now_add = saved
+
+
+def _batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def generate(books=1000, reviews=5000, users=50, upcoming=20, cart_items=3, seed=0, prefix='synthetic',
+             batch_size=5000):
+    """
+    Add a synthetic catalog to the database.
+
+    Args:
+        books (int): Number of books.
+        reviews (int): Number of reviews, spread over the books with a
+            skew towards the first ones.
+        users (int): Number of users; each gets a cart.
+        upcoming (int): Number of upcoming books.
+        cart_items (int): Distinct books in each cart.
+        seed (int): Random seed; the same seed gives the same data.
+        prefix (str): Username prefix, so several data sets can coexist.
+        batch_size (int): Rows per INSERT.
+
+    Returns:
+        SyntheticData: Ids of what was created.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    data = SyntheticData()
+
+    def title():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+
+    def author():
+        return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+    password = make_password(None)
+    with transaction.atomic():
+        for start in range(0, users, batch_size):
+            created = User.objects.bulk_create([
+                User(username=f'{prefix}-{index}', password=password)
+                for index in range(start, min(start + batch_size, users))
+            ])
+            data.user_ids.extend(user.pk for user in created)
+
+        for start in range(0, books, batch_size):
+            created = Book.objects.bulk_create([
+                Book(
+                    title=f'{title()} {index}',
+                    author=author(),
+                    description=' '.join(rng.choice(WORDS) for _ in range(30)),
+                    price=Decimal(rng.randint(500, 60000)) / 100,
+                    release_date=(now - timedelta(days=rng.randint(30, 3650))).date(),
+                )
+                for index in range(start, min(start + batch_size, books))
+            ])
+            data.book_ids.extend(book.pk for book in created)
+
+        created = UpcomingBook.objects.bulk_create([
+            UpcomingBook(
+                title=title(), author=author(), description=' '.join(rng.choice(WORDS) for _ in range(20)),
+                release_date=(now + timedelta(days=rng.randint(1, 365))).date(),
+                price=Decimal(rng.randint(500, 60000)) / 100,
+            )
+            for _ in range(upcoming)
+        ])
+        data.upcoming_ids.extend(book.pk for book in created)
+
+        if data.user_ids:
+            carts = Cart.objects.bulk_create([Cart(user_id=user_id) for user_id in data.user_ids])
+            per_cart = min(cart_items, len(data.book_ids))
+            for batch in _batched(carts, max(1, batch_size // max(per_cart, 1))):
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, book_id=book_id, quantity=rng.randint(1, 3))
+                    for cart in batch
+                    for book_id in rng.sample(data.book_ids, per_cart)
+                ])
+
+        if data.book_ids and data.user_ids:
+            with _explicit_timestamps():
+                for start in range(0, reviews, batch_size):
+                    Review.objects.bulk_create([
+                        Review(
+                            book_id=data.book_ids[int(len(data.book_ids) * rng.random() ** 3)],
+                            user_id=rng.choice(data.user_ids),
+                            content=' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))),
+                            created_at=now - timedelta(minutes=rng.randint(0, 525_600)),
+                        )
+                        for _ in range(start, min(start + batch_size, reviews))
+                    ])
+            data.reviews = reviews
+            _refresh_review_counters(data.book_ids)
+
+    popularity.recompute()
+    for namespace in ('home', 'autocomplete', 'cart-summary'):
+        bump_version(namespace)
+    facets.rebuild()
+    recommendations.build(full=True)
+    return data
+
+
+def _refresh_review_counters(book_ids):
+    """Recompute review_count and last_reviewed_at, which bulk inserts skip."""
+    reviews = Review.objects.filter(book=OuterRef('pk'))
+    reviewed = Review.objects.filter(book__pk__range=(book_ids[0], book_ids[-1])).values('book_id')
+    Book.objects.filter(pk__in=reviewed).update(
+        review_count=Subquery(reviews.values('book').annotate(total=Count('pk')).values('total')[:1]),
+        last_reviewed_at=Subquery(reviews.order_by('-created_at').values('created_at')[:1]),
+    )
@@ -0,0 +1,51 @@
+"""
+Background tasks run by the ``runworker`` command.
+
+Importing this module registers the tasks with :mod:`books.jobs`.
+"""
+from django.core.management import call_command
+
+from . import covers, facets, recommendations, renditions, search
+from .jobs import task
+
+
+@task()
+def build_cover_renditions(name, force=False):
+    """Generate the resized renditions of one stored cover image."""
+    renditions.generate(name, force=force)
+
+
+@task()
+def build_recommendations(full=False):
+    """Recompute the "readers also reviewed" lists touched by new reviews."""
+    recommendations.build(full=full)
+
+
+@task()
+def prune_covers():
+    """Delete stored covers that nothing has used for the grace period."""
+    covers.prune()
+
+
+@task()
+def rebuild_facets():
+    """Regenerate the catalog facet count summary."""
+    facets.rebuild()
+
+
+@task()
+def rebuild_search_index():
+    """Rebuild the full-text catalog search index."""
+    search.rebuild()
+
+
+@task()
+def promote_releases():
+    """Publish upcoming titles whose release date has arrived."""
+    call_command('promote_releases')
+
+
+@task()
+def recompute_popularity():
+    """Recompute popularity scores and the popular flags."""
+    call_command('recompute_popularity')
@@ -0,0 +1,59 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from books import renditions
+
+register = template.Library()
+
+# The rendered width of each layout, for the browser to pick a rendition.
+SIZES = {
+    'card': '(min-width: 768px) 25vw, 100vw',
+    'detail': '(min-width: 768px) 33vw, 100vw',
+}
+
+
+@register.simple_tag
+def cover_image(book, layout='card', css_class='', alt=None, default=None):
+    """
+    Render a book's cover as a lazy-loaded, responsive ``<picture>``.
+
+    Falls back to the original upload until its renditions exist, and to
+    the ``default`` static image (if given) when the book has no cover.
+
+    Args:
+        book (Book or UpcomingBook): The book whose cover to render.
+        layout (str): ``'card'`` or ``'detail'``; sets the ``sizes`` hint
+            and the fallback rendition.
+        css_class (str): CSS classes for the ``<img>``.
+        alt (str, optional): Alt text; defaults to the book title.
+        default (str, optional): Static path of a placeholder image.
+
+    Returns:
+        str: The HTML markup, or an empty string.
+    """
+    alt = book.title if alt is None else alt
+    cover = book.cover_image
+    if not cover:
+        if default is None:
+            return ''
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+            static(default), css_class, alt,
+        )
+    if not renditions.has_renditions(cover.name, cover.storage):
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+            cover.url, css_class, alt,
+        )
+    fallback = 'card' if layout == 'card' else 'detail'
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        renditions.srcset(cover.name, 'webp', cover.storage), SIZES.get(layout, SIZES['card']),
+        cover.storage.url(renditions.rendition_name(cover.name, fallback, 'jpg')),
+        renditions.srcset(cover.name, 'jpg', cover.storage), SIZES.get(layout, SIZES['card']),
+        css_class, alt,
+    )
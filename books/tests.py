@@ -1,3 +1,1196 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import addModuleCleanup, mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from bookvault import urls as root_urls
+
+from . import (
+    async_views, autocomplete, caching, covers, facets, jobs, popularity, recommendations, releases, renditions,
+    synthetic,
+)
+from . import urls as books_urls
+from .api import make_etag
+from .forms import UpcomingBookForm
+from .management.commands import explain_views
+from .assets import IMMUTABLE
+from .cart import get_cart_summary
+from .routers import PrimaryPinningMiddleware
+from .models import Book, BookNeighbour, Cart, CartItem, Job, Review, StoredFile, UpcomingBook
+from .search import search_books
+from .templatetags.covers import cover_image
+from .views import build_home_context
+
+# Size of the catalog the query counts are pinned against. Large enough that
+# a per-row query in a listing, cart or review page would blow the counts.
+CATALOG = {'books': 2000, 'reviews': 10000, 'users': 20, 'upcoming': 10, 'cart_items': 25, 'seed': 1}
+
+
+# Tests never use the configured cache, which real web and job processes
+# share. Most run on a per-process LocMemCache; tests of invalidation across
+# processes share a throwaway file cache with the processes they start.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SHARED_CACHE_DIR = tempfile.TemporaryDirectory()
+SHARED_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': SHARED_CACHE_DIR.name},
+}
+
+
+def run_in_another_process(code):
+    """Run ``code`` with ``manage.py shell`` against ``SHARED_CACHE``."""
+    subprocess.run(
+        [sys.executable, 'manage.py', 'shell', '-c', code], cwd=settings.BASE_DIR, check=True, capture_output=True,
+        env={**os.environ, 'BOOKS_REDIS_URL': '', 'BOOKS_CACHE_DIR': SHARED_CACHE_DIR.name},
+    )
+
+
+def setUpModule():
+    caches_override = override_settings(CACHES=LOCAL_CACHE)
+    caches_override.enable()
+    addModuleCleanup(caches_override.disable)
+    addModuleCleanup(SHARED_CACHE_DIR.cleanup)
+    # Keep the per-request JSON lines out of the test output; budget warnings still show.
+    performance = logging.getLogger('books.performance')
+    addModuleCleanup(performance.setLevel, performance.level)
+    performance.setLevel(logging.WARNING)
+
+
+@override_settings(BOOKS_QUERY_BUDGET_MODE='raise')
+class QueryCountTestCase(TestCase):
+    """
+    Base class for tests that pin how many queries a view makes.
+
+    Runs against a seeded synthetic catalog with query budgets enforced, so
+    a view also fails if it goes over its ``BOOKS_QUERY_BUDGETS`` entry.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = synthetic.generate(**CATALOG)
+        cls.user = User.objects.get(pk=cls.data.user_ids[0])
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        # Review activity is skewed towards the first books generated.
+        cls.hot_book = Book.objects.get(pk=cls.data.book_ids[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, user=None):
+        self.client.force_login(user or self.user)
+
+
+class CatalogViewQueryTests(QueryCountTestCase):
+
+    def test_home_is_built_once_then_served_from_cache(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+
+    def test_home_cache_holds_only_rendered_columns(self):
+        context = build_home_context()
+        review = context['recent_reviews'][0]
+        self.assertEqual(
+            {field.attname for field in User._meta.concrete_fields} - review.user.get_deferred_fields(),
+            {'id', 'username'},
+        )
+        self.assertIn('description', review.book.get_deferred_fields())
+        self.assertIn('description', context['popular_books'][0].get_deferred_fields())
+
+    def test_book_list(self):
+        # The page, plus one grouped query for every facet's counts.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book_list'))
+        self.assertEqual(len(response.context['books']), 24)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('book_list'))
+
+    def test_book_list_with_facets(self):
+        params = {'price': '10-25', 'author': self.hot_book.author, 'state': 'popular'}
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book_list'), params)
+        books = Book.objects.filter(price__gte=10, price__lt=25, author=self.hot_book.author, is_popular=True)
+        self.assertEqual({book.pk for book in response.context['books']}, set(books.values_list('pk', flat=True)[:24]))
+        counts = {facet['name']: facet['options'] for facet in response.context['facets']}
+        price = next(option for option in counts['price'] if option['active'])
+        self.assertEqual(price['count'], books.count())
+
+    def test_book_list_next_page(self):
+        first = self.client.get(reverse('book_list'), {'sort': 'price'})
+        with self.assertNumQueries(1):
+            self.client.get(reverse('book_list') + first.context['next_url'])
+
+    def test_search(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book_list'), {'q': 'silent garden'})
+        self.assertTrue(response.context['books'])
+
+    def test_popular_books(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('popular_books'))
+
+    def test_autocomplete_is_served_from_memory(self):
+        autocomplete.rebuild()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('book_autocomplete'), {'q': 'si'})
+        self.assertTrue(response.json()['results'])
+
+    def test_book_detail_of_most_reviewed_book(self):
+        self.assertGreater(self.hot_book.review_count, 100)
+        # The book, its first page of reviews and its stored recommendations.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('book_detail', args=[self.hot_book.pk]))
+        self.assertEqual(len(response.context['reviews']), 20)
+        self.assertEqual(len(response.context['recommended']), 8)
+
+    def test_book_reviews_page(self):
+        first = self.client.get(reverse('book_detail', args=[self.hot_book.pk]))
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('book_reviews', args=[self.hot_book.pk]), {'cursor': first.context['reviews'].next_cursor},
+            )
+        self.assertTrue(response.json()['next_cursor'])
+
+    def test_upcoming_books(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('upcoming_books'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('upcoming_book_detail', args=[self.data.upcoming_ids[0]]))
+
+    def test_signup_form(self):
+        with self.assertNumQueries(0):
+            self.client.get(reverse('signup'))
+
+
+@override_settings(BOOKS_ASYNC_VIEWS=True)
+class AsyncCatalogViewTests(QueryCountTestCase):
+    """The catalog pages as routed under ASGI, requested through the async client."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Registered first so it runs last, once BOOKS_ASYNC_VIEWS is restored.
+        cls.addClassCleanup(cls.reload_urls)
+        super().setUpClass()
+        cls.reload_urls()
+
+    @staticmethod
+    def reload_urls():
+        """Route the catalog by the current BOOKS_ASYNC_VIEWS, which the URLconfs read on import."""
+        importlib.reload(books_urls)
+        importlib.reload(root_urls)
+        clear_url_caches()
+
+    def get(self, *args, **kwargs):
+        """Request through the async client, so queries can be counted in this thread."""
+        return async_to_sync(self.async_client.get)(*args, **kwargs)
+
+    def test_home(self):
+        with self.assertNumQueries(3):
+            response = self.get(reverse('home'))
+        self.assertIs(response.resolver_match.func, async_views.home)
+        self.assertEqual(len(response.context['recent_reviews']), 5)
+        with self.assertNumQueries(0):
+            self.get(reverse('home'))
+
+    def test_book_list(self):
+        with self.assertNumQueries(2):
+            response = self.get(reverse('book_list'), {'sort': 'price'})
+        self.assertIs(response.resolver_match.func, async_views.book_list)
+        self.assertEqual(len(response.context['books']), 24)
+        with self.assertNumQueries(1):
+            following = self.get(reverse('book_list') + response.context['next_url'])
+        prices = [book.price for book in [*response.context['books'], *following.context['books']]]
+        self.assertEqual(prices, sorted(prices))
+
+    def test_book_list_search(self):
+        with self.assertNumQueries(2):
+            response = self.get(reverse('book_list'), {'q': 'silent garden'})
+        self.assertTrue(response.context['books'])
+        self.assertEqual(response.context['facets'], [])
+
+    def test_book_detail(self):
+        with self.assertNumQueries(3):
+            response = self.get(reverse('book_detail', args=[self.hot_book.pk]))
+        self.assertIs(response.resolver_match.func, async_views.book_detail)
+        self.assertEqual(response.context['book'], self.hot_book)
+        self.assertEqual(len(response.context['reviews']), 20)
+        self.assertEqual(len(response.context['recommended']), 8)
+
+    def test_book_detail_of_missing_book(self):
+        response = self.get(reverse('book_detail', args=[max(self.data.book_ids) + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_upcoming_books(self):
+        with self.assertNumQueries(1):
+            response = self.get(reverse('upcoming_books'))
+        self.assertIs(response.resolver_match.func, async_views.upcoming_books)
+        dates = [book.release_date for book in response.context['upcoming_books']]
+        self.assertTrue(dates)
+        self.assertEqual(dates, sorted(dates))
+
+
+class CartViewQueryTests(QueryCountTestCase):
+
+    def test_cart_detail_does_not_query_per_item(self):
+        self.login()
+        # Session, user, cart items with totals, navbar cart summary.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(len(response.context['items']), CATALOG['cart_items'])
+
+    def test_add_to_cart_existing_item(self):
+        self.login()
+        item = CartItem.objects.filter(cart__user=self.user).first()
+        with self.assertNumQueries(5):
+            self.client.post(reverse('add_to_cart', args=[item.book_id]))
+        item.refresh_from_db()
+        self.assertGreaterEqual(item.quantity, 2)
+
+    def test_add_to_cart_new_item(self):
+        self.login()
+        in_cart = CartItem.objects.filter(cart__user=self.user).values_list('book_id', flat=True)
+        book = Book.objects.exclude(pk__in=in_cart).first()
+        with self.assertNumQueries(10):
+            self.client.post(reverse('add_to_cart', args=[book.pk]))
+        self.assertTrue(CartItem.objects.filter(cart__user=self.user, book=book).exists())
+
+    def test_update_cart_is_one_bulk_update(self):
+        self.login()
+        items = list(CartItem.objects.filter(cart__user=self.user))
+        data = {f'quantity-{item.pk}': 5 for item in items}
+        # Session, user, the locked items and one bulk UPDATE, plus SAVEPOINT/RELEASE.
+        with self.assertNumQueries(6):
+            self.client.post(reverse('update_cart'), data)
+        self.assertEqual({item.quantity for item in CartItem.objects.filter(cart__user=self.user)}, {5})
+
+    def test_remove_from_cart(self):
+        self.login()
+        item = CartItem.objects.filter(cart__user=self.user).first()
+        with self.assertNumQueries(5):
+            self.client.post(reverse('remove_from_cart', args=[item.pk]))
+        self.assertFalse(CartItem.objects.filter(pk=item.pk).exists())
+
+
+class CartItemQuantityMigrationTests(TransactionTestCase):
+
+    def test_empty_items_are_deleted_before_the_constraint(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('books', '0013_book_upcomingbook_updated_at')])
+        apps = executor.loader.project_state([('books', '0013_book_upcomingbook_updated_at')]).apps
+        user = apps.get_model('auth', 'User').objects.create(username='reader')
+        cart = apps.get_model('books', 'Cart').objects.create(user_id=user.pk)
+        Book = apps.get_model('books', 'Book')
+        books = [Book.objects.create(title=title, author='A', description='', price=Decimal('9.00'))
+                 for title in ('Caraval', 'Legendary')]
+        CartItem = apps.get_model('books', 'CartItem')
+        kept = CartItem.objects.create(cart_id=cart.pk, book_id=books[0].pk, quantity=2)
+        CartItem.objects.create(cart_id=cart.pk, book_id=books[1].pk, quantity=0)
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        self.assertEqual(list(CartItem.objects.values_list('pk', flat=True)), [kept.pk])
+
+
+class ExplainViewsTests(QueryCountTestCase):
+
+    def test_catalog_views_scan_and_sort_only_where_expected(self):
+        out = StringIO()
+        # Start without an index, so autocomplete's build is explained too.
+        with mock.patch.object(autocomplete.index, 'version', None):
+            flagged = explain_views.Command(stdout=out)._explain(explain_views.SCENARIOS, self.data, verbose=False)
+        self.assertEqual(flagged, 0, out.getvalue())
+        self.assertIn('book_autocomplete: ', out.getvalue())
+
+    def test_plan_problems(self):
+        sql = 'SELECT * FROM "books_review" ORDER BY "books_review"."content"'
+        plan = ['SCAN books_review', 'USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(explain_views.plan_problems(sql, plan), plan)
+        self.assertEqual(explain_views.plan_problems(sql, plan, expected_tables={'books_review'}), [])
+        limited = 'SELECT * FROM "books_review" ORDER BY "books_review"."id" ASC LIMIT 21'
+        self.assertEqual(explain_views.plan_problems(limited, ['SCAN books_review']), [])
+
+
+class WriteViewQueryTests(QueryCountTestCase):
+
+    def test_add_review_updates_counters(self):
+        self.login()
+        before = self.hot_book.review_count
+        with self.assertNumQueries(7):
+            self.client.post(reverse('add_review', args=[self.hot_book.pk]), {'content': 'Loved it.'})
+        self.hot_book.refresh_from_db()
+        self.assertEqual(self.hot_book.review_count, before + 1)
+
+    def test_upload_upcoming_book_form(self):
+        self.login(self.staff)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('upload_upcoming_book'))
+
+    def test_export_streams_in_constant_queries(self):
+        self.login(self.staff)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('export_dataset', args=['reviews', 'csv']))
+            rows = b''.join(response.streaming_content).count(b'\n')
+        self.assertEqual(rows, Review.objects.count() + 1)
+
+
+class ApiQueryTests(QueryCountTestCase):
+
+    def test_book_collection_and_not_modified(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_books'), {'fields': 'id,title,price'})
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                reverse('api_books'), {'fields': 'id,title,price'}, HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(cached.status_code, 304)
+
+    def test_collection_ignores_if_modified_since(self):
+        url = reverse('api_books')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        Book.objects.filter(pk=response.json()['results'][0]['id']).delete()
+        refetched = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(refetched.status_code, 200)
+
+    def test_book_detail_not_modified_after_write_is_refetched(self):
+        url = reverse('api_book', args=[self.hot_book.pk])
+        etag = self.client.get(url)['ETag']
+        self.hot_book.title = 'Renamed'
+        self.hot_book.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_book_reviews(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('api_book_reviews', args=[self.hot_book.pk]))
+
+    def test_upcoming(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('api_upcoming_books'))
+        with self.assertNumQueries(2):
+            self.client.get(reverse('api_upcoming_book', args=[self.data.upcoming_ids[0]]))
+
+    def test_etag_depends_on_every_part(self):
+        self.assertNotEqual(make_etag('books.book', 1, 'a'), make_etag('books.book', 1, 'b'))
+        self.assertEqual(make_etag('books.book', 1, 'a'), make_etag('books.book', 1, 'a'))
+
+
+class SearchTests(TestCase):
+
+    def book(self, title, author='Stephanie Garber', description=''):
+        return Book.objects.create(title=title, author=author, description=description, price=Decimal('9.00'))
+
+    def titles(self, query):
+        return [book.title for book in search_books(query, 10)[0]]
+
+    def test_terms_match_as_prefixes_title_first(self):
+        self.book('Caraval', description='A cruel game for a princely prize.')
+        self.book('The Cruel Prince', 'Holly Black')
+        self.assertEqual(self.titles('cru pri'), ['The Cruel Prince', 'Caraval'])
+        self.assertEqual(self.titles('HOL bla'), ['The Cruel Prince'])
+        self.assertEqual(self.titles('cruel zzz'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        book = self.book('Caraval')
+        book.title = 'Legendary'
+        book.save()
+        self.assertEqual(self.titles('cara'), [])
+        self.assertEqual(self.titles('legend'), ['Legendary'])
+        Book.objects.filter(pk=book.pk).update(author='Holly Black')
+        self.assertEqual(self.titles('holly'), ['Legendary'])
+        self.assertEqual(self.titles('garber'), [])
+        book.delete()
+        self.assertEqual(self.titles('legend'), [])
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.rebuild()
+
+    def labels(self, prefix):
+        return [suggestion['label'] for suggestion in autocomplete.suggest(prefix)]
+
+    def test_saves_and_deletes_patch_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='The Cruel Prince', author='Holly Black', price=Decimal('9.00'))
+        self.assertEqual(self.labels('cru'), ['The Cruel Prince'])
+        self.assertEqual(self.labels('black'), ['Holly Black'])
+        version = autocomplete.index.version
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertEqual(self.labels('cru'), [])
+        self.assertEqual(autocomplete.index.version, version + 1)
+
+    def test_cap_logs_how_many_books_are_left_out(self):
+        Book.objects.bulk_create([
+            Book(title=f'Caraval {n}', author='Stephanie Garber', price=Decimal('9.00')) for n in range(3)
+        ])
+        capped = autocomplete.PrefixIndex(max_entries=8)
+        with self.assertLogs('books.autocomplete', 'WARNING') as logs:
+            capped.build(Book.objects.order_by('-id').values_list('id', 'title', 'author'))
+        self.assertIn('2 books indexed, 1 older books left out', logs.output[0])
+
+    def test_write_racing_another_process_leaves_the_index_stale(self):
+        book = Book.objects.create(title='Caraval', author='Stephanie Garber', price=Decimal('9.00'))
+        Book.objects.bulk_create([Book(title='Legendary', author='Stephanie Garber', price=Decimal('9.00'))])
+        add = autocomplete.index.add
+
+        def add_while_another_process_writes(*args):
+            caching.bump_version(autocomplete.NAMESPACE)
+            add(*args)
+
+        with mock.patch.object(autocomplete.index, 'add', add_while_another_process_writes):
+            autocomplete.book_changed(book)
+        self.assertNotEqual(autocomplete.index.version, caching.get_version(autocomplete.NAMESPACE))
+        with mock.patch.object(autocomplete, 'rebuild_in_background') as rebuild_in_background:
+            self.assertEqual(self.labels('legend'), [])
+        rebuild_in_background.assert_called_once_with()
+
+
+class AutocompleteRefreshTests(TransactionTestCase):
+    """The background rebuild reads on its own connection, so its rows must be committed."""
+
+    def test_stale_index_is_rebuilt_off_the_request_path(self):
+        autocomplete.rebuild()
+        Book.objects.bulk_create([Book(title='Caraval', author='Stephanie Garber', price=Decimal('9.00'))])
+        caching.bump_version(autocomplete.NAMESPACE)
+        release, rebuild = threading.Event(), autocomplete.rebuild
+
+        def slow_rebuild():
+            release.wait()
+            rebuild()
+
+        with mock.patch.object(autocomplete, 'rebuild', slow_rebuild):
+            self.assertEqual(autocomplete.suggest('cara'), [])
+            running = autocomplete.rebuild_in_background()
+            release.set()
+            running.join()
+        self.assertEqual([suggestion['label'] for suggestion in autocomplete.suggest('cara')], ['Caraval'])
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class CachingTests(SimpleTestCase):
+
+    def test_version_bumps_reach_other_processes(self):
+        before = caching.get_version('home')
+        run_in_another_process("from books.caching import bump_version; bump_version('home')")
+        self.assertEqual(caching.get_version('home'), before + 1)
+
+    def test_evicted_version_does_not_go_back(self):
+        before = caching.bump_version('home')
+        cache.delete('books:home:version')
+        self.assertGreater(caching.get_version('home'), before)
+
+
+@override_settings(BOOKS_READ_REPLICAS=['test_replica'], BOOKS_REPLICA_SELECTION='round_robin')
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Route against a second database file that holds different rows from the
+    primary. The alias only exists while these tests run, so it is added to
+    ``databases`` once it has been created.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        primary = connections.settings['default']
+        connections.settings['test_replica'] = {
+            **primary,
+            'NAME': str(Path(cls.replica_dir.name) / 'replica.sqlite3'),
+            'TEST': {**primary['TEST'], 'NAME': str(Path(cls.replica_dir.name) / 'test_replica.sqlite3')},
+        }
+        connections['test_replica'].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        cls.databases = {'default', 'test_replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['test_replica'].close()
+        del connections['test_replica']
+        del connections.settings['test_replica']
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        fields = {'author': 'A', 'description': '', 'price': Decimal('9.00')}
+        self.book = Book.objects.create(title='On the primary', **fields)
+        Book.objects.using('test_replica').create(pk=self.book.pk, title='On the replica', **fields)
+
+    def test_catalog_reads_use_the_replica(self):
+        response = self.client.get(reverse('api_book', args=[self.book.pk]))
+        self.assertEqual(response.json()['title'], 'On the replica')
+        self.assertNotIn(settings.BOOKS_PRIMARY_PIN_COOKIE, response.cookies)
+
+    def test_reads_after_a_write_use_the_primary(self):
+        titles = []
+
+        def view(request):
+            titles.append(Book.objects.get(pk=self.book.pk).title)
+            Book.objects.filter(pk=self.book.pk).update(title='Renamed')
+            titles.append(Book.objects.get(pk=self.book.pk).title)
+            return HttpResponse()
+
+        response = PrimaryPinningMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(titles, ['On the replica', 'Renamed'])
+        self.assertEqual(Book.objects.using('test_replica').get().title, 'On the replica')
+        self.assertEqual(response.cookies[settings.BOOKS_PRIMARY_PIN_COOKIE]['max-age'],
+                         settings.BOOKS_PRIMARY_PIN_SECONDS)
+
+    def test_pinned_and_unsafe_requests_use_the_primary(self):
+        self.client.cookies[settings.BOOKS_PRIMARY_PIN_COOKIE] = '1'
+        response = self.client.get(reverse('api_book', args=[self.book.pk]))
+        self.assertEqual(response.json()['title'], 'On the primary')
+        titles = []
+
+        def view(request):
+            titles.append(Book.objects.get(pk=self.book.pk).title)
+            return HttpResponse()
+
+        PrimaryPinningMiddleware(view)(RequestFactory().post('/'))
+        self.assertEqual(titles, ['On the primary'])
+
+
+class FacetSummaryTests(TestCase):
+
+    def test_counts_read_the_summary_through_its_indexes(self):
+        self.assertIn('facet_author_idx', facets._grouped({'author': 'Holly Black'}, 'price', 'price_band').explain())
+        self.assertIn('COVERING INDEX facet_author_idx', facets._grouped({}, 'author', 'author').explain())
+        self.assertIn('facet_release_year_idx', facets._grouped({'year': '2020'}, 'author', 'author').explain())
+
+
+class SQLitePragmaTests(SimpleTestCase):
+
+    def connect(self):
+        """Open a new connection to a throwaway database file."""
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        primary = connections['default']
+        wrapper = type(primary)({**primary.settings_dict, 'NAME': str(Path(directory) / 'db.sqlite3')}, 'pragmas')
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(BOOKS_SQLITE_WAL=True)
+    def test_new_connections_apply_the_pragmas(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), settings.BOOKS_SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)
+
+    @override_settings(BOOKS_SQLITE_WAL=False)
+    def test_journal_mode_is_left_alone_unless_wal_is_on(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), settings.BOOKS_SQLITE_PRAGMAS['busy_timeout'])
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class FacetCacheTests(TestCase):
+
+    def test_rebuild_in_another_process_refreshes_counts(self):
+        fields = {'author': 'Stephanie Garber', 'description': '', 'price': Decimal('9.00')}
+        Book.objects.create(title='Caraval', **fields)
+        facets.rebuild()
+        self.assertEqual(dict(facets.counts({})['author']), {'Stephanie Garber': 1})
+        # As in runworker: the summary changes here, the version bump comes from elsewhere.
+        Book.objects.create(title='Legendary', **fields)
+        facets.rebuild()
+        self.assertEqual(dict(facets.counts({})['author']), {'Stephanie Garber': 1})
+        run_in_another_process(
+            'from books import facets; from books.caching import bump_version; bump_version(facets.NAMESPACE)'
+        )
+        self.assertEqual(dict(facets.counts({})['author']), {'Stephanie Garber': 2})
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class CartSummaryTests(TestCase):
+
+    def test_invalidation_reaches_other_processes(self):
+        user = User.objects.create_user('reader')
+        cart = Cart.objects.create(user=user)
+        book = Book.objects.create(title='Caraval', author='A', description='', price=Decimal('9.00'))
+        CartItem.objects.bulk_create([CartItem(cart=cart, book=book, quantity=1)])
+        self.assertEqual(get_cart_summary(user.pk)['quantity'], 1)
+        CartItem.objects.filter(cart=cart).update(quantity=3)
+        self.assertEqual(get_cart_summary(user.pk)['quantity'], 1)
+        run_in_another_process(f'from books.cart import invalidate_cart_summary; invalidate_cart_summary({user.pk})')
+        self.assertEqual(get_cart_summary(user.pk), {'quantity': 3, 'total': Decimal('27.00')})
+
+    def test_only_price_changes_invalidate_every_cart(self):
+        book = Book.objects.create(title='Caraval', author='A', description='', price=Decimal('9.00'))
+        version = caching.get_version('cart-summary')
+        with self.captureOnCommitCallbacks(execute=True):
+            book.title = 'Caraval (paperback)'
+            book.save()
+            book.popularity_score = 3
+            book.save(update_fields=['popularity_score'])
+        self.assertEqual(caching.get_version('cart-summary'), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            book.price = Decimal('11.00')
+            book.save(update_fields=['price'])
+        self.assertEqual(caching.get_version('cart-summary'), version + 1)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.enterContext(mock.patch.dict(jobs.TASKS, {'record': self.record, 'fail': self.fail}))
+
+    def record(self, **payload):
+        self.calls.append(payload)
+
+    def fail(self):
+        raise RuntimeError('boom')
+
+    def test_failed_job_backs_off_then_fails_for_good(self):
+        job = jobs.enqueue('fail', max_attempts=2)
+        self.assertEqual(jobs.claim('worker', 10), [job.pk])
+        failed_at = timezone.now()
+        with self.assertLogs('books.jobs', 'WARNING') as logs:
+            self.assertEqual(jobs.run(job.pk), Job.QUEUED)
+        self.assertIn('failed; retrying', logs.output[0])
+        job.refresh_from_db()
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreaterEqual(job.run_at, failed_at + timedelta(seconds=settings.BOOKS_JOBS_BACKOFF_BASE))
+        self.assertEqual(jobs.claim('worker', 10), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.claim('worker', 10), [job.pk])
+        with self.assertLogs('books.jobs', 'ERROR') as logs:
+            self.assertEqual(jobs.run(job.pk), Job.FAILED)
+        self.assertIn('failed permanently', logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.locked_by), (2, ''))
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(BOOKS_JOBS_BACKOFF_BASE=10, BOOKS_JOBS_BACKOFF_MAX=60)
+    def test_backoff_doubles_up_to_the_cap(self):
+        for attempts, seconds in ((1, 10), (2, 20), (3, 40), (4, 60), (10, 60)):
+            delay = jobs.backoff(attempts).total_seconds()
+            self.assertTrue(seconds <= delay <= seconds * 1.1, (attempts, delay))
+
+    def test_idempotency_key_dedupes_only_pending_jobs(self):
+        first = jobs.enqueue('record', {'n': 1}, idempotency_key='key')
+        self.assertEqual(jobs.enqueue('record', {'n': 2}, idempotency_key='key'), first)
+        jobs.claim('worker', 10)
+        self.assertEqual(jobs.enqueue('record', {'n': 2}, idempotency_key='key'), first)
+        self.assertEqual(jobs.run(first.pk), Job.SUCCEEDED)
+        again = jobs.enqueue('record', {'n': 3}, idempotency_key='key')
+        self.assertNotEqual(again.pk, first.pk)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = jobs.enqueue('record')
+        jobs.claim('crashed', 10)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        stale = timezone.now() - timedelta(seconds=settings.BOOKS_JOBS_LOCK_TIMEOUT + 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=stale)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim('worker', 10), [job.pk])
+
+    def test_job_that_keeps_killing_its_worker_fails(self):
+        job = jobs.enqueue('record', max_attempts=2)
+        stale = timezone.now() - timedelta(seconds=settings.BOOKS_JOBS_LOCK_TIMEOUT + 1)
+        for attempt in (1, 2):
+            self.assertEqual(jobs.claim('crashed', 10), [job.pk])
+            Job.objects.filter(pk=job.pk).update(locked_at=stale)
+            if attempt == 1:
+                self.assertEqual(jobs.requeue_stale(), 1)
+        with self.assertLogs('books.jobs', 'ERROR'):
+            self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.claim('worker', 10), [])
+
+    @override_settings(BOOKS_JOBS_RETENTION_DAYS=7)
+    def test_prune_finished_keeps_recent_and_pending_jobs(self):
+        old = timezone.now() - timedelta(days=8)
+        expired = [jobs.enqueue('record') for _ in range(2)]
+        Job.objects.filter(pk=expired[0].pk).update(status=Job.SUCCEEDED, finished_at=old)
+        Job.objects.filter(pk=expired[1].pk).update(status=Job.FAILED, finished_at=old)
+        recent = jobs.enqueue('record')
+        Job.objects.filter(pk=recent.pk).update(status=Job.SUCCEEDED, finished_at=timezone.now())
+        pending = jobs.enqueue('record')
+        self.assertEqual(jobs.prune_finished(), 2)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+
+class ImportBooksTests(TestCase):
+
+    FIELDS = ['isbn', 'title', 'author', 'price', 'cover']
+
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(MEDIA_ROOT=self.directory / 'media'))
+
+    def feed(self, rows):
+        path = self.directory / 'feed.csv'
+        with open(path, 'w', newline='') as stream:
+            writer = csv.DictWriter(stream, self.FIELDS)
+            writer.writeheader()
+            writer.writerows(dict(zip(self.FIELDS, row)) for row in rows)
+        return path
+
+    def run_import(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', str(path), '--batch-size', '2', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_upserts_on_isbn_and_reports_invalid_records(self):
+        Book.objects.create(isbn='9780000000002', title='Old', author='A', description='', price=Decimal('1.00'))
+        path = self.feed([
+            ('978-0-00-000000-1', 'Caraval', 'Stephanie Garber', '9.99', ''),
+            ('not an isbn', 'Legendary', 'Stephanie Garber', '9.99', ''),
+            ('9780000000002', 'New', 'B', 'free', ''),
+            ('9780000000002', 'New', 'B', '12.50', ''),
+        ])
+        _, errors = self.run_import(path)
+        self.assertIn('Record 2: isbn:', errors)
+        self.assertIn('Record 3: price:', errors)
+        books = dict(Book.objects.values_list('isbn', 'title'))
+        self.assertEqual(books, {'9780000000001': 'Caraval', '9780000000002': 'New'})
+        self.assertEqual(Book.objects.get(isbn='9780000000002').price, Decimal('12.50'))
+        self.assertFalse(Path(f'{path}.checkpoint').exists())
+
+    def test_resumes_from_the_checkpoint(self):
+        path = self.feed([(f'978000000000{n}', f'Book {n}', 'A', '9.00', '') for n in range(1, 6)])
+        bulk_create, batches = Book.objects.bulk_create, []
+
+        def interrupted(*args, **kwargs):
+            batches.append(args)
+            if len(batches) == 2:
+                raise RuntimeError('interrupted')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Book.objects, 'bulk_create', interrupted), self.assertRaises(RuntimeError):
+            self.run_import(path)
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(json.loads(Path(f'{path}.checkpoint').read_text())['records'], 2)
+
+        output, _ = self.run_import(path)
+        self.assertIn('Resuming after record 2.', output)
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertFalse(Path(f'{path}.checkpoint').exists())
+
+    def test_rows_without_a_stored_cover_keep_the_existing_one(self):
+        (self.directory / 'new.jpg').write_bytes(b'new cover')
+        for isbn, title in (('9780000000001', 'A'), ('9780000000002', 'B')):
+            Book.objects.create(
+                isbn=isbn, title=title, author='A', price=Decimal('9.00'),
+                cover_image=SimpleUploadedFile('old.jpg', b'old cover'),
+            )
+        Book.objects.create(isbn='9780000000003', title='C', author='A', price=Decimal('9.00'))
+        old = Book.objects.get(title='A').cover_image.name
+        path = self.feed([
+            ('9780000000001', 'A2', 'A', '9.00', ''),
+            ('9780000000002', 'B2', 'A', '9.00', 'missing.jpg'),
+            ('9780000000003', 'C2', 'A', '9.00', 'new.jpg'),
+        ])
+        self.run_import(path, '--covers-dir', str(self.directory))
+        covers_by_title = dict(Book.objects.values_list('title', 'cover_image'))
+        self.assertEqual(covers_by_title['A2'], old)
+        self.assertEqual(covers_by_title['B2'], old)
+        self.assertNotIn(covers_by_title['C2'], ('', None, old))
+        references = dict(StoredFile.objects.values_list('name', 'references'))
+        self.assertEqual(references, {old: 2, covers_by_title['C2']: 1})
+
+
+class ExportTests(TestCase):
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        staff = await User.objects.acreate(username='staff', is_staff=True)
+        await Book.objects.acreate(title='Caraval', author='A', description='', price=Decimal('9.00'))
+        await self.async_client.aforce_login(staff)
+        response = await self.async_client.get(reverse('export_dataset', args=['books', 'csv']))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.count(b'Caraval'), 1)
+
+    def test_command_rejects_a_malformed_watermark(self):
+        with self.assertRaisesMessage(CommandError, 'Invalid watermark'):
+            call_command('export_catalog', 'reviews', '--since', 'yesterday', stdout=StringIO(), stderr=StringIO())
+
+
+class ReleaseTests(TestCase):
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.due = UpcomingBook.objects.create(
+            title='Due', author='A', release_date=today, price=Decimal('12.00'),
+        )
+        self.unpriced = UpcomingBook.objects.create(
+            title='Unpriced', author='B', release_date=today - timedelta(days=1),
+        )
+        self.scheduled = UpcomingBook.objects.create(
+            title='Later', author='C', release_date=today + timedelta(days=30), price=Decimal('9.50'),
+        )
+        self.imported = Book.objects.create(
+            title='Imported', author='D', description='', price=Decimal('5.00'), release_date=today, is_upcoming=True,
+        )
+
+    def test_promote_due_publishes_priced_titles(self):
+        result = releases.promote_due()
+        self.assertEqual((result.promoted, result.released, result.unpriced), (1, 1, 1))
+        self.due.refresh_from_db()
+        self.assertEqual(self.due.book.title, 'Due')
+        self.assertEqual(self.due.book.price, Decimal('12.00'))
+        self.assertIsNotNone(self.due.promoted_at)
+        self.imported.refresh_from_db()
+        self.assertFalse(self.imported.is_upcoming)
+        self.assertEqual(releases.promote_due().promoted, 0)
+
+    def test_listing_shows_only_future_scheduled_titles(self):
+        releases.promote_due(today=self.scheduled.release_date)
+        self.scheduled.refresh_from_db()
+        response = self.client.get(reverse('upcoming_books'))
+        self.assertEqual(list(response.context['upcoming_books']), [])
+        detail = self.client.get(reverse('upcoming_book_detail', args=[self.scheduled.pk]))
+        self.assertRedirects(detail, reverse('book_detail', args=[self.scheduled.book_id]))
+
+    def test_listing_is_ordered_and_paginated(self):
+        today = timezone.localdate()
+        UpcomingBook.objects.bulk_create([
+            UpcomingBook(title=f'Title {day}', author='E', release_date=today + timedelta(days=day))
+            for day in range(1, 40)
+        ])
+        with self.assertNumQueries(1):
+            first = self.client.get(reverse('upcoming_books'))
+        second = self.client.get(reverse('upcoming_books') + first.context['next_url'])
+        dates = [book.release_date for book in [*first.context['upcoming_books'], *second.context['upcoming_books']]]
+        self.assertEqual(dates, sorted(dates))
+        self.assertNotIn(self.unpriced, first.context['upcoming_books'])
+
+
+@override_settings(BOOKS_RECOMMENDATION_MIN_SHARED=1)
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        self.books = {
+            title: Book.objects.create(title=title, author='A', description='', price=Decimal('10.00'))
+            for title in 'abcd'
+        }
+        self.users = [User.objects.create_user(f'reader-{index}') for index in range(4)]
+        for user, titles in zip(self.users, ['ab', 'ab', 'ac', 'cd']):
+            for title in titles:
+                self.review(user, title)
+
+    def review(self, user, title):
+        Review.objects.create(user=user, book=self.books[title], content='Good.')
+
+    def recommended(self, title):
+        return [
+            row.neighbour.title
+            for row in BookNeighbour.objects.filter(book=self.books[title]).select_related('neighbour').order_by('rank')
+        ]
+
+    def test_full_build_ranks_by_shared_readers(self):
+        result = recommendations.build()
+        self.assertTrue(result.full)
+        self.assertEqual(self.recommended('a'), ['b', 'c'])
+        self.assertEqual(self.recommended('d'), ['c'])
+        row = BookNeighbour.objects.get(book=self.books['a'], rank=1)
+        self.assertEqual(row.shared, 2)
+        self.assertAlmostEqual(row.score, 2 / 6 ** 0.5)
+
+    def test_incremental_build_recomputes_lists_touched_by_new_reviews(self):
+        recommendations.build()
+        untouched = BookNeighbour.objects.filter(book=self.books['a']).values_list('computed_at', flat=True)[0]
+        self.review(self.users[3], 'b')
+        result = recommendations.build()
+        self.assertFalse(result.full)
+        self.assertEqual(result.books, 3)
+        self.assertEqual(self.recommended('b'), ['a', 'd', 'c'])
+        self.assertEqual(self.recommended('d'), ['c', 'b'])
+        self.assertEqual(BookNeighbour.objects.filter(book=self.books['a'])[0].computed_at, untouched)
+
+    def test_book_detail_shows_recommendations(self):
+        recommendations.build()
+        response = self.client.get(reverse('book_detail', args=[self.books['a'].pk]))
+        self.assertEqual([book.title for book in response.context['recommended']], ['b', 'c'])
+        self.assertContains(response, 'Readers also reviewed')
+
+
+class PopularityTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = User.objects.create_user('reader')
+        self.books = {
+            title: Book.objects.create(title=title, author='A', description='', price=Decimal('10.00'))
+            for title in 'abcd'
+        }
+        # Half-lives of 10 days: 'a' scores 1, 'b' 3 * 0.125, 'c' 3 * 0.5 ** 0.5, 'd' is past the horizon.
+        for title, count, days in [('a', 1, 0), ('b', 3, 30), ('c', 3, 5), ('d', 1, 200)]:
+            for _ in range(count):
+                review = Review.objects.create(user=self.user, book=self.books[title], content='Good.')
+                Review.objects.filter(pk=review.pk).update(created_at=self.now - timedelta(days=days))
+
+    def test_recent_reviews_outrank_older_ones(self):
+        scored, ranked = popularity.recompute(now=self.now, half_life_days=10, top=2)
+        self.assertEqual(scored, 3)
+        self.assertEqual(ranked, [self.books['c'].pk, self.books['a'].pk])
+        scores = dict(Book.objects.values_list('title', 'popularity_score'))
+        self.assertAlmostEqual(scores['a'], 1)
+        self.assertAlmostEqual(scores['b'], 0.375)
+        self.assertAlmostEqual(scores['c'], 3 * 0.5 ** 0.5)
+        self.assertEqual(scores['d'], 0)
+
+    def test_recompute_flips_flags_and_refreshes_updated_at(self):
+        Book.objects.filter(title__in='bd').update(is_popular=True, popularity_score=5)
+        before = dict(Book.objects.values_list('title', 'updated_at'))
+        call_command('recompute_popularity', '--half-life', '10', '--top', '2', stdout=StringIO())
+        books = {book.title: book for book in Book.objects.all()}
+        self.assertEqual({title for title, book in books.items() if book.is_popular}, {'a', 'c'})
+        for title in 'abcd':
+            self.assertGreater(books[title].updated_at, before[title])
+
+
+class AssetTests(TestCase):
+
+    def setUp(self):
+        root = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.source, self.static, self.media = root / 'source', root / 'static', root / 'media'
+        (self.source / 'css').mkdir(parents=True)
+        (self.media / 'book_covers').mkdir(parents=True)
+        self.css = b'body { color: black; }\n' * 200
+        (self.source / 'css' / 'site.css').write_bytes(self.css)
+        (self.media / 'book_covers' / 'cover.jpg').write_bytes(bytes(range(256)) * 4)
+        self.enterContext(override_settings(
+            STATIC_ROOT=self.static, MEDIA_ROOT=self.media, STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'books.storage.CompressedManifestStaticFilesStorage'},
+            },
+        ))
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return staticfiles_storage.url('css/site.css')
+
+    def test_collected_files_are_hashed_precompressed_and_immutable(self):
+        url = self.collect()
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+        plain = self.client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(b''.join(plain.streaming_content), self.css)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+
+    def test_unhashed_file_is_revalidated_with_etag(self):
+        response = self.client.get('/media/book_covers/cover.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(response['Content-Length'], '1024')
+        again = self.client.get('/media/book_covers/cover.jpg', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get('/media/book_covers/cover.jpg', headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        tail = self.client.get('/media/book_covers/cover.jpg', headers={'Range': 'bytes=-4'})
+        self.assertEqual(b''.join(tail.streaming_content), bytes(range(252, 256)))
+        outside = self.client.get('/media/book_covers/cover.jpg', headers={'Range': 'bytes=2000-'})
+        self.assertEqual(outside.status_code, 416)
+        stale = self.client.get('/media/book_covers/cover.jpg', headers={'Range': 'bytes=0-1', 'If-Range': '"x"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_paths_outside_the_root_are_not_served(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/%2e%2e/manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/book_covers/').status_code, 404)
+
+
+class CoverStorageTests(TestCase):
+
+    def setUp(self):
+        self.media = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+
+    def book(self, cover, title='Caraval'):
+        return Book.objects.create(title=title, author='A', description='', price=Decimal('9.00'), cover_image=cover)
+
+    def upload(self, content, name='cover.jpg'):
+        return SimpleUploadedFile(name, content, content_type='image/jpeg')
+
+    def test_saved_cover_gets_renditions_from_its_job(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 1200), 'navy').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self.book(self.upload(buffer.getvalue()))
+        name = book.cover_image.name
+        self.assertNotIn('<picture>', cover_image(book))
+        job = Job.objects.get(task='build_cover_renditions')
+        self.assertEqual(job.payload, {'name': name})
+        self.assertEqual(jobs.claim('worker', 10), [job.pk])
+        self.assertEqual(jobs.run(job.pk), Job.SUCCEEDED)
+
+        for rendition in renditions.all_rendition_names(name):
+            self.assertTrue((self.media / rendition).is_file(), rendition)
+        with Image.open(self.media / renditions.rendition_name(name, 'card', 'webp')) as card:
+            self.assertEqual((card.format, card.size), ('WEBP', (320, 480)))
+        html = cover_image(book, 'detail')
+        self.assertIn('<picture>', html)
+        self.assertIn(f'src="/media/{renditions.rendition_name(name, "detail", "jpg")}"', html)
+        self.assertIn(f'/media/{renditions.rendition_name(name, "retina", "webp")} 1280w', html)
+
+    def test_staged_uploads_are_not_served(self):
+        book = self.book(self.upload(b'stored image'))
+        staged = self.media / 'covers' / 'tmp' / 'tmpupload'
+        staged.write_bytes(b'partial upload')
+        self.assertEqual(self.client.get(f'/media/{book.cover_image.name}').status_code, 200)
+        for path in ('covers/tmp/tmpupload', 'covers/./tmp/tmpupload', 'covers//tmp/tmpupload'):
+            self.assertEqual(self.client.get(f'/media/{path}').status_code, 404, path)
+
+    def test_same_image_is_stored_once_and_counted(self):
+        book = self.book(self.upload(b'same image'))
+        upcoming = UpcomingBook.objects.create(
+            title='Caraval', author='A', release_date=timezone.localdate(),
+            cover_image=self.upload(b'same image', 'b.JPG'),
+        )
+        self.assertRegex(book.cover_image.name, r'^covers/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(book.cover_image.name, upcoming.cover_image.name)
+        self.assertEqual(len(list((self.media / 'covers').glob('*/*.jpg'))), 1)
+        self.assertEqual(StoredFile.objects.get().references, 2)
+
+        book.cover_image = self.upload(b'new image')
+        book.save()
+        upcoming.delete()
+        counts = dict(StoredFile.objects.values_list('name', 'references'))
+        self.assertEqual(counts, {upcoming.cover_image.name: 0, book.cover_image.name: 1})
+        self.assertEqual(covers.reconcile(), 0)
+
+        self.assertEqual(covers.prune()[0], 0)
+        later = timezone.now() + timedelta(hours=25)
+        self.assertEqual(covers.prune(now=later), (1, len(b'same image')))
+        self.assertFalse((self.media / upcoming.cover_image.name).exists())
+
+    def test_stored_covers_are_cached_as_immutable(self):
+        book = self.book(self.upload(b'image'))
+        response = self.client.get(book.cover_image.url)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+
+    def test_dedupe_moves_legacy_covers(self):
+        (self.media / 'book_covers').mkdir()
+        for name in ('prince.jpg', 'prince_NEry6sO.jpg', 'unused.jpg'):
+            (self.media / 'book_covers' / name).write_bytes(b'prince')
+        Book.objects.bulk_create([
+            Book(title='Prince', author='A', description='', price=Decimal('9.00'), cover_image=f'book_covers/{name}')
+            for name in ('prince.jpg', 'prince_NEry6sO.jpg')
+        ])
+        result = covers.dedupe(delete_orphans=True)
+        self.assertEqual((result.moved, result.stored, result.orphans), (2, 1, ['book_covers/unused.jpg']))
+        self.assertEqual(len(set(Book.objects.values_list('cover_image', flat=True))), 1)
+        self.assertEqual(StoredFile.objects.get().references, 2)
+        self.assertEqual(list((self.media / 'book_covers').iterdir()), [])
+
+
+class UploadTests(TestCase):
+
+    def setUp(self):
+        self.media = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.client.force_login(User.objects.create_user('editor', is_staff=True))
+
+    def image(self, size=(40, 30), fmt='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'navy').save(buffer, fmt)
+        return buffer.getvalue()
+
+    def post(self, content, name='cover.png'):
+        return self.client.post(reverse('upload_upcoming_book'), {
+            'title': 'Caraval', 'author': 'A', 'description': '', 'release_date': '2030-01-01', 'price': '9.00',
+            'cover_image': SimpleUploadedFile(name, content),
+        })
+
+    def test_cover_is_streamed_into_storage(self):
+        content = self.image()
+        response = self.post(content)
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        name = UpcomingBook.objects.get().cover_image.name
+        self.assertEqual((self.media / name).read_bytes(), content)
+        self.assertEqual(list((self.media / 'covers' / 'tmp').iterdir()), [])
+
+    @override_settings(BOOKS_UPLOAD_MAX_SIDE=50, BOOKS_UPLOAD_MAX_BYTES=4096)
+    def test_limits_reject_the_upload(self):
+        cases = {
+            # Only the header is sent; the pixels are never needed.
+            'pixels a side': self.image((80, 20))[:64],
+            'at most 4.0': self.image() + bytes(8192),
+            'Upload a JPEG, PNG': self.image(fmt='BMP'),
+            'Upload a valid image': b'not an image' * 100,
+        }
+        for message, content in cases.items():
+            with self.subTest(message):
+                response = self.post(content)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, message)
+        self.assertFalse(UpcomingBook.objects.exists())
+        self.assertFalse((self.media / 'covers').exists())
+
+    @override_settings(BOOKS_UPLOAD_MAX_SIDE=50)
+    def test_form_checks_covers_uploaded_elsewhere(self):
+        data = {'title': 'Caraval', 'author': 'A', 'release_date': '2030-01-01', 'price': '9.00'}
+        form = UpcomingBookForm(data, {'cover_image': SimpleUploadedFile('wide.png', self.image((80, 20)))})
+        self.assertIn('pixels a side', form.errors['cover_image'][0])
+        form = UpcomingBookForm(data, {'cover_image': SimpleUploadedFile('cover.png', self.image())})
+        self.assertTrue(form.is_valid())
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_same_seed_gives_same_catalog(self):
+        first = synthetic.generate(books=50, reviews=200, users=3, upcoming=2, seed=7, prefix='a')
+        titles = [title.rsplit(' ', 1)[0] for title in Book.objects.filter(pk__in=first.book_ids)
+                  .order_by('pk').values_list('title', flat=True)]
+        Book.objects.all().delete()
+        UpcomingBook.objects.all().delete()
+        Cart.objects.all().delete()
+        second = synthetic.generate(books=50, reviews=200, users=3, upcoming=2, seed=7, prefix='b')
+        again = [title.rsplit(' ', 1)[0] for title in Book.objects.filter(pk__in=second.book_ids)
+                 .order_by('pk').values_list('title', flat=True)]
+        self.assertEqual(titles, again)
+        self.assertEqual(Review.objects.count(), 200)
+        self.assertEqual(sum(Book.objects.values_list('review_count', flat=True)), 200)
@@ -0,0 +1,190 @@
+"""
+Bounded cover uploads.
+
+:class:`CoverUploadHandler` replaces Django's default upload handlers for
+``upload_upcoming_book``. Each file is streamed in ``chunk_size`` pieces
+into a temporary file on disk, never into memory, so a worker holds at most
+one chunk plus the image header per upload however large the file is or
+however many staff upload at once.
+
+Limits are checked while the file arrives rather than after it has been
+read:
+
+* the upload is dropped as soon as it passes ``BOOKS_UPLOAD_MAX_BYTES``;
+* once the first ``HEADER_BYTES`` or fewer have arrived, Pillow identifies
+  the image from its header alone, without decoding any pixels, and the
+  upload is dropped unless the format is in ``BOOKS_UPLOAD_FORMATS`` and
+  the dimensions are within ``BOOKS_UPLOAD_MAX_PIXELS`` and
+  ``BOOKS_UPLOAD_MAX_SIDE``.
+
+A dropped file is discarded with the rest of its data and never reaches
+``request.FILES``; the reason is kept in ``request.upload_errors`` (field
+name -> ``ValidationError``) for the view to show on the form. :func:`check_image`
+applies the same checks to an image Django has already opened, which
+:class:`~books.forms.UpcomingBookForm` uses for uploads handled elsewhere,
+such as the admin.
+"""
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, UnidentifiedImageError
+
+# Most bytes buffered to find the image header. PNG, GIF and WebP put their
+# dimensions in the first few dozen bytes; JPEG puts them after any EXIF and
+# ICC segments, which are at most 64KB each.
+HEADER_BYTES = 256 * 1024
+
+
+def check_size(size):
+    """
+    Check a file size against ``BOOKS_UPLOAD_MAX_BYTES``.
+
+    Args:
+        size (int): Bytes received so far, or in total.
+
+    Raises:
+        ValidationError: If the file is too large.
+    """
+    if size > settings.BOOKS_UPLOAD_MAX_BYTES:
+        raise ValidationError(
+            'The cover must be at most %(limit)s.',
+            code='file_too_large', params={'limit': filesizeformat(settings.BOOKS_UPLOAD_MAX_BYTES)},
+        )
+
+
+def check_image(image):
+    """
+    Check an opened image's format and dimensions.
+
+    Only header fields are read, so the bitmap is never decoded.
+
+    Args:
+        image (PIL.Image.Image): An image from ``Image.open``.
+
+    Raises:
+        ValidationError: If the format is not allowed or the image is too
+            large.
+    """
+    if image.format not in settings.BOOKS_UPLOAD_FORMATS:
+        raise ValidationError(
+            'Upload a %(formats)s image.', code='invalid_image_format',
+            params={'formats': ', '.join(settings.BOOKS_UPLOAD_FORMATS)},
+        )
+    width, height = image.size
+    side = settings.BOOKS_UPLOAD_MAX_SIDE
+    if width > side or height > side or width * height > settings.BOOKS_UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            'The cover is %(width)s x %(height)s pixels; it must be at most %(side)s pixels a side '
+            'and %(pixels)s pixels in all.',
+            code='image_too_large',
+            params={
+                'width': width, 'height': height, 'side': side, 'pixels': settings.BOOKS_UPLOAD_MAX_PIXELS,
+            },
+        )
+
+
+def read_header(header):
+    """
+    Identify an image from the start of its file.
+
+    Args:
+        header (bytes): The first bytes of the file.
+
+    Returns:
+        PIL.Image.Image or None: The lazily opened image, whose format and
+        size are known but whose pixels have not been read, or None if
+        ``header`` is too short or not an image.
+
+    Raises:
+        ValidationError: If Pillow refuses the image as a decompression
+            bomb.
+    """
+    try:
+        with warnings.catch_warnings():
+            # The dimensions are checked against our own, lower, limit.
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            return Image.open(BytesIO(header))
+    except Image.DecompressionBombError:
+        raise ValidationError('The cover has too many pixels.', code='image_too_large')
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return None
+
+
+class CoverUploadHandler(FileUploadHandler):
+    """
+    Stream uploaded images to disk, rejecting them as soon as a limit fails.
+
+    Install it before the request body is read::
+
+        request.upload_handlers = [CoverUploadHandler(request)]
+
+    The file being received is kept as ``upload`` rather than ``file``, the
+    attribute Django closes after a skipped file, since that may still be
+    the previous, accepted, file.
+    """
+
+    upload = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.upload = None
+        self.header = bytearray()
+        self.checked = False
+        if content_length is not None:
+            self._guard(check_size, content_length)
+        self.upload = TemporaryUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._guard(check_size, start + len(raw_data))
+        if not self.checked:
+            self.header += raw_data[:HEADER_BYTES - len(self.header)]
+            self._check_header(complete=len(self.header) >= HEADER_BYTES)
+        self.upload.write(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            try:
+                self._check_header(complete=True)
+            except SkipFile:
+                return None
+        self.upload.seek(0)
+        self.upload.size = file_size
+        return self.upload
+
+    def upload_interrupted(self):
+        if self.upload is not None:
+            self.upload.close()
+
+    def _check_header(self, complete):
+        """Check the buffered header; ``complete`` when no more of it will come."""
+        image = self._guard(read_header, bytes(self.header))
+        if image is None:
+            if complete:
+                self._reject(ValidationError('Upload a valid image.', code='invalid_image'))
+            return
+        self._guard(check_image, image)
+        self.checked = True
+        self.header = None
+
+    def _guard(self, check, value):
+        try:
+            return check(value)
+        except ValidationError as error:
+            self._reject(error)
+
+    def _reject(self, error):
+        """Record why the file was dropped, delete what was written and skip the rest."""
+        errors = getattr(self.request, 'upload_errors', None)
+        if errors is None:
+            errors = self.request.upload_errors = {}
+        errors.setdefault(self.field_name, error)
+        if self.upload is not None:
+            self.upload.close()
+            self.upload = None
+        self.header = None
+        raise SkipFile()
@@ -1,21 +1,32 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
+
+# Read-only catalog pages are served by async views when running under ASGI.
+catalog = async_views if settings.BOOKS_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.book_list, name='book_list'),
-    path('<int:pk>/', views.book_detail, name='book_detail'),
+    path('', catalog.book_list, name='book_list'),
+    path('popular/', views.popular_books, name='popular_books'),
+    path('autocomplete/', views.autocomplete, name='book_autocomplete'),
+    path('<int:pk>/', catalog.book_detail, name='book_detail'),
+    path('<int:pk>/reviews/', views.book_reviews, name='book_reviews'),
     path('<int:pk>/add_review/', views.add_review, name='add_review'),
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:book_id>/', views.add_to_cart, name='add_to_cart'),
+    path('cart/update/', views.update_cart, name='update_cart'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('upcoming/<int:pk>/', views.upcoming_book_detail, name='upcoming_book_detail'),
-    path('upcoming/', views.upcoming_books, name='upcoming_books'),
+    path('upcoming/', catalog.upcoming_books, name='upcoming_books'),
+    path('upcoming/upload/', views.upload_upcoming_book, name='upload_upcoming_book'),
+    path('export/<str:dataset>.<str:fmt>', views.export_dataset, name='export_dataset'),
+    path('api/books/', api.books, name='api_books'),
+    path('api/books/<int:pk>/', api.book, name='api_book'),
+    path('api/books/<int:pk>/reviews/', api.book_reviews, name='api_book_reviews'),
+    path('api/upcoming/', api.upcoming_books, name='api_upcoming_books'),
+    path('api/upcoming/<int:pk>/', api.upcoming_book, name='api_upcoming_book'),
 ] 
 
-#     """Display popular books based on the number of reviews."""
-#     popular_books = Book.objects.annotate(review_count=Count('reviews')).order_by('-review_count')[:5]    
-#     return render(request, 'books/popular_books.html', {'popular_books': popular_books})
-
 #     """Display upcoming books based on their release date."""
 #     upcoming_books = Book.objects.filter(release_date__gte=timezone.now()).order_by('release_date')   
 #     return render(request, 'books/upcoming_books.html', {'upcoming_books': upcoming_books})
@@ -1,11 +1,45 @@
+from django.conf import settings
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
-from django.db.models import Q
-from django.views.decorators.http import require_http_methods
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_http_methods, require_POST
+from . import autocomplete as autocomplete_index
+from . import exports, facets
+from .caching import get_or_build, versioned_key
+from .cart import invalidate_cart_summary
 from .forms import UpcomingBookForm
-from .models import Book, Review, Cart, CartItem, UpcomingBook
+from .models import Book, BookNeighbour, Review, Cart, CartItem, UpcomingBook
+from .pagination import decode_cursor, encode_cursor, paginate
+from .search import search_books
+from .uploads import CoverUploadHandler
+
+# Columns rendered by the book cards; everything else (notably the
+# description) is left in the database.
+BOOK_CARD_FIELDS = ('id', 'title', 'author', 'price', 'cover_image')
+
+# Newest reviews first; matches the (book, created_at, id) index on Review.
+REVIEW_ORDERING = ('-created_at', '-id')
+
+# Most popular first; matches the popularity index on Book.
+POPULAR_ORDERING = ('-popularity_score', '-id')
+
+# Soonest release first; matches the scheduled-releases index on UpcomingBook.
+UPCOMING_ORDERING = ('release_date', 'id')
+
+# Keyset orderings offered on the catalog listing, each ending in a unique key.
+BOOK_LIST_ORDERINGS = {
+    'title': ('title', 'id'),
+    'price': ('price', 'id'),
+}
 
 
 def home(request):
@@ -13,50 +47,178 @@ def home(request):
     Render the homepage with key dynamic content.
 
     Retrieves and displays:
-    - The 5 nearest upcoming book releases.
-    - The 5 most popular books (where is_popular=True).
+    - The 5 nearest scheduled releases.
+    - The 5 most popular books (where is_popular=True), best score first.
     - The 5 most recent reviews with related book and user data.
 
+    The assembled context is cached (see :func:`build_home_context`) and
+    invalidated by signals whenever a Book, UpcomingBook or Review changes.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
         HttpResponse: Rendered homepage with context data.
     """
-    upcoming_books = UpcomingBook.objects.all().order_by('release_date')[:5]
-    popular_books = Book.objects.filter(is_popular=True)[:5]
-    recent_reviews = Review.objects.select_related('book', 'user').order_by('-created_at')[:5]
+    context = get_or_build(
+        versioned_key('home', 'context'), build_home_context, timeout=settings.BOOKS_HOME_CACHE_TIMEOUT,
+    )
+    return render(request, 'books/home.html', context)
 
-    context = {
-        'upcoming_books': upcoming_books,
-        'popular_books': popular_books,
-        'recent_reviews': recent_reviews,
+
+def build_home_context():
+    """
+    Query the homepage sections.
+
+    Querysets are evaluated here so the result can be stored in the cache.
+    Only the columns the template renders are loaded, which keeps reviewers'
+    password hashes and emails, and book descriptions, out of the cache.
+
+    Returns:
+        dict: The 'upcoming_books', 'popular_books' and 'recent_reviews' lists.
+    """
+    upcoming = UpcomingBook.objects.scheduled().only('id', 'title', 'author', 'release_date', 'cover_image')
+    return {
+        'upcoming_books': list(upcoming.order_by(*UPCOMING_ORDERING)[:5]),
+        'popular_books': list(
+            Book.objects.filter(is_popular=True).only(*BOOK_CARD_FIELDS).order_by('-popularity_score', '-id')[:5]
+        ),
+        'recent_reviews': list(
+            Review.objects.select_related('book', 'user').only('content', 'book__title', 'user__username')
+            .order_by('-created_at')[:5]
+        ),
+    }
+
+
+def build_book_list_context(params):
+    """
+    Query one page of the book list.
+
+    Querysets are evaluated here so the async view can run this whole
+    function through ``sync_to_async``.
+
+    Args:
+        params (QueryDict): The request's GET parameters.
+
+    Returns:
+        dict: The book list template context.
+    """
+    query = params.get('q')
+    sort = params.get('sort')
+    if sort not in BOOK_LIST_ORDERINGS:
+        sort = 'title'
+    cursor = params.get('cursor')
+    page_size = settings.BOOKS_PAGE_SIZE
+    selected = {} if query else facets.parse(params)
+    cards = facets.apply(Book.objects.only(*BOOK_CARD_FIELDS), selected)
+
+    if query:
+        books, hits = search_books(
+            query, limit=page_size + 1, after=decode_cursor(cursor, size=2), queryset=cards,
+        )
+        next_cursor = encode_cursor(hits[page_size - 1]) if len(hits) > page_size else None
+        books = books[:page_size]
+    else:
+        page = paginate(cards, BOOK_LIST_ORDERINGS[sort], cursor, page_size)
+        books, next_cursor = page.items, page.next_cursor
+
+    next_url = None
+    if next_cursor:
+        next_params = params.copy()
+        next_params['cursor'] = next_cursor
+        next_url = f'?{next_params.urlencode()}'
+    first_params = params.copy()
+    first_params.pop('cursor', None)
+
+    return {
+        'books': books,
+        'query': query,
+        'sort': sort,
+        'facets': [] if query else facets.links(params, facets.counts(selected), selected),
+        'next_url': next_url,
+        'first_url': f'?{first_params.urlencode()}',
+        'is_first_page': not cursor,
     }
-    return render(request, 'books/home.html', context)
 
 
 def book_list(request):
     """
-    Display a list of books with optional search filtering.
+    Display one page of books with optional search filtering.
 
-    If a query parameter (`q`) is provided, filters books by title or author.
-    Otherwise, displays all books.
+    If a query parameter (`q`) is provided, runs a ranked full-text search
+    over title, author and description (see :mod:`books.search`).
+    Otherwise, lists the catalog sorted by `sort` (title or price),
+    narrowed by the `price`, `author`, `year` and `state` facets (see
+    :mod:`books.facets`), with the count behind each facet value.
+
+    Pages are keyset-paginated through the opaque `cursor` parameter, so
+    every page costs the same, and only the columns the cards render are
+    loaded.
 
     Args:
-        request (HttpRequest): The HTTP request containing optional 'q' parameter.
+        request (HttpRequest): The HTTP request containing optional 'q',
+            'sort', 'cursor' and facet parameters.
 
     Returns:
-        HttpResponse: Rendered book list view with search results or full list.
+        HttpResponse: Rendered book list view with one page of results.
+    """
+    return render(request, 'books/book_list.html', build_book_list_context(request.GET))
+
+
+def autocomplete(request):
     """
-    query = request.GET.get('q')
-    books = Book.objects.filter(Q(title__icontains=query) | Q(author__icontains=query)) if query else Book.objects.all()
-    context = {'books': books, 'query': query}
-    return render(request, 'books/book_list.html', context)
+    Return search-box suggestions for a title or author prefix as JSON.
+
+    Answered from the in-process prefix index in :mod:`books.autocomplete`,
+    so no database query is made per keystroke.
+
+    Args:
+        request (HttpRequest): The HTTP request containing the 'q' prefix.
+
+    Returns:
+        JsonResponse: ``{"results": [...]}`` with title and author suggestions.
+    """
+    prefix = request.GET.get('q', '')
+    results = []
+    if len(prefix.strip()) >= 2:
+        results = autocomplete_index.suggest(prefix, limit=settings.BOOKS_AUTOCOMPLETE_RESULTS)
+        for result in results:
+            if 'book_id' in result:
+                result['url'] = reverse('book_detail', args=[result['book_id']])
+    response = JsonResponse({'query': prefix, 'results': results})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+def popular_books(request):
+    """
+    Display books ranked by their time-decayed popularity score.
+
+    Reads the precomputed, indexed ``popularity_score`` column (see
+    :mod:`books.popularity`) instead of counting reviews per request.
+
+    Args:
+        request (HttpRequest): The HTTP request containing an optional 'cursor'.
+
+    Returns:
+        HttpResponse: Rendered list of popular books, one page at a time.
+    """
+    page = paginate(
+        Book.objects.filter(popularity_score__gt=0).only(*BOOK_CARD_FIELDS, 'popularity_score', 'review_count'),
+        POPULAR_ORDERING,
+        request.GET.get('cursor'),
+        settings.BOOKS_PAGE_SIZE,
+    )
+    return render(request, 'books/popular_books.html', {'books': page, 'is_first_page': not request.GET.get('cursor')})
 
 
 def book_detail(request, pk):
     """
-    Display details and reviews of a specific book.
+    Display details and the most recent reviews of a specific book.
+
+    Only the first page of reviews is rendered; older ones are fetched
+    on demand from :func:`book_reviews`. "Readers also reviewed" comes
+    from the precomputed lists of :mod:`books.recommendations`.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -66,11 +228,53 @@ def book_detail(request, pk):
         HttpResponse: Rendered detail page for the selected book.
     """
     book = get_object_or_404(Book, pk=pk)
-    reviews = book.reviews.all().order_by('-created_at')
-    context = {'book': book, 'reviews': reviews}
+    reviews = paginate(_review_rows(book.pk), REVIEW_ORDERING, None, settings.BOOKS_REVIEWS_PAGE_SIZE)
+    recommended = [row.neighbour for row in _neighbour_rows(book.pk)]
+    context = {'book': book, 'reviews': reviews, 'recommended': recommended}
     return render(request, 'books/book_detail.html', context)
 
 
+def book_reviews(request, pk):
+    """
+    Return the next page of a book's reviews as a JSON fragment.
+
+    Backs the "Load more" button on the detail page.
+
+    Args:
+        request (HttpRequest): The HTTP request containing the 'cursor'
+            returned with the previous page.
+        pk (int): Primary key of the book.
+
+    Returns:
+        JsonResponse: ``{"html": ..., "next_cursor": ...}`` where ``html``
+        is the rendered review rows.
+    """
+    reviews = paginate(
+        _review_rows(pk), REVIEW_ORDERING, request.GET.get('cursor'), settings.BOOKS_REVIEWS_PAGE_SIZE,
+    )
+    html = render_to_string('books/review_items.html', {'reviews': reviews}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': reviews.next_cursor})
+
+
+def _review_rows(book_id):
+    """Reviews of a book with their author's username joined in."""
+    return (
+        Review.objects.filter(book_id=book_id)
+        .select_related('user')
+        .only('content', 'created_at', 'user__username')
+    )
+
+
+def _neighbour_rows(book_id):
+    """A book's stored recommendations, best first, with the books joined in."""
+    return (
+        BookNeighbour.objects.filter(book_id=book_id)
+        .select_related('neighbour')
+        .only(*[f'neighbour__{field}' for field in BOOK_CARD_FIELDS])
+        .order_by('rank')
+    )
+
+
 @login_required
 def add_review(request, pk):
     """
@@ -121,7 +325,11 @@ def add_to_cart(request, book_id):
     """
     Add a book to the logged-in user's cart.
 
-    If the book is already in the cart, increments its quantity.
+    If the book is already in the cart, increments its quantity with a
+    single ``UPDATE ... SET quantity = quantity + 1``, which is safe against
+    double-clicks and concurrent tabs. Otherwise the item is inserted; the
+    unique (cart, book) constraint turns a racing duplicate insert into an
+    increment instead of a second row.
 
     Args:
         request (HttpRequest): The HTTP request.
@@ -130,12 +338,63 @@ def add_to_cart(request, book_id):
     Returns:
         HttpResponse: Redirect to cart detail page.
     """
-    book = get_object_or_404(Book, pk=book_id)
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    item, created = CartItem.objects.get_or_create(cart=cart, book=book)
-    if not created:
-        item.quantity += 1
-        item.save()
+    user_id = request.user.pk
+    with transaction.atomic():
+        incremented = CartItem.objects.filter(cart__user_id=user_id, book_id=book_id).update(
+            quantity=F('quantity') + 1,
+        )
+        if not incremented:
+            book = get_object_or_404(Book.objects.only('id'), pk=book_id)
+            cart, _ = Cart.objects.get_or_create(user_id=user_id)
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(cart=cart, book=book)
+            except IntegrityError:
+                CartItem.objects.filter(cart=cart, book=book).update(quantity=F('quantity') + 1)
+        transaction.on_commit(lambda: invalidate_cart_summary(user_id))
+    return redirect('cart_detail')
+
+
+@require_POST
+@login_required
+def update_cart(request):
+    """
+    Set the quantities of many cart items in one transaction.
+
+    Reads ``quantity-<item_id>`` fields from the POST data. A quantity of 0
+    removes the item; malformed or negative values are ignored. Items that
+    do not belong to the user's cart are never touched.
+
+    Args:
+        request (HttpRequest): The HTTP request with the quantity fields.
+
+    Returns:
+        HttpResponse: Redirect to the cart detail page.
+    """
+    quantities = {}
+    for name, value in request.POST.items():
+        if not name.startswith('quantity-'):
+            continue
+        try:
+            item_id, quantity = int(name[len('quantity-'):]), int(value)
+        except ValueError:
+            continue
+        if quantity >= 0:
+            quantities[item_id] = quantity
+
+    user_id = request.user.pk
+    with transaction.atomic():
+        items = CartItem.objects.select_for_update().filter(cart__user_id=user_id, pk__in=quantities)
+        changed = []
+        for item in items.only('id', 'quantity'):
+            if quantities[item.pk] and item.quantity != quantities[item.pk]:
+                item.quantity = quantities[item.pk]
+                changed.append(item)
+        CartItem.objects.bulk_update(changed, ['quantity'])
+        removed = [item_id for item_id, quantity in quantities.items() if quantity == 0]
+        if removed:
+            CartItem.objects.filter(cart__user_id=user_id, pk__in=removed).delete()
+        transaction.on_commit(lambda: invalidate_cart_summary(user_id))
     return redirect('cart_detail')
 
 
@@ -144,14 +403,27 @@ def cart_detail(request):
     """
     Display the current user's cart contents.
 
+    Items, their books and the line and grand totals all come from a
+    single query (see :meth:`CartItemQuerySet.with_totals`).
+
     Args:
         request (HttpRequest): The HTTP request.
 
     Returns:
         HttpResponse: Rendered cart detail page with cart items.
     """
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'books/cart_detail.html', {'cart': cart})
+    items = list(
+        CartItem.objects.filter(cart__user=request.user)
+        .with_totals()
+        .only('quantity', 'book__title', 'book__price')
+        .order_by('id')
+    )
+    context = {
+        'items': items,
+        'total_price': items[0].cart_total if items else 0,
+        'total_quantity': items[0].cart_quantity if items else 0,
+    }
+    return render(request, 'books/cart_detail.html', context)
 
 
 @login_required
@@ -172,12 +444,58 @@ def remove_from_cart(request, item_id):
 
 
 @login_required
+@user_passes_test(lambda user: user.is_staff)
+def export_dataset(request, dataset, fmt):
+    """
+    Stream the book catalog or review history as a download.
+
+    Rows are read and encoded in chunks (see :mod:`books.exports`), so the
+    response starts immediately and memory use stays flat. Requires a
+    logged-in staff user.
+
+    Args:
+        request (HttpRequest): The HTTP request, optionally with 'since'
+            and 'since_id' watermarks for an incremental export.
+        dataset (str): ``books`` or ``reviews``.
+        fmt (str): ``csv``, ``jsonl`` or ``columns``.
+
+    Returns:
+        StreamingHttpResponse: The export, as an attachment.
+    """
+    if dataset not in exports.EXPORTS or fmt not in exports.FORMATS:
+        raise Http404('Unknown export')
+    try:
+        since = exports.parse_since(dataset, request.GET.get('since'), request.GET.get('since_id'))
+        rows = exports.export_rows(dataset, since=since)
+    except (TypeError, ValueError, ValidationError):
+        return HttpResponseBadRequest('Invalid watermark')
+    extension = 'json' if fmt == 'columns' else fmt
+    chunks = exports.encode(dataset, rows, fmt)
+    if isinstance(request, ASGIRequest):
+        chunks = exports.stream_async(chunks)
+    response = StreamingHttpResponse(chunks, content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{extension}"'
+    return response
+
+
+@login_required
+@user_passes_test(lambda user: user.is_staff)
+@csrf_exempt
 def upload_upcoming_book(request):
     """
     Allow staff users to upload an upcoming book (title, cover, date, etc.).
 
-    Accepts both GET and POST. Requires user to be logged in.
+    Accepts both GET and POST. Requires a logged-in staff user.
     Files (like book covers) must be handled via `request.FILES`.
+    The cover is streamed to a temporary file by
+    :class:`~books.uploads.CoverUploadHandler`, which drops it as soon as
+    it breaks a size, format or dimension limit. Resizing the cover is
+    queued as a background job (see :mod:`books.tasks`), so the request
+    returns as soon as the upload is stored.
+
+    The handler has to be installed before anything reads the body, which
+    the CSRF middleware would do, so the CSRF check is made here instead,
+    after it is installed.
 
     Args:
         request (HttpRequest): The HTTP request, possibly with form data.
@@ -185,8 +503,16 @@ def upload_upcoming_book(request):
     Returns:
         HttpResponse: Form for upload or redirect to home on success.
     """
+    request.upload_handlers = [CoverUploadHandler(request)]
+    return _upload_upcoming_book(request)
+
+
+@csrf_protect
+def _upload_upcoming_book(request):
     if request.method == 'POST':
         form = UpcomingBookForm(request.POST, request.FILES)
+        for field, error in getattr(request, 'upload_errors', {}).items():
+            form.add_error(field, error)
         if form.is_valid():
             form.save()
             return redirect('home')
@@ -199,26 +525,43 @@ def upcoming_book_detail(request, pk):
     """
     Show detailed view of a specific upcoming book.
 
+    Titles that have been promoted redirect to their catalog page.
+
     Args:
         request (HttpRequest): The HTTP request.
         pk (int): Primary key of the upcoming book.
 
     Returns:
-        HttpResponse: Rendered detail view of the upcoming book.
+        HttpResponse: Rendered detail view of the upcoming book, or a
+        redirect to the released book.
     """
     book = get_object_or_404(UpcomingBook, pk=pk)
+    if book.book_id:
+        return redirect('book_detail', pk=book.book_id)
     return render(request, 'books/upcoming_book_detail.html', {'book': book})
 
 
 def upcoming_books(request):
     """
-    Display a full list of upcoming book releases.
+    Display one page of scheduled releases, soonest first.
+
+    Released and promoted titles are left out, and pages are
+    keyset-paginated through the `cursor` parameter.
 
     Args:
-        request (HttpRequest): The HTTP request.
+        request (HttpRequest): The HTTP request, with an optional 'cursor'.
 
     Returns:
-        HttpResponse: Rendered list view of all upcoming books.
+        HttpResponse: Rendered list view of one page of upcoming books.
     """
-    upcoming_books = UpcomingBook.objects.all()
-    return render(request, 'books/upcoming_books.html', {'upcoming_books': upcoming_books})
+    cursor = request.GET.get('cursor')
+    page = paginate(UpcomingBook.objects.scheduled(), UPCOMING_ORDERING, cursor, settings.BOOKS_PAGE_SIZE)
+    return render(request, 'books/upcoming_books.html', _upcoming_context(page, cursor))
+
+
+def _upcoming_context(page, cursor):
+    return {
+        'upcoming_books': page.items,
+        'next_url': f'?cursor={page.next_cursor}' if page.next_cursor else None,
+        'is_first_page': not cursor,
+    }
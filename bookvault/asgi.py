@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookvault.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (needs the app registry set up above)
+
+if settings.DEBUG and not settings.BOOKS_HASHED_STATIC:
+    # runserver serves static files itself; do the same under an ASGI server.
+    # Collected, hashed static files are served by books.assets instead.
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'books.instrumentation.QueryBudgetMiddleware',
+    'books.routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +58,8 @@ ROOT_URLCONF = 'bookvault.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with per-request render timing (books.instrumentation).
+        'BACKEND': 'books.instrumentation.InstrumentedTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -64,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'books.context_processors.cart_summary',
             ],
         },
     },
@@ -79,9 +83,75 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests, checking they still work first.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock at BEGIN. A deferred transaction that reads
+            # and then writes cannot wait for the lock and fails with
+            # "database is locked"; an immediate one queues on busy_timeout.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Read replicas for catalog reads (see books.routers). To try it locally, set
+# BOOKS_REPLICA_DB to a second SQLite file and fill it with
+# `manage.py sync_replica`.
+if os.environ.get('BOOKS_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['BOOKS_REPLICA_DB'],
+        # Tests use the primary's test database for the replica.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['books.routers.CatalogReplicaRouter']
+BOOKS_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# 'round_robin' or 'least_latency'
+BOOKS_REPLICA_SELECTION = 'round_robin'
+# Seconds a client that just wrote keeps reading from the primary.
+BOOKS_PRIMARY_PIN_SECONDS = 5
+BOOKS_PRIMARY_PIN_COOKIE = 'books_primary'
+
+# Applied to every new SQLite connection by books.db.configure_connection.
+BOOKS_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,        # ms a writer waits for the lock
+    'cache_size': -32000,        # page cache per connection, in KiB
+    'mmap_size': 268435456,      # memory-map up to 256 MiB of the file
+    'temp_store': 'MEMORY',
+}
+# Put the database in WAL mode, so readers and the writer do not block each
+# other, with synchronous=NORMAL (fsync at checkpoints only; safe with WAL).
+# WAL is recorded in the database file itself, so it is opt-in: with it on,
+# any management command would rewrite the header of the committed
+# db.sqlite3. The Docker image turns it on.
+BOOKS_SQLITE_WAL = os.environ.get('BOOKS_SQLITE_WAL', '') == '1'
+
+# The cache must be shared by every process: web workers and `runworker`
+# invalidate each other's cached pages, autocomplete index and cart
+# summaries through version keys in it, and books.caching locks builds in
+# it. Set BOOKS_REDIS_URL (e.g. redis://localhost:6379/0, needs the `redis`
+# package) when they run on different hosts or containers; otherwise a file
+# cache shared by the processes on one host is used. Never a per-process
+# LocMemCache.
+BOOKS_REDIS_URL = os.environ.get('BOOKS_REDIS_URL')
+if BOOKS_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': BOOKS_REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('BOOKS_CACHE_DIR', BASE_DIR / '.cache'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -119,6 +189,47 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Collect static files under content-hashed names, with .gz/.br variants
+# (books.storage), and serve them as immutable (books.assets). Needs
+# `manage.py collectstatic` after every change to the static files; the
+# Dockerfile runs it at build time and sets BOOKS_HASHED_STATIC=1.
+BOOKS_HASHED_STATIC = os.environ.get('BOOKS_HASHED_STATIC', '') == '1'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # Book and upcoming book covers, stored once per distinct image under
+    # MEDIA_ROOT/covers/ (see books.storage and books.covers).
+    'covers': {
+        'BACKEND': 'books.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'books.storage.CompressedManifestStaticFilesStorage' if BOOKS_HASHED_STATIC
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
+# Seconds browsers may cache static and media files whose names are not
+# content-hashed before revalidating them.
+BOOKS_ASSET_MAX_AGE = 3600
+
+# Hours an unreferenced cover is kept before `manage.py dedupe_covers
+# --prune` deletes it; covers the gap between an upload and its save.
+BOOKS_COVER_PRUNE_AFTER_HOURS = 24
+
+# Limits on covers uploaded through `upload_upcoming_book` and the upcoming
+# book form (see books.uploads): largest file in bytes, largest image in
+# pixels and per side, and the Pillow formats accepted. Uploads are streamed
+# to a temporary file and dropped as soon as they break one.
+BOOKS_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+BOOKS_UPLOAD_MAX_PIXELS = 40_000_000
+BOOKS_UPLOAD_MAX_SIDE = 10_000
+BOOKS_UPLOAD_FORMATS = ['JPEG', 'PNG', 'WEBP', 'GIF']
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -131,4 +242,102 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 # Authentication settings
 LOGIN_REDIRECT_URL = 'home'
-LOGOUT_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'home'
+
+# Serve the read-only catalog pages (home, listing, detail, upcoming) with
+# async views. Turn on when running under an ASGI server (see
+# gunicorn.conf.py); under runserver/WSGI the sync views are cheaper.
+BOOKS_ASYNC_VIEWS = os.environ.get('BOOKS_ASYNC_VIEWS', '') == '1'
+
+# Catalog listing and search
+BOOKS_PAGE_SIZE = 24
+BOOKS_REVIEWS_PAGE_SIZE = 20
+# Keys in each process's autocomplete index, about four per book. Past it
+# the oldest books are left out of suggestions, with a warning logged.
+BOOKS_AUTOCOMPLETE_MAX_ENTRIES = 200_000
+BOOKS_AUTOCOMPLETE_RESULTS = 8
+
+# Catalog facets (see books.facets): price ranges as (low, high) with an
+# exclusive high bound and None for open-ended (run manage.py rebuild_facets
+# after changing them), how many authors to offer, how long counts stay
+# cached, and the seconds of book edits batched into one summary rebuild.
+BOOKS_PRICE_FACETS = [(0, 10), (10, 25), (25, 50), (50, 100), (100, None)]
+BOOKS_FACET_AUTHORS = 20
+BOOKS_FACET_CACHE_TIMEOUT = 300
+BOOKS_FACET_REBUILD_DELAY = 60
+
+# JSON API (see books.api)
+BOOKS_API_PAGE_SIZE = 50
+BOOKS_API_MAX_PAGE_SIZE = 200
+
+# Seconds the assembled homepage context stays cached; writes to the
+# models it shows invalidate it sooner.
+BOOKS_HOME_CACHE_TIMEOUT = 600
+
+# Popularity ranking (see books.popularity)
+BOOKS_POPULARITY_HALF_LIFE_DAYS = 30
+BOOKS_POPULAR_COUNT = 20
+
+# "Readers also reviewed" (see books.recommendations): books kept per list,
+# readers two books must share before one is recommended on the other, the
+# most recent books per reader that count (so a handful of prolific
+# reviewers cannot dominate every list), and whether cart contents count as
+# reading alongside reviews.
+BOOKS_RECOMMENDATIONS = 8
+BOOKS_RECOMMENDATION_MIN_SHARED = 2
+BOOKS_RECOMMENDATION_READER_LIMIT = 200
+BOOKS_RECOMMENDATION_USE_CARTS = False
+
+# Seconds a user's navbar cart summary stays cached; cart writes clear it.
+BOOKS_CART_SUMMARY_TIMEOUT = 3600
+
+# Background job queue (see books.jobs and `manage.py runworker`)
+BOOKS_JOBS_CONCURRENCY = 4
+BOOKS_JOBS_POLL_INTERVAL = 1.0
+BOOKS_JOBS_MAX_ATTEMPTS = 5
+BOOKS_JOBS_BACKOFF_BASE = 10
+BOOKS_JOBS_BACKOFF_MAX = 3600
+BOOKS_JOBS_LOCK_TIMEOUT = 1800
+# Days succeeded and failed jobs are kept; runworker deletes older ones.
+BOOKS_JOBS_RETENTION_DAYS = 7
+
+# Per-request query/render instrumentation (see books.instrumentation).
+# The Server-Timing header shows every visitor query counts and timings, so
+# outside DEBUG it is only sent with BOOKS_SERVER_TIMING=1.
+BOOKS_SERVER_TIMING = os.environ.get('BOOKS_SERVER_TIMING', '1' if DEBUG else '') == '1'
+# 'warn' logs views that go over budget, 'raise' fails the request, 'off'
+# skips the check.
+BOOKS_QUERY_BUDGET_MODE = 'warn'
+# URL name -> limits on 'queries', 'duplicates', 'sql_ms' and 'render_ms';
+# '*' applies to every view. Query counts include session and user lookups.
+BOOKS_QUERY_BUDGETS = {
+    '*': {'queries': 20, 'duplicates': 5},
+    'home': {'queries': 8, 'duplicates': 0},
+    'book_list': {'queries': 6, 'duplicates': 0},
+    'book_detail': {'queries': 6, 'duplicates': 0},
+    'book_reviews': {'queries': 4, 'duplicates': 0},
+    'upcoming_books': {'queries': 5, 'duplicates': 0},
+    'cart_detail': {'queries': 6, 'duplicates': 0},
+    'api_books': {'queries': 4, 'duplicates': 0},
+    'api_book_reviews': {'queries': 5, 'duplicates': 0},
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'performance': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        # INFO logs a JSON line per request for `manage.py perf_report`;
+        # BOOKS_PERFORMANCE_LOG_LEVEL=WARNING keeps only over-budget views.
+        'books.performance': {
+            'handlers': ['performance'],
+            'level': os.environ.get('BOOKS_PERFORMANCE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -18,13 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from books import views as book_views
 from django.contrib.auth import views as auth_views
-from django.conf import settings
-from django.conf.urls.static import static
-from books import views
+from books import assets, views
+from books.urls import catalog
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', book_views.home, name='home'),
+    path('', catalog.home, name='home'),
     path('books/', include('books.urls')),
     path('signup/', book_views.signup, name='signup'),
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
@@ -32,5 +31,6 @@ urlpatterns = [
     path('upcoming/<int:pk>/', views.upcoming_book_detail, name='upcoming_book_detail'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Static and media files are served by the application itself; the
+# development server still serves static files straight from the apps.
+urlpatterns += assets.urlpatterns()
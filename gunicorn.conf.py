@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for serving bookvault in production.
+
+Runs the ASGI application on uvicorn workers, each an event loop that can
+hold many slow or keep-alive connections at once:
+
+    gunicorn -c gunicorn.conf.py bookvault.asgi:application
+
+Every value can be overridden through the environment, e.g.
+``WEB_CONCURRENCY=8 GUNICORN_KEEPALIVE=30``. Set ``BOOKS_ASYNC_VIEWS=1`` so
+the catalog pages use the async views (the Dockerfile does).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# One event loop per core; async workers do not need extra processes to
+# overlap I/O.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Seconds an idle keep-alive connection is held open for the next request.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Seconds before a silent worker is killed and restarted, and how long
+# workers get to finish in-flight requests on shutdown.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers periodically so slow leaks cannot accumulate.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'